@@ -1,25 +1,87 @@
+import concurrent.futures
+import sys
 from .game import Game
+from .probability import (
+    WinProbability,
+    estimate_win_probability,
+)
 from .ui import (
     render_game,
 )
 
-game = Game.create()
-while True:
-    print(render_game(game))
-    print('0. Undo')
-    actions = game.get_possible_actions()
-    for i, action in enumerate(actions):
-        print(f'{i + 1}.', action.to_text())
-    try:
-        chosen_idx = int(input()) - 1
-        if chosen_idx == -1:
-            chosen_action = 'undo'
+def print_win_probability(probability: WinProbability):
+    low, high = probability.confidence_interval()
+    print(f'\rWin probability: {probability.estimate:.0%} ({low:.0%}-{high:.0%}, {probability.samples} samples)', end='', flush=True)
+
+def play():
+    game = Game.create()
+    executor = None
+    while True:
+        print(render_game(game))
+        print('0. Undo')
+        print('r. Redo')
+        print('p. Win probability')
+        print('h. Hint')
+        print(f'a. Auto-play safe moves ({"on" if game.auto_play else "off"})')
+        if game.can_auto_complete():
+            print('c. Auto-complete')
+        actions = game.get_possible_actions()
+        for i, action in enumerate(actions):
+            print(f'{i + 1}.', action.to_text())
+        try:
+            choice = input()
+            if choice == 'p':
+                chosen_action = 'probability'
+            elif choice == 'h':
+                chosen_action = 'hint'
+            elif choice == 'a':
+                chosen_action = 'auto-play'
+            elif choice == 'c':
+                chosen_action = 'auto-complete'
+            elif choice == 'r':
+                chosen_action = 'redo'
+            else:
+                chosen_idx = int(choice) - 1
+                if chosen_idx == -1:
+                    chosen_action = 'undo'
+                else:
+                    chosen_action = actions[chosen_idx]
+        except Exception as e:
+            print(e)
+            continue
+        if chosen_action == 'undo':
+            game.undo()
+        elif chosen_action == 'redo':
+            if game.redo() is None:
+                print('Nothing to redo')
+        elif chosen_action == 'probability':
+            if executor is None:
+                executor = concurrent.futures.ProcessPoolExecutor()
+            estimate_win_probability(game, deadline=2.0, executor=executor, on_update=print_win_probability)
+            print()
+        elif chosen_action == 'hint':
+            hint = game.hint()
+            if hint.action is None:
+                print('No moves')
+            else:
+                index = actions.index(hint.action)
+                print(f'Hint: {index + 1}. {hint.action.to_text()} (score {hint.score})')
+                print('Line:', ', '.join(action.to_text() for action in hint.pv))
+        elif chosen_action == 'auto-play':
+            game.auto_play = not game.auto_play
+            if game.auto_play:
+                game.play_safe_moves()
+        elif chosen_action == 'auto-complete':
+            if game.auto_complete() is None:
+                print('Cannot auto-complete')
         else:
-            chosen_action = actions[chosen_idx]
-    except Exception as e:
-        print(e)
-        continue
-    if chosen_action == 'undo':
-        game.undo()
-    else:
-        game.run_action(chosen_action)
+            game.run_action(chosen_action)
+
+if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+    from .server import main
+    main(sys.argv[2:])
+elif len(sys.argv) > 1 and sys.argv[1] == 'watch':
+    from .ui import main
+    main(sys.argv[2:])
+else:
+    play()
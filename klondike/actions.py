@@ -1,14 +1,82 @@
 from typing import (
     Dict,
     Any,
+    Iterable,
+    List,
+    Tuple,
 )
 from .cards import (
     Suit,
 )
 
+SUITS = list(Suit)
+
+# integer codes of the primitive actions, see Action.code
+MAX_DRAW_COUNT = 3
+PILE_COUNT = 7
+SUIT_COUNT = 4
+# longest run of cards that can be moved from pile to pile, king to ace
+MAX_RUN_LENGTH = 13
+DRAW_CODES = 0
+WASTE_TO_PILE_CODES = DRAW_CODES + MAX_DRAW_COUNT
+WASTE_TO_FOUNDATION_CODES = WASTE_TO_PILE_CODES + PILE_COUNT
+PILE_TO_FOUNDATION_CODES = WASTE_TO_FOUNDATION_CODES + SUIT_COUNT
+FOUNDATION_TO_PILE_CODES = PILE_TO_FOUNDATION_CODES + PILE_COUNT * SUIT_COUNT
+PILE_TO_PILE_CODES = FOUNDATION_TO_PILE_CODES + SUIT_COUNT * PILE_COUNT
+ACTION_CODE_COUNT = PILE_TO_PILE_CODES + PILE_COUNT * (PILE_COUNT - 1) * MAX_RUN_LENGTH
+
 class Action:
+    """
+    Actions are immutable. The primitive actions are numbered by `code`,
+    and action_from_code() returns a shared instance for each code, which
+    is what Game generates.
+    """
+    __slots__ = ('_params', '_code')
+    # required parameters and their types, checked when constructed
+    _required: Dict[str, type] = {}
+
     def __init__(self, **params: Any):
+        for name, kind in self._required.items():
+            if not isinstance(params.get(name), kind):
+                raise ValueError(f'Invalid {name} for {self.__class__.__name__}: {params.get(name)!r}')
         self._params = params
+        self._code = None
+
+    @property
+    def code(self) -> int:
+        """
+        Integer in range(ACTION_CODE_COUNT), different for each primitive
+        action. Raises ValueError for macro actions and for actions outside
+        of a game of 7 piles.
+        """
+        code = self._code
+        if code is None:
+            code = self._code = self._encode()
+        return code
+
+    def _encode(self) -> int:
+        raise ValueError(f'Cannot encode {self}')
+
+    def _key(self):
+        try:
+            return self.code
+        except ValueError:
+            return tuple(sorted(self._params.items()))
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Action):
+            return NotImplemented
+        return self is other or (type(self) is type(other) and self._key() == other._key())
+
+    def __hash__(self) -> int:
+        return hash((type(self), self._key()))
+
+    def __reduce__(self):
+        # copies and actions sent to other processes stay shared instances
+        try:
+            return (action_from_code, (self.code,))
+        except ValueError:
+            return (_restore, (self.__class__, self._params))
 
     def to_text(self) -> str:
         raise NotImplementedError('Override')
@@ -16,88 +84,290 @@ class Action:
     def __repr__(self):
         return f'{self.__class__.__name__}({self._params})'
 
+def _restore(cls, params: Dict[str, Any]) -> Action:
+    return cls(**params)
+
+def _check_range(action: Action, value: int, stop: int) -> int:
+    if not 0 <= value < stop:
+        raise ValueError(f'Cannot encode {action}')
+    return value
+
 # target: waste
 
 class DrawFromDeckAction(Action):
+    __slots__ = ()
+
     @property
     def count(self) -> int:
         return self._params.get('count', 1)
 
+    def _encode(self) -> int:
+        return DRAW_CODES + _check_range(self, self.count - 1, MAX_DRAW_COUNT)
+
     def to_text(self) -> str:
         return f'Draw {self.count} from deck'
 
 # target: pile
 
 class MoveFromWasteToPileAction(Action):
+    __slots__ = ()
+    _required = {'target_pile_index': int}
+
     @property
     def target_pile_index(self) -> int:
-        pile_index = self._params.get('target_pile_index')
-        assert isinstance(pile_index, int)
-        return pile_index
+        return self._params['target_pile_index']
+
+    def _encode(self) -> int:
+        return WASTE_TO_PILE_CODES + _check_range(self, self.target_pile_index, PILE_COUNT)
 
     def to_text(self) -> str:
         return f'Move from waste to pile {self.target_pile_index + 1}'
 
 class MoveFromFoundationToPileAction(Action):
+    __slots__ = ()
+    _required = {'target_pile_index': int, 'source_foundation_suit': Suit}
+
     @property
     def target_pile_index(self) -> int:
-        pile_index = self._params.get('target_pile_index')
-        assert isinstance(pile_index, int)
-        return pile_index
+        return self._params['target_pile_index']
 
     @property
     def source_foundation_suit(self) -> Suit:
-        suit = self._params.get('source_foundation_suit')
-        assert isinstance(suit, Suit)
-        return suit
+        return self._params['source_foundation_suit']
+
+    def _encode(self) -> int:
+        target = _check_range(self, self.target_pile_index, PILE_COUNT)
+        return FOUNDATION_TO_PILE_CODES + (self.source_foundation_suit.value - 1) * PILE_COUNT + target
 
     def to_text(self) -> str:
         return f'Move from foundation {self.source_foundation_suit.name} to pile {self.target_pile_index + 1}'
 
 class MoveFromPileToPileAction(Action):
+    __slots__ = ()
+    _required = {'source_pile_index': int, 'target_pile_index': int}
+
     @property
     def source_pile_index(self) -> int:
-        pile_index = self._params.get('source_pile_index')
-        assert isinstance(pile_index, int)
-        return pile_index
+        return self._params['source_pile_index']
 
     @property
     def target_pile_index(self) -> int:
-        pile_index = self._params.get('target_pile_index')
-        assert isinstance(pile_index, int)
-        return pile_index
+        return self._params['target_pile_index']
 
     @property
     def count(self) -> int:
         return self._params.get('count', 1)
 
+    def _encode(self) -> int:
+        source = _check_range(self, self.source_pile_index, PILE_COUNT)
+        target = _check_range(self, self.target_pile_index, PILE_COUNT)
+        if source == target:
+            raise ValueError(f'Cannot encode {self}')
+        # index of the target among the other piles
+        pair = source * (PILE_COUNT - 1) + (target if target < source else target - 1)
+        return PILE_TO_PILE_CODES + pair * MAX_RUN_LENGTH + _check_range(self, self.count - 1, MAX_RUN_LENGTH)
+
     def to_text(self) -> str:
         return f'Move {self.count} from pile {self.source_pile_index + 1} to pile {self.target_pile_index + 1}'
 
 # target: foundation
 
 class MoveFromWasteToFoundationAction(Action):
+    __slots__ = ()
+    _required = {'target_foundation_suit': Suit}
+
     @property
     def target_foundation_suit(self) -> Suit:
-        suit = self._params.get('target_foundation_suit')
-        assert isinstance(suit, Suit)
-        return suit
+        return self._params['target_foundation_suit']
+
+    def _encode(self) -> int:
+        return WASTE_TO_FOUNDATION_CODES + self.target_foundation_suit.value - 1
 
     def to_text(self) -> str:
         return f'Move from waste to foundation {self.target_foundation_suit.name}'
 
 class MoveFromPileToFoundationAction(Action):
+    __slots__ = ()
+    _required = {'source_pile_index': int, 'target_foundation_suit': Suit}
+
     @property
     def source_pile_index(self) -> int:
-        pile_index = self._params.get('source_pile_index')
-        assert isinstance(pile_index, int)
-        return pile_index
+        return self._params['source_pile_index']
 
     @property
     def target_foundation_suit(self) -> Suit:
-        suit = self._params.get('target_foundation_suit')
-        assert isinstance(suit, Suit)
-        return suit
+        return self._params['target_foundation_suit']
+
+    def _encode(self) -> int:
+        source = _check_range(self, self.source_pile_index, PILE_COUNT)
+        return PILE_TO_FOUNDATION_CODES + source * SUIT_COUNT + self.target_foundation_suit.value - 1
 
     def to_text(self) -> str:
         return f'Move from pile {self.source_pile_index + 1} to foundation {self.target_foundation_suit.name}'
+
+# macro actions made of several primitive actions
+
+class MacroAction(Action):
+    __slots__ = ()
+
+    def expand(self) -> List[Action]:
+        """
+        The primitive actions that this action is made of, in order.
+        """
+        raise NotImplementedError('Override')
+
+def expand_actions(actions: Iterable[Action]) -> List[Action]:
+    """
+    Replace the macro actions in `actions` with their primitive actions.
+    """
+    expanded: List[Action] = []
+    for action in actions:
+        if isinstance(action, MacroAction):
+            expanded += action.expand()
+        else:
+            expanded.append(action)
+    return expanded
+
+def _draw_actions(draws: int, draw_count: int) -> List[Action]:
+    return [draw_action(draw_count)] * draws
+
+class MoveFromStockToPileAction(MacroAction):
+    __slots__ = ()
+    _required = {'draws': int, 'target_pile_index': int}
+
+    @property
+    def draws(self) -> int:
+        return self._params['draws']
+
+    @property
+    def draw_count(self) -> int:
+        return self._params.get('draw_count', 1)
+
+    @property
+    def target_pile_index(self) -> int:
+        return self._params['target_pile_index']
+
+    def expand(self) -> List[Action]:
+        return _draw_actions(self.draws, self.draw_count) + [WASTE_TO_PILE_ACTIONS[self.target_pile_index]]
+
+    def to_text(self) -> str:
+        return f'Draw {self.draws} times and move from waste to pile {self.target_pile_index + 1}'
+
+class MoveFromStockToFoundationAction(MacroAction):
+    __slots__ = ()
+    _required = {'draws': int, 'target_foundation_suit': Suit}
+
+    @property
+    def draws(self) -> int:
+        return self._params['draws']
+
+    @property
+    def draw_count(self) -> int:
+        return self._params.get('draw_count', 1)
+
+    @property
+    def target_foundation_suit(self) -> Suit:
+        return self._params['target_foundation_suit']
+
+    def expand(self) -> List[Action]:
+        return _draw_actions(self.draws, self.draw_count) + [WASTE_TO_FOUNDATION_ACTIONS[self.target_foundation_suit.value - 1]]
+
+    def to_text(self) -> str:
+        return f'Draw {self.draws} times and move from waste to foundation {self.target_foundation_suit.name}'
+
+class CompoundAction(MacroAction):
+    """
+    Primitive actions run and undone as one step.
+    """
+    __slots__ = ()
+    _required = {'actions': tuple}
+
+    @property
+    def actions(self) -> Tuple[Action, ...]:
+        return self._params['actions']
+
+    def expand(self) -> List[Action]:
+        return list(self.actions)
+
+class AutoPlayAction(CompoundAction):
+    """
+    Safe moves to foundations, after the action of the player in auto-play
+    mode, see Game.safe_foundation_moves().
+    """
+    __slots__ = ()
+
+    def to_text(self) -> str:
+        return 'Auto-play: ' + ', '.join(action.to_text() for action in self.actions)
+
+class AutoCompleteAction(CompoundAction):
+    """
+    The rest of a game that can't be lost, see Game.auto_complete().
+    """
+    __slots__ = ()
+
+    def to_text(self) -> str:
+        return f'Auto-complete in {len(self.actions)} moves'
+
+# the shared instances of the primitive actions
+
+def _create_action(code: int) -> Action:
+    if code < WASTE_TO_PILE_CODES:
+        count = code - DRAW_CODES + 1
+        return DrawFromDeckAction() if count == 1 else DrawFromDeckAction(count=count)
+    if code < WASTE_TO_FOUNDATION_CODES:
+        return MoveFromWasteToPileAction(target_pile_index=code - WASTE_TO_PILE_CODES)
+    if code < PILE_TO_FOUNDATION_CODES:
+        return MoveFromWasteToFoundationAction(target_foundation_suit=SUITS[code - WASTE_TO_FOUNDATION_CODES])
+    if code < FOUNDATION_TO_PILE_CODES:
+        source, suit = divmod(code - PILE_TO_FOUNDATION_CODES, SUIT_COUNT)
+        return MoveFromPileToFoundationAction(source_pile_index=source, target_foundation_suit=SUITS[suit])
+    if code < PILE_TO_PILE_CODES:
+        suit, target = divmod(code - FOUNDATION_TO_PILE_CODES, PILE_COUNT)
+        return MoveFromFoundationToPileAction(target_pile_index=target, source_foundation_suit=SUITS[suit])
+    pair, count = divmod(code - PILE_TO_PILE_CODES, MAX_RUN_LENGTH)
+    source, target = divmod(pair, PILE_COUNT - 1)
+    if target >= source:
+        target += 1
+    return MoveFromPileToPileAction(source_pile_index=source, target_pile_index=target, count=count + 1)
+
+ACTIONS: Tuple[Action, ...] = tuple(_create_action(code) for code in range(ACTION_CODE_COUNT))
+# caches the codes and checks that decoding them gives them back
+assert all(action.code == code for code, action in enumerate(ACTIONS))
+
+# ACTIONS by their parameters, suits indexed by Suit.value - 1 and counts by count - 1
+DRAW_ACTIONS = ACTIONS[DRAW_CODES:WASTE_TO_PILE_CODES]
+WASTE_TO_PILE_ACTIONS = ACTIONS[WASTE_TO_PILE_CODES:WASTE_TO_FOUNDATION_CODES]
+WASTE_TO_FOUNDATION_ACTIONS = ACTIONS[WASTE_TO_FOUNDATION_CODES:PILE_TO_FOUNDATION_CODES]
+PILE_TO_FOUNDATION_ACTIONS = [
+    ACTIONS[PILE_TO_FOUNDATION_CODES + source * SUIT_COUNT:PILE_TO_FOUNDATION_CODES + (source + 1) * SUIT_COUNT]
+    for source in range(PILE_COUNT)
+]
+FOUNDATION_TO_PILE_ACTIONS = [
+    ACTIONS[FOUNDATION_TO_PILE_CODES + suit * PILE_COUNT:FOUNDATION_TO_PILE_CODES + (suit + 1) * PILE_COUNT]
+    for suit in range(SUIT_COUNT)
+]
+
+def _pile_to_pile_actions(source: int, target: int) -> Tuple[Action, ...]:
+    if source == target:
+        return ()
+    start = MoveFromPileToPileAction(source_pile_index=source, target_pile_index=target).code
+    return ACTIONS[start:start + MAX_RUN_LENGTH]
+
+# by source, target and count, empty when the source is the target
+PILE_TO_PILE_ACTIONS = [
+    [_pile_to_pile_actions(source, target) for target in range(PILE_COUNT)]
+    for source in range(PILE_COUNT)
+]
+
+def action_from_code(code: int) -> Action:
+    if not 0 <= code < ACTION_CODE_COUNT:
+        raise ValueError(f'Invalid action code {code}')
+    return ACTIONS[code]
+
+def draw_action(count: int = 1) -> Action:
+    """
+    The action of drawing `count` cards, shared if there is one.
+    """
+    if 1 <= count <= MAX_DRAW_COUNT:
+        return DRAW_ACTIONS[count - 1]
+    return DrawFromDeckAction(count=count)
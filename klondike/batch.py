@@ -0,0 +1,209 @@
+"""
+Solve ranges of seeds on multiple processes.
+
+    python -m klondike.batch --seeds 0-1000000 --workers 8 --output results.jsonl
+
+Results are appended to the output file as they complete, so an interrupted
+run continues where it left off when started again with the same output.
+"""
+from __future__ import annotations
+from typing import (
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+)
+import argparse
+import csv
+import functools
+import json
+import multiprocessing
+import os
+import sys
+from .game import Game
+from .record import (
+    ActionCodec,
+)
+from .solver import (
+    SolveStatus,
+    Solver,
+)
+from .ttable import (
+    TranspositionTable,
+)
+
+FIELDS = ['seed', 'status', 'length', 'nodes', 'elapsed', 'solution']
+# columns added later, left out when resuming an output without them
+OPTIONAL_FIELDS = ['solution']
+
+STATUS_TO_TEXT: Dict[SolveStatus, str] = {
+    SolveStatus.SOLVED: 'solvable',
+    SolveStatus.UNSOLVABLE: 'unsolvable',
+    SolveStatus.NODE_LIMIT: 'timeout',
+    SolveStatus.TIME_LIMIT: 'timeout',
+    SolveStatus.MEMORY_LIMIT: 'timeout',
+}
+
+def parse_seeds(text: str) -> Iterator[int]:
+    """
+    Parse a comma separated list of seeds and START-END ranges.
+    END is exclusive like in range().
+    """
+    for part in text.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            start, end = part.split('-', 1)
+            yield from range(int(start), int(end))
+        else:
+            yield int(part)
+
+def solve_seed(seed: int, solver: Solver) -> dict:
+    result = solver.solve(Game.create(seed))
+    return {
+        'seed': seed,
+        'status': STATUS_TO_TEXT[result.status],
+        'length': None if result.actions is None else len(result.actions),
+        'nodes': result.nodes,
+        'elapsed': round(result.elapsed, 4),
+        # hex of the record encoded actions, see klondike.record.ActionCodec
+        'solution': None if result.actions is None else ActionCodec.encode_all(result.actions).hex(),
+    }
+
+def _is_csv(path: str) -> bool:
+    return path.endswith('.csv')
+
+def read_results(path: str) -> Iterator[dict]:
+    """
+    Read the results of a previous run from a JSONL or CSV file.
+    """
+    with open(path, newline='') as f:
+        if _is_csv(path):
+            for row in csv.DictReader(f):
+                yield {
+                    'seed': int(row['seed']),
+                    'status': row['status'],
+                    'length': int(row['length']) if row['length'] else None,
+                    'nodes': int(row['nodes']),
+                    'elapsed': float(row['elapsed']),
+                    'solution': row.get('solution') or None,
+                }
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+def _csv_fields(path: str) -> List[str]:
+    """
+    The columns to write to a CSV output: those of its header when resuming,
+    which may lack the columns added since it was started.
+    """
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return FIELDS
+    with open(path, newline='') as f:
+        header = next(csv.reader(f), [])
+    missing = [field for field in FIELDS if field not in header and field not in OPTIONAL_FIELDS]
+    unknown = [field for field in header if field not in FIELDS]
+    if missing or unknown:
+        raise ValueError(f'Cannot resume {path}: its columns {",".join(header)} don\'t match {",".join(FIELDS)}')
+    return header
+
+# bytes read at a time from the end of an output to find its last line
+_TAIL_CHUNK = 4096
+
+def _cut_partial_line(path: str):
+    """
+    Cut off a partially written last line left by an interrupted run, which
+    may be the header of a CSV.
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb+') as f:
+        size = f.seek(0, os.SEEK_END)
+        end = size
+        while end > 0:
+            start = max(0, end - _TAIL_CHUNK)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b'\n')
+            if newline >= 0:
+                end = start + newline + 1
+                break
+            end = start
+        if end != size:
+            f.truncate(end)
+
+def _done_seeds(path: str) -> Set[int]:
+    """
+    The seeds that are already in the output file.
+    """
+    if not os.path.exists(path):
+        return set()
+    return {result['seed'] for result in read_results(path)}
+
+def run(
+    seeds: Iterable[int],
+    output: str,
+    workers: Optional[int] = None,
+    solver: Optional[Solver] = None,
+    progress: bool = False,
+) -> int:
+    """
+    Solve `seeds` on `workers` processes and append the results to `output`.
+    Seeds that are already in `output` are skipped.
+    Returns the number of seeds done by this run.
+    """
+    if solver is None:
+        solver = Solver()
+    _cut_partial_line(output)
+    fields = _csv_fields(output) if _is_csv(output) else FIELDS
+    done = _done_seeds(output)
+    pending = (seed for seed in seeds if seed not in done)
+    write_header = _is_csv(output) and (not os.path.exists(output) or os.path.getsize(output) == 0)
+    count = 0
+    with open(output, 'a', newline='') as f, multiprocessing.Pool(workers) as pool:
+        writer = None
+        if _is_csv(output):
+            writer = csv.DictWriter(f, fields, extrasaction='ignore')
+            if write_header:
+                writer.writeheader()
+        results = pool.imap_unordered(functools.partial(solve_seed, solver=solver), pending, chunksize=4)
+        for result in results:
+            if writer is not None:
+                writer.writerow(result)
+            else:
+                f.write(json.dumps(result) + '\n')
+            f.flush()
+            count += 1
+            if progress and count % 100 == 0:
+                print(f'{count} seeds done', file=sys.stderr)
+    return count
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(prog='python -m klondike.batch', description='Solve ranges of seeds')
+    parser.add_argument('--seeds', required=True, help='seeds and START-END ranges separated by commas, END is exclusive')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes, defaults to the CPU count')
+    parser.add_argument('--output', default='results.jsonl', help='JSONL or .csv file to append results to')
+    parser.add_argument('--max-nodes', type=int, default=100000, help='node budget per deal')
+    parser.add_argument('--time-limit', type=float, default=10.0, help='time budget per deal in seconds')
+    parser.add_argument('--max-states', type=int, default=None, help='transposition table size limit per deal')
+    parser.add_argument('--table', help='transposition table file shared by the workers, created if missing')
+    parser.add_argument('--table-size', type=int, default=1 << 24, help='entries of a new transposition table')
+    args = parser.parse_args(argv)
+    table = None
+    if args.table is not None:
+        if os.path.exists(args.table):
+            table = TranspositionTable.open(args.table)
+        else:
+            table = TranspositionTable.create(args.table, args.table_size)
+    solver = Solver(args.max_nodes, args.time_limit, args.max_states, table=table)
+    try:
+        count = run(parse_seeds(args.seeds), args.output, args.workers, solver, progress=True)
+    except ValueError as e:
+        parser.exit(1, f'{e}\n')
+    print(f'{count} seeds done', file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,444 @@
+"""
+Benchmarks of the engine with fixed seeds.
+
+    python -m klondike.bench [NAME ...] [--output results.json] [--compare baseline.json]
+
+Results are printed as JSON. The perft counts are exact numbers of action
+sequences, so they also catch changes in the rules: --compare fails when
+they differ from an earlier run.
+"""
+from __future__ import annotations
+from typing import (
+    Callable,
+    Dict,
+    List,
+    Optional,
+)
+import argparse
+import copy
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from . import instrument
+from .game import Game
+from .actions import (
+    ACTIONS,
+    Action,
+)
+from .record import (
+    Record,
+    iter_records,
+    write_records,
+)
+from .ui import (
+    TerminalRenderer,
+    render_game,
+)
+
+def time_per_call(fn: Callable[[], object], min_time: float = 0.2) -> float:
+    """
+    Average seconds per call of `fn`, calling it for at least `min_time`.
+    """
+    calls = 0
+    batch = 1
+    start_time = time.perf_counter()
+    while True:
+        for _ in range(batch):
+            fn()
+        calls += batch
+        elapsed = time.perf_counter() - start_time
+        if elapsed >= min_time:
+            return elapsed / calls
+        batch *= 2
+
+def random_game(seed: int, length: int) -> Game:
+    """
+    Play `length` random actions in the game of `seed`, or until there are
+    no actions left.
+    """
+    rng = random.Random(seed)
+    game = Game.create(seed)
+    for _ in range(length):
+        actions = game.get_possible_actions()
+        if not actions:
+            break
+        game.run_action(rng.choice(actions))
+    return game
+
+SEEDS = [0, 1, 2]
+
+def perft(game: Game, depth: int) -> int:
+    """
+    Number of action sequences of length `depth` from the current state.
+    """
+    if depth == 0:
+        return 1
+    count = 0
+    for action in game.get_possible_actions():
+        game.run_action(action)
+        count += perft(game, depth - 1)
+        game.undo()
+    return count
+
+def bench_perft(seeds: List[int] = SEEDS, max_depth: int = 8) -> Dict:
+    results = {}
+    for seed in seeds:
+        game = Game.create(seed)
+        counts = {}
+        nodes = 0
+        start_time = time.perf_counter()
+        for depth in range(1, max_depth + 1):
+            counts[str(depth)] = perft(game, depth)
+            nodes += counts[str(depth)]
+        counts['leaves_per_sec'] = nodes / (time.perf_counter() - start_time)
+        results[str(seed)] = counts
+    return results
+
+def bench_playouts(seeds: List[int] = SEEDS, count: int = 200, max_length: int = 500) -> Dict:
+    """
+    Random playouts from the start until there are no actions left, the
+    game is won or `max_length` actions were played.
+    """
+    rng = random.Random(0)
+    actions_played = 0
+    start_time = time.perf_counter()
+    for i in range(count):
+        game = Game.create(seeds[i % len(seeds)])
+        for _ in range(max_length):
+            actions = game.get_possible_actions()
+            if not actions or game.is_won():
+                break
+            game.run_action(rng.choice(actions))
+            actions_played += 1
+    elapsed = time.perf_counter() - start_time
+    return {
+        'playouts_per_sec': count / elapsed,
+        'actions_per_sec': actions_played / elapsed,
+    }
+
+def bench_allocations(seeds: List[int] = SEEDS, count: int = 50, max_length: int = 500) -> Dict:
+    """
+    Objects allocated per random playout. The generated actions are kept
+    alive until the end of each playout, so that every Action allocated
+    instead of shared and every memory block still allocated is counted.
+    """
+    rng = random.Random(0)
+    shared = {id(action) for action in ACTIONS}
+    candidates = 0
+    allocated_actions = 0
+    blocks = 0
+    for i in range(count):
+        game = Game.create(seeds[i % len(seeds)])
+        generated = []
+        blocks_before = sys.getallocatedblocks()
+        for _ in range(max_length):
+            actions = game.get_possible_actions()
+            if not actions or game.is_won():
+                break
+            generated.append(actions)
+            game.run_action(rng.choice(actions))
+        blocks += sys.getallocatedblocks() - blocks_before
+        candidates += sum(len(actions) for actions in generated)
+        allocated_actions += len({id(action) for actions in generated for action in actions} - shared)
+    return {
+        'candidates_per_playout': candidates / count,
+        'allocated_actions_per_playout': allocated_actions / count,
+        'blocks_per_playout': blocks / count,
+    }
+
+def _positions(seeds: List[int], lengths: List[int]) -> List[Game]:
+    return [random_game(seed, length) for seed in seeds for length in lengths]
+
+def bench_actions(seeds: List[int] = SEEDS) -> Dict:
+    positions = _positions(seeds, [0, 20, 50, 100, 200])
+    def run():
+        for game in positions:
+            game.get_possible_actions()
+    candidates = sum(len(game.get_possible_actions()) for game in positions)
+    return {
+        'calls_per_sec': len(positions) / time_per_call(run),
+        'average_actions': candidates / len(positions),
+    }
+
+def bench_hash(seeds: List[int] = SEEDS) -> Dict:
+    positions = _positions(seeds, [0, 20, 50, 100, 200])
+    def run_sha256():
+        for game in positions:
+            game.sha256_hash()
+    return {
+        'sha256_per_sec': len(positions) / time_per_call(run_sha256),
+    }
+
+def bench_undo(seed: int = 0, history_lengths: List[int] = [10, 100, 200, 500], repeat: int = 2000) -> List[Dict]:
+    """
+    Latency of undoing the last action at different history lengths.
+    """
+    results = []
+    for length in history_lengths:
+        game = random_game(seed, length)
+        action = game.history.actions[-1]
+        elapsed = 0.0
+        for _ in range(repeat):
+            start_time = time.perf_counter()
+            game.undo()
+            elapsed += time.perf_counter() - start_time
+            game.run_action(action)
+        results.append({
+            'history_length': game.history.length,
+            'undo_us': elapsed / repeat * 1e6,
+        })
+    return results
+
+def bench_fork(seed: int = 0, history_lengths: List[int] = [0, 50, 100, 200, 500]) -> List[Dict]:
+    """
+    Cost of Game.fork() compared to copy.deepcopy() and replaying the game
+    from its seed at different history lengths.
+    """
+    def fork_and_move(game: Game, action: Action):
+        # includes copying the containers that the first action changes
+        game.fork().run_action(action)
+
+    results = []
+    for length in history_lengths:
+        game = random_game(seed, length)
+        action = game.get_possible_actions()[0]
+        results.append({
+            'history_length': game.history.length,
+            'fork_us': time_per_call(game.fork) * 1e6,
+            'fork_and_move_us': time_per_call(lambda: fork_and_move(game, action)) * 1e6,
+            'deepcopy_us': time_per_call(lambda: copy.deepcopy(game)) * 1e6,
+            'replay_us': time_per_call(lambda: Game.replay(game.seed, game.history.actions)) * 1e6,
+        })
+    return results
+
+def bench_seek(seed: int = 0, length: int = 500, repeat: int = 200) -> Dict:
+    """
+    Latency of seeking to random moves of a long game with checkpoints,
+    compared to undoing and redoing every action in between and to
+    replaying the game from its seed.
+    """
+    game = Game.create(seed)
+    undo_only = Game.create(seed, checkpoint_interval=length + 1)
+    rng = random.Random(seed)
+    for _ in range(length):
+        actions = game.get_possible_actions()
+        if not actions:
+            break
+        action = rng.choice(actions)
+        game.run_action(action)
+        undo_only.run_action(action)
+    actions = game.history.actions.copy()
+    targets = [rng.randrange(len(actions) + 1) for _ in range(repeat)]
+
+    def seek_time(game: Game) -> float:
+        start_time = time.perf_counter()
+        for target in targets:
+            game.seek(target)
+        return (time.perf_counter() - start_time) / repeat
+
+    def replay_time() -> float:
+        start_time = time.perf_counter()
+        for target in targets:
+            Game.replay(seed, actions[:target])
+        return (time.perf_counter() - start_time) / repeat
+
+    return {
+        'history_length': len(actions),
+        'checkpoint_interval': game.history.checkpoint_interval,
+        'seek_us': seek_time(game) * 1e6,
+        'undo_redo_us': seek_time(undo_only) * 1e6,
+        'replay_us': replay_time() * 1e6,
+    }
+
+def bench_render(seeds: List[int] = SEEDS, length: int = 300) -> Dict:
+    """
+    Frames per second and bytes per frame of rendering a game after each
+    action with ui.render_game() and with ui.TerminalRenderer.
+    """
+    games = [random_game(seed, length) for seed in seeds]
+    full_time = diff_time = 0.0
+    full_bytes = diff_bytes = 0
+    frames = 0
+    for played in games:
+        game = Game.create(played.seed)
+        renderer = TerminalRenderer()
+        renderer.render(game)
+        for action in played.history.actions:
+            game.run_action(action)
+            start_time = time.perf_counter()
+            full = render_game(game)
+            full_time += time.perf_counter() - start_time
+            start_time = time.perf_counter()
+            diff = renderer.render(game)
+            diff_time += time.perf_counter() - start_time
+            full_bytes += len(full.encode())
+            diff_bytes += len(diff.encode())
+            frames += 1
+    return {
+        'render_game_frames_per_sec': frames / full_time,
+        'diff_frames_per_sec': frames / diff_time,
+        'render_game_bytes_per_frame': full_bytes / frames,
+        'diff_bytes_per_frame': diff_bytes / frames,
+    }
+
+def bench_records(count: int = 2000, length: int = 200) -> Dict:
+    """
+    Records per second written, scanned without decoding, decoded to
+    actions and replayed to games.
+    """
+    records = [Record.from_game(random_game(seed, length)) for seed in range(count)]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'bench.kdr')
+
+        start_time = time.perf_counter()
+        write_records(path, records)
+        write_time = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        for _ in iter_records(path):
+            pass
+        scan_time = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        for record in iter_records(path):
+            for _ in record.actions():
+                pass
+        decode_time = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        for record in iter_records(path):
+            record.replay()
+        replay_time = time.perf_counter() - start_time
+
+        size = os.path.getsize(path)
+    return {
+        'records': count,
+        'bytes_per_record': size / count,
+        'write_per_sec': count / write_time,
+        'scan_per_sec': count / scan_time,
+        'decode_per_sec': count / decode_time,
+        'replay_per_sec': count / replay_time,
+    }
+
+def bench_instrument(seeds: List[int] = SEEDS) -> Dict:
+    """
+    Random playout throughput before, while and after enabling klondike.instrument.
+    """
+    def actions_per_sec() -> float:
+        return bench_playouts(seeds, count=50)['actions_per_sec']
+
+    before = actions_per_sec()
+    with instrument.instrumented():
+        enabled = actions_per_sec()
+    after = actions_per_sec()
+    return {
+        'before_actions_per_sec': before,
+        'enabled_actions_per_sec': enabled,
+        'disabled_actions_per_sec': after,
+    }
+
+def bench_lockstep(games: int = 2000, max_length: int = 200) -> Dict:
+    """
+    Random playouts of klondike.lockstep compared to bench_playouts().
+    Skipped without numpy.
+    """
+    try:
+        import numpy as np
+        from .lockstep import LockstepGames
+    except ImportError:
+        return {'skipped': 'numpy is not installed'}
+    lockstep = LockstepGames.create([SEEDS[i % len(SEEDS)] for i in range(games)])
+    start_time = time.perf_counter()
+    _, lengths = lockstep.playouts(max_length, np.random.default_rng(0))
+    elapsed = time.perf_counter() - start_time
+    actions_per_sec = int(lengths.sum()) / elapsed
+    scalar = bench_playouts(count=50, max_length=max_length)
+    return {
+        'actions_per_sec': actions_per_sec,
+        'scalar_actions_per_sec': scalar['actions_per_sec'],
+        'speedup': actions_per_sec / scalar['actions_per_sec'],
+    }
+
+def bench_features(seeds: List[int] = SEEDS, batch_size: int = 1024) -> Dict:
+    """
+    Positions per second encoded by klondike.features, from games and
+    from recorded games. Skipped without numpy.
+    """
+    try:
+        from .features import (
+            FeatureEncoder,
+            encode_records,
+        )
+    except ImportError:
+        return {'skipped': 'numpy is not installed'}
+    positions = _positions(seeds, [0, 20, 50, 100, 200])
+    games = [positions[i % len(positions)] for i in range(batch_size)]
+    encoder = FeatureEncoder(batch_size)
+    records = [Record.from_game(random_game(seed, 200)) for seed in range(50)]
+    start_time = time.perf_counter()
+    encoded = sum(len(batch['seeds']) for batch in encode_records(records, batch_size))
+    records_time = time.perf_counter() - start_time
+    return {
+        'games_per_sec': batch_size / time_per_call(lambda: encoder.encode(games)),
+        'record_positions_per_sec': encoded / records_time,
+    }
+
+BENCHMARKS: Dict[str, Callable[[], object]] = {
+    'perft': bench_perft,
+    'playouts': bench_playouts,
+    'allocations': bench_allocations,
+    'actions': bench_actions,
+    'hash': bench_hash,
+    'undo': bench_undo,
+    'fork': bench_fork,
+    'seek': bench_seek,
+    'render': bench_render,
+    'records': bench_records,
+    'instrument': bench_instrument,
+    'lockstep': bench_lockstep,
+    'features': bench_features,
+}
+
+def compare_perft(results: Dict, baseline: Dict) -> List[str]:
+    """
+    Differences between the perft counts of two runs.
+    """
+    differences = []
+    for seed, counts in baseline.get('perft', {}).items():
+        for depth, count in counts.items():
+            if depth == 'leaves_per_sec':
+                continue
+            new_count = results.get('perft', {}).get(seed, {}).get(depth)
+            if new_count is not None and new_count != count:
+                differences.append(f'perft seed {seed} depth {depth}: {new_count} != {count}')
+    return differences
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(prog='python -m klondike.bench', description='Benchmark the engine')
+    parser.add_argument('names', nargs='*', help=f'benchmarks to run, all by default: {", ".join(BENCHMARKS)}')
+    parser.add_argument('--output', help='also write the results to this file')
+    parser.add_argument('--compare', help='results of an earlier run to check the perft counts against')
+    args = parser.parse_args(argv)
+    names = args.names or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            parser.error(f'unknown benchmark: {name}')
+    results = {name: BENCHMARKS[name]() for name in names}
+    text = json.dumps(results, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    if args.compare:
+        with open(args.compare) as f:
+            differences = compare_perft(results, json.load(f))
+        for difference in differences:
+            print(difference, file=sys.stderr)
+        if differences:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+"""
+Keys of game states that are the same for positions equivalent in play.
+
+    python -m klondike.canonical [--seeds 0-20] [--max-nodes 5000]
+
+Positions are equivalent when they differ only by
+- swapping the two red suits or the two black suits everywhere,
+- the order of the piles, since no rule depends on a pile's index,
+- the order of Game.foundations.
+
+canonical_key() serializes the state with the piles sorted and the
+foundations by suit, under each of the four suit swaps, and returns the
+smallest. Solver(symmetry=True) uses canonical_hash() to detect visited
+states, so only one position of each class is searched.
+"""
+from __future__ import annotations
+from typing import (
+    Dict,
+    List,
+    Optional,
+)
+import argparse
+import hashlib
+import json
+import random
+from .cards import (
+    Deck,
+    Waste,
+    Pile,
+    Foundation,
+    Suit,
+)
+from .game import Game
+
+def _suit_table(suit_order: List[int]) -> bytes:
+    """
+    Translation table of card codes for a permutation of suit indexes.
+    """
+    return bytes(suit_order[code // 13] * 13 + code % 13 for code in range(52)) + bytes(range(52, 256))
+
+# suit indexes are SPADES, HEARTS, DIAMONDS, CLUBS
+SUIT_ORDERS = [
+    [0, 1, 2, 3],
+    [0, 2, 1, 3],
+    [3, 1, 2, 0],
+    [3, 2, 1, 0],
+]
+SUIT_TABLES = [_suit_table(order) for order in SUIT_ORDERS]
+
+def _key(game: Game, suit_order: List[int], table: bytes) -> bytes:
+    heights = [0] * 4
+    for foundation in game.foundations:
+        heights[suit_order[foundation.suit.value - 1]] = foundation.height
+    piles = sorted(
+        bytes((len(pile.codes), pile.revealed_count)) + pile.codes.translate(table)
+        for pile in game.piles
+    )
+    deck_codes = game.deck.codes
+    waste_codes = game.waste.codes
+    return b''.join([
+        bytes(heights),
+        bytes((len(deck_codes),)), deck_codes.translate(table),
+        bytes((len(waste_codes),)), waste_codes.translate(table),
+        *piles,
+    ])
+
+def canonical_key(game: Game) -> bytes:
+    """
+    Serialized state that is equal for equivalent positions and different
+    for positions that aren't.
+    """
+    return min(_key(game, order, table) for order, table in zip(SUIT_ORDERS, SUIT_TABLES))
+
+def canonical_hash(game: Game) -> int:
+    """
+    64-bit hash of canonical_key(), for transposition tables.
+    """
+    return int.from_bytes(hashlib.blake2b(canonical_key(game), digest_size=8).digest(), 'little')
+
+def transform(game: Game, suit_order: List[int], pile_order: List[int], foundation_order: List[int]) -> Game:
+    """
+    An equivalent position: suits swapped by `suit_order`, piles and
+    foundations reordered.
+    """
+    table = _suit_table(suit_order)
+    piles = [game.piles[i] for i in pile_order]
+    foundations = [game.foundations[i] for i in foundation_order]
+    suits = list(Suit)
+    return Game(
+        Deck.from_codes(game.deck.codes.translate(table), game.seed),
+        Waste.from_codes(game.waste.codes.translate(table)),
+        [Pile.from_codes(pile.codes.translate(table), pile.revealed_count) for pile in piles],
+        [Foundation.from_height(suits[suit_order[f.suit.value - 1]], f.height) for f in foundations],
+        game.draw_count,
+    )
+
+def _equivalent(a: Game, b: Game) -> bool:
+    # independent of canonical_key(): compare the piles as multisets
+    def state(game: Game, table: bytes, suit_order: List[int]):
+        heights = {suit_order[f.suit.value - 1]: f.height for f in game.foundations}
+        piles = sorted((bytes(p.codes.translate(table)), p.revealed_count) for p in game.piles)
+        return (heights, bytes(game.deck.codes.translate(table)), bytes(game.waste.codes.translate(table)), piles)
+    target = state(b, SUIT_TABLES[0], SUIT_ORDERS[0])
+    return any(state(a, table, order) == target for order, table in zip(SUIT_ORDERS, SUIT_TABLES))
+
+def check(games: List[Game], seed: int = 0) -> int:
+    """
+    Raise AssertionError unless random equivalent copies of `games` have
+    the same key, and games with the same key are equivalent.
+    Returns the number of distinct keys.
+    """
+    rng = random.Random(seed)
+    keys: Dict[bytes, Game] = {}
+    for game in games:
+        key = canonical_key(game)
+        pile_order = list(range(len(game.piles)))
+        foundation_order = list(range(len(game.foundations)))
+        for suit_order in SUIT_ORDERS:
+            rng.shuffle(pile_order)
+            rng.shuffle(foundation_order)
+            copy = transform(game, suit_order, pile_order, foundation_order)
+            assert canonical_key(copy) == key, 'equivalent positions have different keys'
+        if key in keys:
+            assert _equivalent(keys[key], game), 'positions that are not equivalent have the same key'
+        keys[key] = game
+    return len(keys)
+
+def _random_positions(seeds: List[int], length: int) -> List[Game]:
+    positions = []
+    for seed in seeds:
+        rng = random.Random(seed)
+        game = Game.create(seed)
+        for _ in range(length):
+            actions = game.get_possible_actions()
+            if not actions:
+                break
+            game.run_action(rng.choice(actions))
+            positions.append(game.fork())
+    return positions
+
+def main(argv: Optional[List[str]] = None):
+    from .batch import parse_seeds
+    from .solver import (
+        SolveStatus,
+        Solver,
+    )
+    parser = argparse.ArgumentParser(prog='python -m klondike.canonical', description='Check and measure symmetry reduction')
+    parser.add_argument('--seeds', default='0-20', help='seeds and START-END ranges separated by commas')
+    parser.add_argument('--max-nodes', type=int, default=5000, help='node budget per deal')
+    args = parser.parse_args(argv)
+    seeds = list(parse_seeds(args.seeds))
+    positions = _random_positions(seeds, 200)
+    results = {
+        'checked_positions': len(positions),
+        'distinct_keys': check(positions),
+        'distinct_states': len({game.zobrist_hash() for game in positions}),
+    }
+    # deals and mid-game positions, many of which can be searched to the end
+    games = [Game.create(seed) for seed in seeds] + positions[60::200]
+    outcomes = {}
+    for name, solver in [('plain', Solver(args.max_nodes)), ('symmetry', Solver(args.max_nodes, symmetry=True))]:
+        outcomes[name] = [solver.solve(game.fork()) for game in games]
+    decided = [
+        i for i in range(len(games))
+        if all(outcomes[name][i].status in (SolveStatus.SOLVED, SolveStatus.UNSOLVABLE) for name in outcomes)
+    ]
+    for name, name_outcomes in outcomes.items():
+        elapsed = sum(result.elapsed for result in name_outcomes)
+        results[name] = {
+            'solved': sum(result.solved for result in name_outcomes),
+            'unsolvable': sum(result.status is SolveStatus.UNSOLVABLE for result in name_outcomes),
+            'nodes': sum(result.nodes for result in name_outcomes),
+            'nodes_decided_by_both': sum(name_outcomes[i].nodes for i in decided),
+            'nodes_per_sec': sum(result.nodes for result in name_outcomes) / elapsed,
+        }
+    print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,9 @@
 from __future__ import annotations
 from typing import (
+    Iterable,
     List,
     Optional,
+    Tuple,
 )
 import enum
 import random
@@ -52,45 +54,142 @@ class Rank(enum.Enum):
         return hashlib.sha256((self.__class__.__name__ + '.' + self.name).encode('utf-8')).digest()
 
 class Card:
+    """
+    A playing card. The 52 cards are interned in CARDS and identified by
+    their code, so containers only need to store the codes.
+    """
+    __slots__ = ('_code',)
+
     def __init__(self, suit: Suit, rank: Rank):
-        self._suit = suit
-        self._rank = rank
+        self._code = (suit.value - 1) * 13 + rank.value - 1
+
+    @classmethod
+    def from_code(cls, code: int) -> Card:
+        return CARDS[code]
 
     @property
     def suit(self) -> Suit:
-        return self._suit
+        return CARD_SUITS[self._code]
 
     @property
     def rank(self) -> Rank:
-        return self._rank
+        return CARD_RANKS[self._code]
+
+    @property
+    def code(self) -> int:
+        """
+        Index of the card in 0..51, ordered by suit and rank.
+        """
+        return self._code
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Card) and other._code == self._code
+
+    def __hash__(self) -> int:
+        return self._code
 
     def sha256_hash(self) -> bytes:
-        return hashlib.sha256(
-            hashlib.sha256(b'Card').digest()
-            + self._suit.sha256_hash()
-            + self._rank.sha256_hash()
-        ).digest()
+        return CARD_SHA256[self._code]
+
+# lookup tables indexed by card code
+CARD_SUITS: Tuple[Suit, ...] = tuple(suit for suit in Suit for _ in Rank)
+CARD_RANKS: Tuple[Rank, ...] = tuple(rank for _ in Suit for rank in Rank)
+RANK_VALUES = bytes(rank.value for rank in CARD_RANKS)
+COLOR_VALUES = bytes(suit.color.value for suit in CARD_SUITS)
+CARD_SHA256: Tuple[bytes, ...] = tuple(
+    hashlib.sha256(
+        hashlib.sha256(b'Card').digest()
+        + suit.sha256_hash()
+        + rank.sha256_hash()
+    ).digest()
+    for suit, rank in zip(CARD_SUITS, CARD_RANKS)
+)
+CARDS: Tuple[Card, ...] = tuple(Card(suit, rank) for suit, rank in zip(CARD_SUITS, CARD_RANKS))
+
+KING = Rank.KING.value
+ACE = Rank.ACE.value
+
+def _parents(code: int) -> Tuple[int, ...]:
+    """
+    Codes of the cards that `code` can be stacked on in a pile.
+    """
+    if RANK_VALUES[code] == KING:
+        return ()
+    return tuple(
+        other for other in range(52)
+        if RANK_VALUES[other] == RANK_VALUES[code] + 1
+        and COLOR_VALUES[other] != COLOR_VALUES[code]
+    )
+
+PARENTS: Tuple[Tuple[int, ...], ...] = tuple(_parents(code) for code in range(52))
+# codes of the cards that can be stacked on each card
+CHILDREN: Tuple[Tuple[int, ...], ...] = tuple(
+    tuple(child for child in range(52) if code in PARENTS[child])
+    for code in range(52)
+)
+# code of the ace of the same suit
+SUIT_BASES = bytes(code - RANK_VALUES[code] + 1 for code in range(52))
+
+def _cards_sha256(codes: bytearray) -> bytes:
+    return b''.join(CARD_SHA256[code] for code in codes)
 
 class Deck:
-    def __init__(self, cards: List[Card], seed):
-        self._cards = cards
+    __slots__ = ('_codes', '_seed')
+
+    def __init__(self, cards: Iterable[Card], seed):
+        self._codes = bytearray(card.code for card in cards)
         self._seed = seed
 
+    @classmethod
+    def from_codes(cls, codes: bytearray, seed) -> Deck:
+        deck = cls.__new__(cls)
+        deck._codes = codes
+        deck._seed = seed
+        return deck
+
+    def copy(self) -> Deck:
+        return Deck.from_codes(bytearray(self._codes), self._seed)
+
     @property
     def seed(self) -> int:
         return self._seed
 
+    @property
+    def codes(self) -> bytearray:
+        return self._codes
+
+    @property
+    def cards(self) -> List[Card]:
+        return [CARDS[code] for code in self._codes]
+
     @property
     def top(self) -> Optional[Card]:
-        if len(self._cards) == 0:
+        if len(self._codes) == 0:
             return None
-        return self._cards[-1]
+        return CARDS[self._codes[-1]]
 
     def draw(self) -> Card:
-        return self._cards.pop()
+        return CARDS[self._codes.pop()]
 
     def push(self, card: Card):
-        self._cards.append(card)
+        self._codes.append(card.code)
+
+    def pop_code(self) -> int:
+        return self._codes.pop()
+
+    def push_code(self, code: int):
+        self._codes.append(code)
+
+    def refill(self, waste_codes: bytearray):
+        """
+        Turn the waste over into the deck.
+        """
+        self._codes = waste_codes[::-1]
+
+    def take_all(self) -> bytearray:
+        codes = self._codes
+        self._codes = bytearray()
+        return codes
 
     @classmethod
     def create(cls, seed=None) -> Deck:
@@ -98,52 +197,104 @@ class Deck:
         Create a new shuffled card deck.
         Optionally provide a seed for deterministic output.
         """
-        cards = []
-        for suit in Suit:
-            for rank in Rank:
-                cards.append(Card(suit, rank))
+        codes = bytearray(range(52))
         if seed is None:
             seed = random.randrange(sys.maxsize)
-        random.Random(seed).shuffle(cards)
-        return cls(cards, seed)
+        random.Random(seed).shuffle(codes)
+        return cls.from_codes(codes, seed)
 
     def sha256_hash(self) -> bytes:
         return hashlib.sha256(
             hashlib.sha256(b'Deck').digest()
-            + b''.join(c.sha256_hash() for c in self._cards)
+            + _cards_sha256(self._codes)
         ).digest()
 
 class Waste:
+    __slots__ = ('_codes',)
+
     def __init__(self):
-        self._cards: List[Card] = []
+        self._codes = bytearray()
+
+    @classmethod
+    def from_codes(cls, codes: bytearray) -> Waste:
+        waste = cls.__new__(cls)
+        waste._codes = codes
+        return waste
+
+    def copy(self) -> Waste:
+        return Waste.from_codes(bytearray(self._codes))
+
+    @property
+    def codes(self) -> bytearray:
+        return self._codes
+
+    @property
+    def cards(self) -> List[Card]:
+        return [CARDS[code] for code in self._codes]
 
     @property
     def top(self) -> Optional[Card]:
-        if len(self._cards) == 0:
+        if len(self._codes) == 0:
             return None
-        return self._cards[-1]
+        return CARDS[self._codes[-1]]
 
     def draw(self) -> Card:
-        return self._cards.pop()
+        return CARDS[self._codes.pop()]
 
     def push(self, card: Card):
-        self._cards.append(card)
+        self._codes.append(card.code)
+
+    def pop_code(self) -> int:
+        return self._codes.pop()
+
+    def push_code(self, code: int):
+        self._codes.append(code)
+
+    def refill(self, deck_codes: bytearray):
+        """
+        Undo turning the waste over into the deck.
+        """
+        self._codes = deck_codes[::-1]
+
+    def take_all(self) -> bytearray:
+        codes = self._codes
+        self._codes = bytearray()
+        return codes
 
     def sha256_hash(self) -> bytes:
         return hashlib.sha256(
             hashlib.sha256(b'Waste').digest()
-            + b''.join(c.sha256_hash() for c in self._cards)
+            + _cards_sha256(self._codes)
         ).digest()
 
 class Pile:
-    def __init__(self, cards: List[Card]):
-        self._cards = cards
-        self._revealed_count = min(1, len(cards))
+    __slots__ = ('_codes', '_revealed_count')
+
+    def __init__(self, cards: Iterable[Card]):
+        self._codes = bytearray(card.code for card in cards)
+        self._revealed_count = min(1, len(self._codes))
+
+    @classmethod
+    def from_codes(cls, codes: bytearray, revealed_count: int) -> Pile:
+        pile = cls.__new__(cls)
+        pile._codes = codes
+        pile._revealed_count = revealed_count
+        return pile
+
+    def copy(self) -> Pile:
+        return Pile.from_codes(bytearray(self._codes), self._revealed_count)
+
+    @property
+    def codes(self) -> bytearray:
+        return self._codes
 
-    # TODO don't reveal hidden cards in public interface
     @property
     def cards(self) -> List[Card]:
-        return self._cards
+        """
+        All cards, face-down ones included. Game.observation has what a
+        player can see.
+        """
+        return [CARDS[code] for code in self._codes]
 
     @property
     def revealed_count(self) -> int:
@@ -151,72 +302,125 @@ class Pile:
 
     @property
     def top(self) -> Optional[Card]:
-        if len(self._cards) == 0:
+        if len(self._codes) == 0:
             return None
-        return self._cards[-1]
+        return CARDS[self._codes[-1]]
 
     def draw(self, count: int) -> List[Card]:
+        return [CARDS[code] for code in self.draw_codes(count)]
+
+    def draw_codes(self, count: int) -> bytearray:
         if count > self._revealed_count:
             raise ValueError(f'Card {count} is not revealed yet')
-        if count > len(self._cards):
+        if count > len(self._codes):
             raise ValueError(f'Card {count} is out of bounds')
-        remaining, drawn = self._cards[:-count], self._cards[-count:]
-        self._cards = remaining
+        drawn = self._codes[-count:]
+        del self._codes[-count:]
         if count == self._revealed_count:
-            self._revealed_count = 0 if len(remaining) == 0 else 1
+            self._revealed_count = 0 if len(self._codes) == 0 else 1
         else:
             self._revealed_count -= count
         return drawn
 
+    def undraw(self, codes: bytearray, revealed: bool):
+        """
+        Put back cards taken with draw_codes() without validating them.
+        `revealed` tells whether that draw revealed a face-down card.
+        """
+        if revealed:
+            self._revealed_count = len(codes)
+        else:
+            self._revealed_count += len(codes)
+        self._codes += codes
+
     def push(self, card: Card):
-        if self.top:
-            if card.suit.color == self.top.suit.color:
+        self.push_code(card.code)
+
+    def push_code(self, code: int):
+        if self._codes:
+            top = self._codes[-1]
+            if COLOR_VALUES[code] == COLOR_VALUES[top]:
                 raise ValueError('Cannot push same color')
-            if card.rank.value != self.top.rank.value - 1:
+            if RANK_VALUES[code] != RANK_VALUES[top] - 1:
                 raise ValueError('Cannot push ranks other than top - 1 onto pile')
-        elif card.rank != Rank.KING:
+        elif RANK_VALUES[code] != KING:
             raise ValueError('Cannot push ranks other than king onto an empty pile')
-        self._cards.append(card)
+        self._codes.append(code)
         self._revealed_count += 1
 
     def sha256_hash(self) -> bytes:
         return hashlib.sha256(
             hashlib.sha256(b'Pile').digest()
             + hashlib.sha256(bytes([self._revealed_count])).digest()
-            + b''.join(c.sha256_hash() for c in self._cards)
+            + _cards_sha256(self._codes)
         ).digest()
 
 class Foundation:
+    """
+    Foundations are built up from the ace in order, so the suit and the
+    number of cards are enough to know every card in it.
+    """
+    __slots__ = ('_suit', '_height')
+
     def __init__(self, suit: Suit):
         self._suit = suit
-        self._cards: List[Card] = []
+        self._height = 0
+
+    @classmethod
+    def from_height(cls, suit: Suit, height: int) -> Foundation:
+        foundation = cls(suit)
+        foundation._height = height
+        return foundation
+
+    def copy(self) -> Foundation:
+        return Foundation.from_height(self._suit, self._height)
 
     @property
     def suit(self) -> Suit:
         return self._suit
 
+    @property
+    def height(self) -> int:
+        return self._height
+
+    @property
+    def cards(self) -> List[Card]:
+        base = (self._suit.value - 1) * 13
+        return list(CARDS[base:base + self._height])
+
     @property
     def top(self) -> Optional[Card]:
-        if len(self._cards) == 0:
+        if self._height == 0:
             return None
-        return self._cards[-1]
+        return CARDS[self.top_code]
+
+    @property
+    def top_code(self) -> int:
+        return (self._suit.value - 1) * 13 + self._height - 1
 
     def draw(self) -> Card:
-        return self._cards.pop()
+        return CARDS[self.pop_code()]
+
+    def pop_code(self) -> int:
+        if self._height == 0:
+            raise IndexError('pop from empty foundation')
+        self._height -= 1
+        return (self._suit.value - 1) * 13 + self._height
 
     def push(self, card: Card):
-        if card.suit != self._suit:
-            raise ValueError('Cannot push cards of suit {card.suit} onto a foundation of {self._suit}')
-        top_value = 0
-        if self.top:
-            top_value = self.top.rank.value
-        if card.rank.value - 1 != top_value:
+        self.push_code(card.code)
+
+    def push_code(self, code: int):
+        if CARD_SUITS[code] != self._suit:
+            raise ValueError(f'Cannot push cards of suit {CARD_SUITS[code]} onto a foundation of {self._suit}')
+        if RANK_VALUES[code] - 1 != self._height:
             raise ValueError('Cannot push ranks other than top + 1 onto foundation')
-        self._cards.append(card)
+        self._height += 1
 
     def sha256_hash(self) -> bytes:
+        base = (self._suit.value - 1) * 13
         return hashlib.sha256(
             hashlib.sha256(b'Foundation').digest()
             + self._suit.sha256_hash()
-            + b''.join(c.sha256_hash() for c in self._cards)
+            + b''.join(CARD_SHA256[base:base + self._height])
         ).digest()
@@ -0,0 +1,159 @@
+"""
+Cheap checks for positions that can't be won, used to prune searches.
+
+Every check here is sound: a position is only reported when no sequence of
+actions can win it.
+"""
+from __future__ import annotations
+from typing import (
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+import argparse
+import time
+from .cards import (
+    RANK_VALUES,
+    KING,
+    PARENTS,
+    CHILDREN,
+    SUIT_BASES,
+)
+from .game import Game
+
+def find_blocked_card(game: Game) -> Optional[Tuple[int, int]]:
+    """
+    Find a card that can never leave its pile, as (pile index, card index).
+
+    A card that isn't stacked on one of its parents can only leave its pile
+    on its own. If a lower card of its suit is under it, it can't go to its
+    foundation, and if both of its parents are under it, it can't go to
+    another pile either. Nothing under it can leave before it does, so the
+    game is lost. Only the face-down cards and the lowest face-up card need
+    to be checked, because the rest of the face-up cards are stacked on
+    their parents.
+    """
+    for pile_index, pile in enumerate(game.piles):
+        codes = pile.codes
+        for i in range(1, min(len(codes) - pile.revealed_count + 1, len(codes))):
+            code = codes[i]
+            parents = PARENTS[code]
+            if not parents or codes[i - 1] in parents:
+                continue
+            below = codes[:i]
+            if parents[0] not in below or parents[1] not in below:
+                continue
+            suit_base = SUIT_BASES[code]
+            if any(suit_base <= other < code for other in below):
+                return (pile_index, i)
+    return None
+
+def is_stock_stuck(game: Game) -> bool:
+    """
+    Check that no card in the deck or the waste can ever be played and that
+    nothing on the board can move either, so drawing only cycles through the
+    same states. Moving a whole pile to an empty pile doesn't count as a
+    move because it only renumbers the piles.
+    """
+    piles = game.piles
+    # cards that can be played onto a pile top or a foundation
+    accepted = bytearray(52)
+    to_foundation = bytearray(52)
+    empty_pile = False
+    for pile in piles:
+        if pile.codes:
+            for child in CHILDREN[pile.codes[-1]]:
+                accepted[child] = 1
+        else:
+            empty_pile = True
+    for foundation in game.foundations:
+        if foundation.height < 13:
+            to_foundation[(foundation.suit.value - 1) * 13 + foundation.height] = 1
+    for stock in (game.waste.codes, game.deck.codes):
+        for code in stock:
+            if accepted[code] or to_foundation[code] or empty_pile and RANK_VALUES[code] == KING:
+                return False
+    for pile in piles:
+        codes = pile.codes
+        if not codes:
+            continue
+        if to_foundation[codes[-1]]:
+            return False
+        for i in range(len(codes) - pile.revealed_count, len(codes)):
+            code = codes[i]
+            if accepted[code] or empty_pile and i > 0 and RANK_VALUES[code] == KING:
+                return False
+    for foundation in game.foundations:
+        if foundation.height == 0:
+            continue
+        code = foundation.top_code
+        if accepted[code] or empty_pile and RANK_VALUES[code] == KING:
+            return False
+    return True
+
+def all_actions_seen(game: Game, seen: Set[int]) -> bool:
+    """
+    Check that every action leads to a state whose Zobrist hash is in `seen`.
+    """
+    for action in game.get_possible_actions():
+        game.run_action(action)
+        state_hash = game.zobrist_hash()
+        game.undo()
+        if state_hash not in seen:
+            return False
+    return True
+
+def is_dead_end(game: Game, seen: Optional[Set[int]] = None, check_blocked: bool = True) -> bool:
+    """
+    Check whether `game` is provably lost. With `seen`, also report positions
+    where every action leads back to an already seen state. Searches can
+    skip the blocked card check below the root, see find_blocked_card().
+    """
+    if game.is_won():
+        return False
+    if check_blocked and find_blocked_card(game) is not None:
+        return True
+    if is_stock_stuck(game):
+        return True
+    if seen is not None and all_actions_seen(game, seen):
+        return True
+    return False
+
+def benchmark(seeds: List[int], max_nodes: int):
+    """
+    Solve `seeds` with and without dead-end pruning and print the nodes
+    searched, the nodes pruned and the time spent.
+    """
+    from .solver import (
+        SolveStatus,
+        Solver,
+    )
+    for prune in (False, True):
+        solver = Solver(max_nodes=max_nodes, prune_dead_ends=prune)
+        nodes = 0
+        pruned = 0
+        solved = 0
+        unsolvable = 0
+        start_time = time.monotonic()
+        for seed in seeds:
+            result = solver.solve(Game.create(seed))
+            nodes += result.nodes
+            pruned += result.pruned
+            solved += result.solved
+            unsolvable += result.status is SolveStatus.UNSOLVABLE
+        elapsed = time.monotonic() - start_time
+        print(f'prune={prune}: {solved}/{len(seeds)} solved, {unsolvable} proven unsolvable, {nodes} nodes, {pruned} pruned, {elapsed:.2f}s')
+    start_time = time.monotonic()
+    game = Game.create(seeds[0])
+    count = 10000
+    for _ in range(count):
+        is_dead_end(game)
+    print(f'is_dead_end: {(time.monotonic() - start_time) / count * 1e6:.1f}us per call')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='python -m klondike.deadend', description='Benchmark dead-end pruning')
+    parser.add_argument('--seeds', type=int, default=100, help='number of seeds starting from 0')
+    parser.add_argument('--max-nodes', type=int, default=5000, help='node budget per deal')
+    args = parser.parse_args()
+    benchmark(list(range(args.seeds)), args.max_nodes)
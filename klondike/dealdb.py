@@ -0,0 +1,364 @@
+"""
+Database of solved deals indexed by seed.
+
+    python -m klondike.dealdb import deals.kdb results.jsonl [--base-seed 0] [--capacity N]
+    python -m klondike.dealdb query deals.kdb SEED ...
+    python -m klondike.dealdb stats deals.kdb
+
+The file covers the seeds base_seed..base_seed+capacity-1 and has three parts:
+
+    header      HEADER, 32 bytes
+    records     one RECORD of 16 bytes per seed, all zero for unknown seeds
+    overflow    solutions: varint length and the ActionCodec encoded actions
+
+A record is found by its seed in O(1) and the file is read through mmap, so
+any number of processes can query a database of 10^8 seeds (1.6 GB of
+records, sparse on disk until filled) without loading it. A record points
+to its solution in the overflow area by file offset, 0 if there is none.
+"""
+from __future__ import annotations
+from typing import (
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+import argparse
+import json
+import mmap
+import os
+import random
+import struct
+import sys
+from .actions import (
+    Action,
+)
+from .batch import (
+    read_results,
+)
+from .record import (
+    ActionCodec,
+    decode_varint,
+    encode_varint,
+)
+
+MAGIC = b'KLDD'
+VERSION = 1
+# magic, version, draw count, base seed, capacity
+HEADER = struct.Struct('<4sBB2xQQ8x')
+# status, length, nodes, solution offset
+RECORD = struct.Struct('<BxHIQ')
+
+UNKNOWN = 0
+STATUS_CODES: Dict[str, int] = {
+    'solvable': 1,
+    'unsolvable': 2,
+    'timeout': 3,
+}
+CODE_TO_STATUS: Dict[int, str] = {code: status for status, code in STATUS_CODES.items()}
+
+MAX_LENGTH = 0xffff
+MAX_NODES = 0xffffffff
+# records read at a time when scanning
+SCAN_CHUNK = 1 << 16
+EMPTY_CHUNK = bytes(SCAN_CHUNK * RECORD.size)
+# bytes of records written at a time when appending
+WRITE_SIZE = 1 << 20
+
+class Deal(NamedTuple):
+    seed: int
+    status: str
+    length: Optional[int]
+    nodes: int
+    solution: Optional[bytes]
+
+    def actions(self) -> Optional[List[Action]]:
+        if self.solution is None:
+            return None
+        return list(ActionCodec.decode_all(self.solution))
+
+def _matches(
+    code: int,
+    length: int,
+    nodes: int,
+    status_code: Optional[int],
+    min_length: Optional[int],
+    max_length: Optional[int],
+    max_nodes: Optional[int],
+) -> bool:
+    if code == UNKNOWN or (status_code is not None and code != status_code):
+        return False
+    if min_length is not None and length < min_length:
+        return False
+    if max_length is not None and length > max_length:
+        return False
+    return max_nodes is None or nodes <= max_nodes
+
+class DealDB:
+    """
+    Open with DealDB.create() or DealDB.open(). Writes go through the file
+    and reads through an mmap that is remapped when the file has grown.
+    """
+    def __init__(self, path: str, writable: bool = False):
+        self._path = path
+        self._file = open(path, 'r+b' if writable else 'rb')
+        header = self._file.read(HEADER.size)
+        if len(header) < HEADER.size or header[:len(MAGIC)] != MAGIC:
+            self._file.close()
+            raise ValueError('Not a deal database')
+        _, version, self._draw_count, self._base_seed, self._capacity = HEADER.unpack(header)
+        if version != VERSION:
+            self._file.close()
+            raise ValueError(f'Unsupported deal database version {version}')
+        self._writable = writable
+        self._data: Optional[mmap.mmap] = None
+        self._remap()
+
+    @classmethod
+    def create(cls, path: str, base_seed: int = 0, capacity: int = 10 ** 8, draw_count: int = 1) -> DealDB:
+        with open(path, 'xb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, draw_count, base_seed, capacity))
+            f.truncate(HEADER.size + capacity * RECORD.size)
+        return cls(path, writable=True)
+
+    @classmethod
+    def open(cls, path: str, writable: bool = False) -> DealDB:
+        return cls(path, writable)
+
+    @property
+    def base_seed(self) -> int:
+        return self._base_seed
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    @property
+    def draw_count(self) -> int:
+        return self._draw_count
+
+    def __contains__(self, seed: int) -> bool:
+        return self._base_seed <= seed < self._base_seed + self._capacity
+
+    def _remap(self):
+        if self._data is not None:
+            self._data.close()
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _record_offset(self, seed: int) -> int:
+        if seed not in self:
+            raise ValueError(f'Seed {seed} is outside the database')
+        return HEADER.size + (seed - self._base_seed) * RECORD.size
+
+    def _read_solution(self, offset: int) -> bytes:
+        assert self._data is not None
+        if offset >= len(self._data):
+            # written after the file was mapped
+            self._remap()
+        length, position = decode_varint(self._data, offset)
+        if position + length > len(self._data):
+            self._remap()
+        return bytes(self._data[position:position + length])
+
+    def get(self, seed: int) -> Optional[Deal]:
+        """
+        The stored result of `seed`, None if it isn't known.
+        """
+        assert self._data is not None
+        status, length, nodes, solution_offset = RECORD.unpack_from(self._data, self._record_offset(seed))
+        if status == UNKNOWN:
+            return None
+        return Deal(
+            seed,
+            CODE_TO_STATUS[status],
+            length if status == STATUS_CODES['solvable'] else None,
+            nodes,
+            self._read_solution(solution_offset) if solution_offset else None,
+        )
+
+    def append(self, results: Iterable[dict]) -> int:
+        """
+        Store results in the format of klondike.batch. Runs of consecutive
+        seeds are written with one write. Returns the number of results.
+        """
+        if not self._writable:
+            raise ValueError('Deal database is opened read-only')
+        count = 0
+        run_start: Optional[int] = None
+        run = bytearray()
+        solutions = bytearray()
+        overflow_end = self._file.seek(0, os.SEEK_END)
+        for result in results:
+            offset = self._record_offset(result['seed'])
+            if run_start is not None and (offset != run_start + len(run) or len(run) >= WRITE_SIZE):
+                overflow_end = self._write(run_start, run, overflow_end, solutions)
+                run_start = None
+            if run_start is None:
+                run_start = offset
+                run = bytearray()
+                solutions = bytearray()
+            solution_offset = 0
+            if result.get('solution'):
+                solution = bytes.fromhex(result['solution'])
+                solution_offset = overflow_end + len(solutions)
+                solutions += encode_varint(len(solution)) + solution
+            run += RECORD.pack(
+                STATUS_CODES[result['status']],
+                min(result['length'] or 0, MAX_LENGTH),
+                min(result['nodes'], MAX_NODES),
+                solution_offset,
+            )
+            count += 1
+        if run_start is not None:
+            self._write(run_start, run, overflow_end, solutions)
+        self._remap()
+        return count
+
+    def _write(self, offset: int, run: bytearray, overflow_end: int, solutions: bytearray) -> int:
+        """
+        Write consecutive records and their solutions.
+        Returns the new end of the overflow area.
+        """
+        fd = self._file.fileno()
+        # solutions first, so that a record never points past the end of the file
+        os.pwrite(fd, solutions, overflow_end)
+        os.pwrite(fd, run, offset)
+        return overflow_end + len(solutions)
+
+    def _iter_records(self, start: int, stop: int) -> Iterator[Tuple[int, int, int, int, int]]:
+        """
+        Seeds and records in start..stop-1. Chunks without known seeds are
+        skipped without unpacking, so some unknown seeds aren't yielded.
+        """
+        assert self._data is not None
+        for chunk_start in range(start, stop, SCAN_CHUNK):
+            chunk_stop = min(stop, chunk_start + SCAN_CHUNK)
+            begin = self._record_offset(chunk_start)
+            chunk = self._data[begin:begin + (chunk_stop - chunk_start) * RECORD.size]
+            if chunk == EMPTY_CHUNK[:len(chunk)]:
+                continue
+            for seed, record in enumerate(RECORD.iter_unpack(chunk), chunk_start):
+                yield (seed,) + record
+
+    def seeds(
+        self,
+        status: Optional[str] = 'solvable',
+        min_length: Optional[int] = None,
+        max_length: Optional[int] = None,
+        max_nodes: Optional[int] = None,
+        start: Optional[int] = None,
+        stop: Optional[int] = None,
+    ) -> Iterator[int]:
+        """
+        Seeds with the given status, solution length and solver effort in
+        the range start..stop-1. Scans the records in chunks.
+        """
+        status_code = None if status is None else STATUS_CODES[status]
+        start = self._base_seed if start is None else max(start, self._base_seed)
+        stop = self._base_seed + self._capacity if stop is None else min(stop, self._base_seed + self._capacity)
+        for seed, code, length, nodes, _ in self._iter_records(start, stop):
+            if _matches(code, length, nodes, status_code, min_length, max_length, max_nodes):
+                yield seed
+
+    def random_seed(
+        self,
+        rng: Optional[random.Random] = None,
+        status: Optional[str] = 'solvable',
+        min_length: Optional[int] = None,
+        max_length: Optional[int] = None,
+        max_nodes: Optional[int] = None,
+        attempts: int = 100000,
+    ) -> int:
+        """
+        A random known seed matching the filters, to pass to Game.create().
+        Picks random seeds until one matches, so it is fast as long as
+        matching seeds aren't rare. Raises ValueError after `attempts` misses.
+        """
+        if rng is None:
+            rng = random.Random()
+        status_code = None if status is None else STATUS_CODES[status]
+        for _ in range(attempts):
+            seed = self._base_seed + rng.randrange(self._capacity)
+            code, length, nodes, _ = RECORD.unpack_from(self._data, self._record_offset(seed))
+            if _matches(code, length, nodes, status_code, min_length, max_length, max_nodes):
+                return seed
+        raise ValueError('No matching seed found')
+
+    def stats(self) -> Dict[str, int]:
+        counts = {status: 0 for status in STATUS_CODES}
+        for _, code, _, _, _ in self._iter_records(self._base_seed, self._base_seed + self._capacity):
+            if code != UNKNOWN:
+                counts[CODE_TO_STATUS[code]] += 1
+        return counts
+
+    def close(self):
+        if self._data is not None:
+            self._data.close()
+            self._data = None
+        self._file.close()
+
+    def __enter__(self) -> DealDB:
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def import_results(db_path: str, results_path: str, base_seed: int = 0, capacity: Optional[int] = None) -> int:
+    """
+    Append the results of klondike.batch to a database, creating it if
+    needed. A new database covers the seeds of the results by default.
+    """
+    if not os.path.exists(db_path):
+        if capacity is None:
+            capacity = max(result['seed'] for result in read_results(results_path)) - base_seed + 1
+        DealDB.create(db_path, base_seed, capacity).close()
+    with DealDB.open(db_path, writable=True) as db:
+        return db.append(read_results(results_path))
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(prog='python -m klondike.dealdb', description='Database of solved deals')
+    commands = parser.add_subparsers(dest='command', required=True)
+    import_parser = commands.add_parser('import', help='append klondike.batch results')
+    import_parser.add_argument('db')
+    import_parser.add_argument('results', help='JSONL or .csv output of klondike.batch')
+    import_parser.add_argument('--base-seed', type=int, default=0, help='first seed of a new database')
+    import_parser.add_argument('--capacity', type=int, default=None, help='number of seeds of a new database')
+    query_parser = commands.add_parser('query', help='print the results of seeds')
+    query_parser.add_argument('db')
+    query_parser.add_argument('seeds', type=int, nargs='+')
+    stats_parser = commands.add_parser('stats', help='count the seeds by status')
+    stats_parser.add_argument('db')
+    args = parser.parse_args(argv)
+    if args.command == 'import':
+        count = import_results(args.db, args.results, args.base_seed, args.capacity)
+        print(f'{count} results imported', file=sys.stderr)
+    elif args.command == 'query':
+        outside = False
+        with DealDB.open(args.db) as db:
+            for seed in args.seeds:
+                if seed not in db:
+                    print(f'Seed {seed} is outside the database ({db.base_seed}-{db.base_seed + db.capacity - 1})', file=sys.stderr)
+                    outside = True
+                    continue
+                deal = db.get(seed)
+                if deal is None:
+                    print(json.dumps({'seed': seed, 'status': None}))
+                else:
+                    print(json.dumps({
+                        'seed': seed,
+                        'status': deal.status,
+                        'length': deal.length,
+                        'nodes': deal.nodes,
+                        'solution': None if deal.solution is None else deal.solution.hex(),
+                    }))
+        if outside:
+            sys.exit(1)
+    elif args.command == 'stats':
+        with DealDB.open(args.db) as db:
+            print(json.dumps(db.stats()))
+
+if __name__ == '__main__':
+    main()
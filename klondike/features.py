@@ -0,0 +1,335 @@
+"""
+Fixed-shape NumPy features of positions for training evaluators.
+
+    python -m klondike.features games.kdr features/ [--shard-size 65536] [--reveal-hidden]
+
+FeatureEncoder turns batches of games into arrays with one row per
+position, written into buffers that are allocated once:
+
+    locations    bool  (52, LOCATION_COUNT)  one-hot location of each card
+    piles        uint8 (7, MAX_PILE)         card codes from the bottom up
+    hidden       bool  (7, MAX_PILE)         face-down cards of the piles
+    foundations  uint8 (4,)                  heights by suit index
+    deck         uint8 (STOCK_SIZE,)         card codes from the bottom up
+    waste        uint8 (STOCK_SIZE,)         card codes from the bottom up
+    deck_known   bool  ()                    the waste has been turned over
+    seeds        int64 ()
+    moves        int32 ()                    length of the history
+
+Empty places hold NO_CARD. Unless the encoder reveals hidden cards, the
+face-down cards of the piles are HIDDEN_CARD and their location is
+UNSEEN, which is all a player knows about them. So are the cards of the
+deck until the waste has been turned over, after which the player knows
+their order, see probability.deck_is_known().
+
+Each game is first packed into PACKED_SIZE bytes in Python, and the
+features of the whole batch are computed from those bytes with array
+operations. encode_records() streams the positions of recorded games
+labeled with whether the game was won, and write_shards() writes them
+as .npy files to load with mmap_mode='r'. Requires numpy, which the rest
+of the package doesn't.
+"""
+from __future__ import annotations
+from typing import (
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+)
+import argparse
+import json
+import os
+import time
+import numpy as np
+from .game import Game
+from .probability import (
+    deck_is_known,
+)
+from .lockstep import (
+    PILE_COUNT,
+    MAX_PILE,
+    STOCK_SIZE,
+    NO_CARD,
+)
+from .record import (
+    Record,
+    iter_records,
+)
+
+# card code of a card that the player can't see
+HIDDEN_CARD = 53
+
+# card locations, piles 0-6 are locations 0-6
+WASTE = 7
+FOUNDATION = 8
+DECK = 9
+UNSEEN = 10
+LOCATION_COUNT = 11
+
+# layout of a packed position: the piles padded to MAX_PILE, their revealed
+# counts, the foundation heights by suit index, the deck and the waste
+# padded to STOCK_SIZE
+_PILES_END = PILE_COUNT * MAX_PILE
+_REVEALED_END = _PILES_END + PILE_COUNT
+_FOUNDATIONS_END = _REVEALED_END + 4
+_DECK_END = _FOUNDATIONS_END + STOCK_SIZE
+PACKED_SIZE = _DECK_END + STOCK_SIZE
+_PADDING = bytes([NO_CARD]) * STOCK_SIZE
+
+FEATURE_SHAPES: Dict[str, tuple] = {
+    'locations': ((52, LOCATION_COUNT), np.bool_),
+    'piles': ((PILE_COUNT, MAX_PILE), np.uint8),
+    'hidden': ((PILE_COUNT, MAX_PILE), np.bool_),
+    'foundations': ((4,), np.uint8),
+    'deck': ((STOCK_SIZE,), np.uint8),
+    'waste': ((STOCK_SIZE,), np.uint8),
+    'deck_known': ((), np.bool_),
+    'seeds': ((), np.int64),
+    'moves': ((), np.int32),
+}
+
+_PILE_OF_CELL = np.repeat(np.arange(PILE_COUNT, dtype=np.int8), MAX_PILE)
+# rank - 1 and suit index by card code
+_RANK_INDEXES = np.arange(52) % 13
+_SUIT_INDEXES = np.arange(52) // 13
+
+def pack(game: Game) -> bytes:
+    """
+    The position of `game` in PACKED_SIZE bytes, see FeatureEncoder.
+    """
+    parts = []
+    piles = game.piles
+    for pile in piles:
+        codes = pile.codes
+        parts.append(codes)
+        parts.append(_PADDING[len(codes):MAX_PILE])
+    parts.append(bytes(pile.revealed_count for pile in piles))
+    heights = bytearray(4)
+    for foundation in game.foundations:
+        heights[foundation.suit.value - 1] = foundation.height
+    parts.append(heights)
+    deck_codes = game.deck.codes
+    parts.append(deck_codes)
+    parts.append(_PADDING[len(deck_codes):])
+    waste_codes = game.waste.codes
+    parts.append(waste_codes)
+    parts.append(_PADDING[len(waste_codes):])
+    return b''.join(parts)
+
+class FeatureEncoder:
+    """
+    Encodes batches of up to `capacity` positions. The arrays returned by
+    the encode methods are views of the encoder's buffers, which the next
+    call overwrites, so copy them to keep them.
+    """
+    def __init__(self, capacity: int = 1024, reveal_hidden: bool = False):
+        if capacity < 1:
+            raise ValueError(f'Invalid capacity {capacity}')
+        self._capacity = capacity
+        self._reveal_hidden = reveal_hidden
+        self._buffers = {
+            name: np.zeros((capacity,) + shape, dtype=dtype)
+            for name, (shape, dtype) in FEATURE_SHAPES.items()
+        }
+        # location by card code, with a column for NO_CARD and HIDDEN_CARD
+        # to send the writes of empty and hidden places to
+        self._card_locations = np.zeros((capacity, 54), dtype=np.int8)
+        self._rows = np.arange(capacity)[:, None]
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    @property
+    def reveal_hidden(self) -> bool:
+        return self._reveal_hidden
+
+    def encode(self, games: Sequence[Game]) -> Dict[str, np.ndarray]:
+        """
+        Features of the current positions of `games`.
+        """
+        if len(games) > self._capacity:
+            raise ValueError(f'Cannot encode {len(games)} games with capacity {self._capacity}')
+        return self.encode_packed(
+            b''.join(pack(game) for game in games),
+            [game.seed for game in games],
+            [game.history.length for game in games],
+            [deck_is_known(game) for game in games],
+        )
+
+    def encode_packed(
+        self,
+        data: bytes,
+        seeds: Sequence[int],
+        moves: Sequence[int],
+        deck_known: Optional[Sequence[bool]] = None,
+    ) -> Dict[str, np.ndarray]:
+        """
+        Features of positions packed by pack(), one seed and history
+        length for each, and whether the deck order is known, which it
+        isn't by default.
+        """
+        n = len(seeds)
+        if (
+            n > self._capacity
+            or len(data) != n * PACKED_SIZE
+            or len(moves) != n
+            or deck_known is not None and len(deck_known) != n
+        ):
+            raise ValueError(f'Cannot encode {len(data)} bytes of {n} positions with capacity {self._capacity}')
+        out = {name: buffer[:n] for name, buffer in self._buffers.items()}
+        packed = np.frombuffer(data, dtype=np.uint8).reshape(n, PACKED_SIZE)
+        piles = packed[:, :_PILES_END].reshape(n, PILE_COUNT, MAX_PILE)
+        revealed_counts = packed[:, _PILES_END:_REVEALED_END]
+        heights = packed[:, _REVEALED_END:_FOUNDATIONS_END]
+        deck = packed[:, _FOUNDATIONS_END:_DECK_END]
+        out['seeds'][:] = seeds
+        out['moves'][:] = moves
+        out['deck_known'][:] = False if deck_known is None else deck_known
+        out['foundations'][:] = heights
+        out['waste'][:] = packed[:, _DECK_END:]
+
+        hidden_counts = (piles != NO_CARD).sum(axis=2) - revealed_counts
+        np.less(np.arange(MAX_PILE), hidden_counts[:, :, None], out=out['hidden'])
+        locations = self._card_locations[:n]
+        rows = self._rows[:n]
+        out['piles'][:] = piles
+        out['deck'][:] = deck
+        if self._reveal_hidden:
+            locations.fill(DECK)
+        else:
+            out['piles'][out['hidden']] = HIDDEN_CARD
+            out['deck'][(deck != NO_CARD) & ~out['deck_known'][:, None]] = HIDDEN_CARD
+            locations.fill(UNSEEN)
+            # hidden and empty places write to the columns past the cards
+            locations[rows, out['deck']] = DECK
+        locations[rows, out['piles'].reshape(n, -1)] = _PILE_OF_CELL
+        locations[rows, out['waste']] = WASTE
+        locations[:, :52][_RANK_INDEXES < heights[:, _SUIT_INDEXES]] = FOUNDATION
+        np.equal(locations[:, :52, None], np.arange(LOCATION_COUNT), out=out['locations'])
+        return out
+
+def encode_records(
+    records: Iterable[Record],
+    batch_size: int = 4096,
+    reveal_hidden: bool = False,
+) -> Iterator[Dict[str, np.ndarray]]:
+    """
+    Features of every position of the recorded games, from the deal to the
+    last action, in batches of `batch_size` positions. Each batch also has
+    "won", whether the game of the position was won in the end. The arrays
+    are reused between batches.
+    """
+    encoder = FeatureEncoder(batch_size, reveal_hidden)
+    won = np.zeros(batch_size, dtype=np.bool_)
+    positions: List[bytes] = []
+    seeds: List[int] = []
+    moves: List[int] = []
+    known: List[bool] = []
+    outcomes: List[bool] = []
+    for record in records:
+        game = Game.create(record.seed, record.draw_count)
+        game_positions = [pack(game)]
+        game_known = [False]
+        deck_known = False
+        for action in record.actions():
+            game.run_action(action)
+            game_positions.append(pack(game))
+            deck_known = deck_known or game.history.last_delta.recycles()
+            game_known.append(deck_known)
+        is_won = game.is_won()
+        for length, position in enumerate(game_positions):
+            positions.append(position)
+            seeds.append(record.seed)
+            moves.append(length)
+            known.append(game_known[length])
+            outcomes.append(is_won)
+            if len(positions) == batch_size:
+                batch = encoder.encode_packed(b''.join(positions), seeds, moves, known)
+                won[:] = outcomes
+                batch['won'] = won
+                yield batch
+                positions.clear()
+                seeds.clear()
+                moves.clear()
+                known.clear()
+                outcomes.clear()
+    if positions:
+        batch = encoder.encode_packed(b''.join(positions), seeds, moves, known)
+        won[:len(outcomes)] = outcomes
+        batch['won'] = won[:len(outcomes)]
+        yield batch
+
+def write_shards(
+    batches: Iterable[Dict[str, np.ndarray]],
+    directory: str,
+    shard_size: int = 1 << 16,
+) -> Iterator[int]:
+    """
+    Write batches of features to `directory` as NAME-INDEX.npy files of
+    `shard_size` positions each, the last one shorter, and yield the
+    index of each shard once its files are written.
+    """
+    os.makedirs(directory, exist_ok=True)
+    buffers: Optional[Dict[str, np.ndarray]] = None
+    index = 0
+    count = 0
+
+    def save(count: int):
+        assert buffers is not None
+        for name, buffer in buffers.items():
+            np.save(os.path.join(directory, f'{name}-{index:05d}.npy'), buffer[:count])
+
+    for batch in batches:
+        if buffers is None:
+            buffers = {
+                name: np.empty((shard_size,) + array.shape[1:], dtype=array.dtype)
+                for name, array in batch.items()
+            }
+        n = len(batch['seeds'])
+        start = 0
+        while start < n:
+            taken = min(n - start, shard_size - count)
+            for name, array in batch.items():
+                buffers[name][count:count + taken] = array[start:start + taken]
+            count += taken
+            start += taken
+            if count == shard_size:
+                save(count)
+                yield index
+                index += 1
+                count = 0
+    if count:
+        save(count)
+        yield index
+
+def load_shards(directory: str, name: str) -> List[np.ndarray]:
+    """
+    The shards of feature `name` in `directory` in order, memory-mapped.
+    """
+    paths = sorted(path for path in os.listdir(directory) if path.startswith(f'{name}-') and path.endswith('.npy'))
+    return [np.load(os.path.join(directory, path), mmap_mode='r') for path in paths]
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(prog='python -m klondike.features', description='Export features of recorded games')
+    parser.add_argument('records', help='file of recorded games, see klondike.record')
+    parser.add_argument('output', help='directory to write the shards to')
+    parser.add_argument('--batch-size', type=int, default=4096, help='positions encoded at once')
+    parser.add_argument('--shard-size', type=int, default=1 << 16, help='positions per shard')
+    parser.add_argument('--reveal-hidden', action='store_true', help='include the face-down cards and the deck order')
+    args = parser.parse_args(argv)
+    start_time = time.perf_counter()
+    batches = encode_records(iter_records(args.records), args.batch_size, args.reveal_hidden)
+    shards = sum(1 for _ in write_shards(batches, args.output, args.shard_size))
+    positions = sum(len(shard) for shard in load_shards(args.output, 'seeds'))
+    elapsed = time.perf_counter() - start_time
+    print(json.dumps({
+        'shards': shards,
+        'positions': positions,
+        'positions_per_sec': positions / elapsed,
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -1,20 +1,44 @@
 from __future__ import annotations
 from typing import (
+    TYPE_CHECKING,
     List,
+    Iterable,
+    Iterator,
+    Optional,
+    Tuple,
 )
 import hashlib
+from . import zobrist
 from .cards import (
-    Rank,
+    RANK_VALUES,
+    COLOR_VALUES,
+    KING,
+    CHILDREN,
     Deck,
     Waste,
     Pile,
     Foundation,
     Suit,
 )
+from .observation import (
+    Observation,
+)
 from .history import (
+    CHECKPOINT_INTERVAL,
     History,
+    ActionDelta,
+    NO_DELTA,
+    REVEALED_DELTA,
+    DRAW_DELTAS,
 )
 from .actions import (
+    MAX_DRAW_COUNT,
+    WASTE_TO_PILE_ACTIONS,
+    WASTE_TO_FOUNDATION_ACTIONS,
+    PILE_TO_FOUNDATION_ACTIONS,
+    FOUNDATION_TO_PILE_ACTIONS,
+    PILE_TO_PILE_ACTIONS,
+    draw_action,
     Action,
     DrawFromDeckAction,
     MoveFromWasteToPileAction,
@@ -22,36 +46,133 @@ from .actions import (
     MoveFromPileToPileAction,
     MoveFromWasteToFoundationAction,
     MoveFromPileToFoundationAction,
+    MacroAction,
+    MoveFromStockToPileAction,
+    MoveFromStockToFoundationAction,
+    AutoPlayAction,
+    AutoCompleteAction,
+)
+
+if TYPE_CHECKING:
+    from .hint import Hint
+
+# pile top of an empty pile
+NO_CARD = 0xff
+
+# bits of Game._owned
+_OWN_DECK = 1 << 0
+_OWN_WASTE = 1 << 1
+_OWN_FOUNDATIONS = 1 << 2
+_OWN_HISTORY = 1 << 3
+_OWN_INDEXES = 1 << 4
+# pile i is _OWN_PILE << i
+_OWN_PILE = 1 << 5
+_OWN_ALL = (_OWN_PILE << 7) - 1
+
+_target_pile_index = MoveFromPileToPileAction.target_pile_index.fget
+
+# suit indexes of the other color, by suit index
+_OTHER_COLOR_SUITS = tuple(
+    tuple(other for other in range(4) if COLOR_VALUES[other * 13] != COLOR_VALUES[suit * 13])
+    for suit in range(4)
 )
 
+def _is_safe_move(code: int, heights: List[int]) -> bool:
+    """
+    Whether moving the card with `code` to the foundations of `heights`
+    is possible and can't make the game harder.
+    """
+    rank = RANK_VALUES[code]
+    suit = code // 13
+    if heights[suit] != rank - 1:
+        return False
+    if rank <= 2:
+        return True
+    # the cards that could be put on it are on the foundations already
+    a, b = _OTHER_COLOR_SUITS[suit]
+    return heights[a] >= rank - 1 and heights[b] >= rank - 1
+
 class Game:
+    __slots__ = (
+        '_deck',
+        '_waste',
+        '_piles',
+        '_foundations',
+        '_foundation_by_suit',
+        '_pile_tops',
+        '_accepting_piles',
+        '_empty_piles',
+        '_history',
+        '_zobrist_hash',
+        '_owned',
+        '_draw_count',
+        '_auto_play',
+        '_hint_engine',
+        '_observation',
+    )
+
     def __init__(
         self,
         deck: Deck,
         waste: Waste,
         piles: List[Pile],
         foundations: List[Foundation],
+        draw_count: int = 1,
+        checkpoint_interval: int = CHECKPOINT_INTERVAL,
     ):
         self._deck = deck
         self._waste = waste
         self._piles = piles
         self._foundations = foundations
-        self._history = History()
+        # foundation of each suit, indexed by card code // 13
+        self._foundation_by_suit = sorted(foundations, key=lambda f: f.suit.value)
+        self._init_indexes()
+        self._history = History(checkpoint_interval)
+        self._zobrist_hash = zobrist.compute_hash(self)
+        # containers not shared with forks, see fork()
+        self._owned = _OWN_ALL
+        # cards drawn from the deck at a time, 1 or 3
+        self._draw_count = draw_count
+        self._auto_play = False
+        # created by the first hint()
+        self._hint_engine = None
+        self._observation: Optional[Observation] = None
+
+    def _init_indexes(self):
+        # move generation indexes kept up to date by _update_pile_top():
+        # top card code of each pile or NO_CARD,
+        self._pile_tops = bytearray([NO_CARD] * len(self._piles))
+        # bitmask of the piles each card code can be pushed onto
+        self._accepting_piles = [0] * 52
+        # and bitmask of the empty piles, which accept kings. The indexes
+        # start out as if every pile were empty, which _update_pile_top()
+        # leaves alone for the piles that are
+        self._empty_piles = (1 << len(self._piles)) - 1
+        for i in range(len(self._piles)):
+            self._update_pile_top(i)
 
     @classmethod
-    def create(cls, seed=None) -> Game:
+    def create(cls, seed=None, draw_count: int = 1, checkpoint_interval: int = CHECKPOINT_INTERVAL) -> Game:
         deck = Deck.create(seed)
         waste = Waste()
         piles = []
         for i in range(7):
-            pile_cards = []
+            pile_codes = bytearray()
             for _ in range(i + 1):
-                card = deck.draw()
-                pile_cards.append(card)
-            pile = Pile(pile_cards)
-            piles.append(pile)
+                pile_codes.append(deck.pop_code())
+            piles.append(Pile.from_codes(pile_codes, 1))
         foundations = [Foundation(suit) for suit in Suit]
-        return cls(deck, waste, piles, foundations)
+        return cls(deck, waste, piles, foundations, draw_count, checkpoint_interval)
+
+    @classmethod
+    def replay(cls, seed: int, actions: Iterable[Action], draw_count: int = 1) -> Game:
+        """
+        Create the game of `seed` and run `actions` on it.
+        """
+        game = cls.create(seed, draw_count)
+        for action in actions:
+            game.run_action(action)
+        return game
 
     @property
     def seed(self) -> int:
@@ -77,152 +198,789 @@ class Game:
     def history(self) -> History:
         return self._history
 
-    def run_action(self, action: Action):
+    @property
+    def observation(self) -> Observation:
+        """
+        Read-only views of what a player can see of the game. The same
+        object is returned every time and follows the game as it changes.
+        """
+        if self._observation is None:
+            self._observation = Observation(self)
+        return self._observation
+
+    def foundation(self, suit: Suit) -> Foundation:
+        return self._foundation_by_suit[suit.value - 1]
+
+    @property
+    def draw_count(self) -> int:
+        return self._draw_count
+
+    @property
+    def auto_play(self) -> bool:
+        """
+        Whether run_action() follows each action with the safe moves to
+        foundations, run and undone as one AutoPlayAction with it.
+        """
+        return self._auto_play
+
+    @auto_play.setter
+    def auto_play(self, auto_play: bool):
+        self._auto_play = auto_play
+
+    def fork(self) -> Game:
+        """
+        Create an independent copy of the game. The copies share the deck,
+        waste, piles, foundations and history until one of them changes
+        them, so forking is cheap no matter how long the game has been.
+        The shared containers must only be changed through the games.
+        """
+        game = Game.__new__(Game)
+        game._deck = self._deck
+        game._waste = self._waste
+        game._piles = self._piles.copy()
+        game._foundations = self._foundations
+        game._foundation_by_suit = self._foundation_by_suit
+        game._pile_tops = self._pile_tops
+        game._accepting_piles = self._accepting_piles
+        game._empty_piles = self._empty_piles
+        game._history = self._history
+        game._zobrist_hash = self._zobrist_hash
+        game._owned = 0
+        game._draw_count = self._draw_count
+        game._auto_play = self._auto_play
+        game._hint_engine = None
+        game._observation = None
+        self._owned = 0
+        return game
+
+    def _make_writable(self, action: Action):
+        """
+        Copy the shared containers that `action` changes.
+        """
+        if self._owned == _OWN_ALL:
+            return
+        shared = (_OWN_HISTORY | self._changed_containers(action)) & ~self._owned
+        if shared == 0:
+            return
+        if shared & _OWN_DECK:
+            self._deck = self._deck.copy()
+        if shared & _OWN_WASTE:
+            self._waste = self._waste.copy()
+        if shared & _OWN_FOUNDATIONS:
+            self._foundations = [f.copy() for f in self._foundations]
+            self._foundation_by_suit = sorted(self._foundations, key=lambda f: f.suit.value)
+        if shared & _OWN_HISTORY:
+            self._history = self._history.copy()
+        if shared & _OWN_INDEXES:
+            self._pile_tops = bytearray(self._pile_tops)
+            self._accepting_piles = self._accepting_piles.copy()
+        for i in range(len(self._piles)):
+            if shared & _OWN_PILE << i:
+                self._piles[i] = self._piles[i].copy()
+        self._owned |= shared
+
+    @classmethod
+    def _changed_containers(cls, action: Action) -> int:
         if isinstance(action, DrawFromDeckAction):
-            if action.count != 1:
-                raise NotImplementedError('DrawFromDeckAction is only implemented for 1 card')
-            # TODO other variants
-            if self._deck.top is None:
-                while self._waste.top:
-                    card = self._waste.draw()
-                    self._deck.push(card)
-            card = self._deck.draw()
-            self._waste.push(card)
-        elif isinstance(action, MoveFromWasteToPileAction):
-            target_pile = self._piles[action.target_pile_index]
-            card = self._waste.draw()
-            try:
-                target_pile.push(card)
-            except (IndexError, ValueError) as ex:
-                self._waste.push(card)
-                raise ex
-        elif isinstance(action, MoveFromFoundationToPileAction):
-            source_foundation = next(f for f in self._foundations if f.suit == action.source_foundation_suit)
-            target_pile = self._piles[action.target_pile_index]
-            card = source_foundation.draw()
-            try:
-                target_pile.push(card)
-            except (IndexError, ValueError) as ex:
-                source_foundation.push(card)
-                raise ex
-        elif isinstance(action, MoveFromPileToPileAction):
-            source_pile = self._piles[action.source_pile_index]
-            target_pile = self._piles[action.target_pile_index]
-            cards = source_pile.draw(action.count)
-            moved_count = 0
-            try:
-                for card in cards:
-                    target_pile.push(card)
-                    moved_count += 1
-            except (IndexError, ValueError) as ex:
-                target_pile.draw(moved_count)
-                for card in cards:
-                    source_pile.push(card)
-                raise ex
-        elif isinstance(action, MoveFromWasteToFoundationAction):
-            target_foundation = next(f for f in self._foundations if f.suit == action.target_foundation_suit)
-            card = self._waste.draw()
-            try:
-                target_foundation.push(card)
-            except (IndexError, ValueError) as ex:
-                self._waste.push(card)
-                raise ex
-        elif isinstance(action, MoveFromPileToFoundationAction):
-            source_pile = self._piles[action.source_pile_index]
-            target_foundation = next(f for f in self._foundations if f.suit == action.target_foundation_suit)
-            card = source_pile.draw(1)[0]
-            try:
-                target_foundation.push(card)
-            except (IndexError, ValueError) as ex:
-                source_pile.push(card)
-                raise ex
+            return _OWN_DECK | _OWN_WASTE
+        if isinstance(action, MoveFromWasteToPileAction):
+            return _OWN_WASTE | _OWN_INDEXES | _OWN_PILE << action.target_pile_index
+        if isinstance(action, MoveFromFoundationToPileAction):
+            return _OWN_FOUNDATIONS | _OWN_INDEXES | _OWN_PILE << action.target_pile_index
+        if isinstance(action, MoveFromPileToPileAction):
+            return _OWN_INDEXES | _OWN_PILE << action.source_pile_index | _OWN_PILE << action.target_pile_index
+        if isinstance(action, MoveFromWasteToFoundationAction):
+            return _OWN_WASTE | _OWN_FOUNDATIONS
+        if isinstance(action, MoveFromPileToFoundationAction):
+            return _OWN_FOUNDATIONS | _OWN_INDEXES | _OWN_PILE << action.source_pile_index
+        if isinstance(action, MacroAction):
+            changed = 0
+            for primitive in action.expand():
+                changed |= cls._changed_containers(primitive)
+            return changed
+        return 0
+
+    def is_won(self) -> bool:
+        return all(f.height == 13 for f in self._foundations)
+
+    def run_action(self, action: Action):
+        self._make_writable(action)
+        delta = self._apply_action(action)
+        if self._auto_play:
+            action, delta = self._add_safe_moves(action, delta)
+        if self._history.push(action, delta):
+            self._history.add_checkpoint(self._snapshot())
+
+    def _add_safe_moves(self, action: Action, delta: ActionDelta) -> Tuple[Action, ActionDelta]:
+        moves = self.safe_foundation_moves()
+        if not moves:
+            return action, delta
+        if isinstance(action, MacroAction):
+            actions = action.expand()
+            parts = list(delta.parts)
         else:
+            actions = [action]
+            parts = [delta]
+        for move in moves:
+            self._make_writable(move)
+            parts.append(self._apply_action(move))
+            actions.append(move)
+        return AutoPlayAction(actions=tuple(actions)), ActionDelta(parts=tuple(parts))
+
+    def safe_foundation_moves(self) -> List[Action]:
+        """
+        Moves to foundations that can't make the game harder, in an order
+        they can be run in: aces, twos and cards at most one rank above
+        both foundations of the other color. Cards of the waste are left
+        when drawing 3 at a time, since taking one changes the cards that
+        later draws turn up.
+        """
+        moves: List[Action] = []
+        heights = [foundation.height for foundation in self._foundation_by_suit]
+        lengths = [len(pile.codes) for pile in self._piles]
+        waste_codes = self._waste.codes
+        waste_length = len(waste_codes) if self._draw_count == 1 else 0
+        moved = True
+        while moved:
+            moved = False
+            for i, pile in enumerate(self._piles):
+                codes = pile.codes
+                length = lengths[i]
+                while length and _is_safe_move(codes[length - 1], heights):
+                    length -= 1
+                    suit = codes[length] // 13
+                    heights[suit] += 1
+                    moves.append(PILE_TO_FOUNDATION_ACTIONS[i][suit])
+                    moved = True
+                lengths[i] = length
+            while waste_length and _is_safe_move(waste_codes[waste_length - 1], heights):
+                waste_length -= 1
+                suit = waste_codes[waste_length] // 13
+                heights[suit] += 1
+                moves.append(WASTE_TO_FOUNDATION_ACTIONS[suit])
+                moved = True
+        return moves
+
+    def play_safe_moves(self) -> Optional[Action]:
+        """
+        Run the safe moves to foundations as one action and return it, or
+        None if there are none.
+        """
+        moves = self.safe_foundation_moves()
+        if not moves:
+            return None
+        action = AutoPlayAction(actions=tuple(moves))
+        self.run_action(action)
+        return action
+
+    def can_auto_complete(self) -> bool:
+        """
+        Whether the game isn't won yet and all the pile cards are face up.
+        """
+        return not self.is_won() and all(pile.revealed_count == len(pile.codes) for pile in self._piles)
+
+    def auto_complete(self) -> Optional[Action]:
+        """
+        Finish a game whose pile cards are all face up as one action, which
+        moves cards to foundations and draws, and return it. Returns None
+        if the game can't be finished that way, which happens only when
+        drawing 3 cards at a time.
+        """
+        if not self.can_auto_complete():
+            return None
+        # with all the cards face up, the lowest card that isn't on a
+        # foundation is never under a pile card, so it can always be played
+        line = self.fork()
+        line._auto_play = False
+        start_length = line._history.length
+        stalled_draws = 0
+        while not line.is_won():
+            action = next(line.iter_actions(), None)
+            if isinstance(action, (MoveFromPileToFoundationAction, MoveFromWasteToFoundationAction)):
+                stalled_draws = 0
+            elif (line._deck.codes or line._waste.codes) and stalled_draws <= len(line._deck.codes) + len(line._waste.codes):
+                action = draw_action(self._draw_count)
+                stalled_draws += 1
+            else:
+                # a whole pass through the deck without a play
+                return None
+            line.run_action(action)
+        action = AutoCompleteAction(actions=tuple(line._history.actions[start_length:]))
+        self.run_action(action)
+        return action
+
+    def _apply_action(self, action: Action) -> ActionDelta:
+        apply = self._APPLY.get(action.__class__)
+        if apply is None:
+            if isinstance(action, MacroAction):
+                return self._apply_macro(action)
             raise Exception(f'Invalid action: {action}')
-        self._history.push(action)
+        return apply(self, action)
 
     def undo(self):
         if self._history.length == 0:
             return
-        self._history.pop()
-        game2 = Game.create(self.seed)
-        for action in self._history.actions:
-            game2.run_action(action)
-        # replace attributes in current game from the replayed game
-        self.__dict__.update(game2.__dict__)
+        self._make_writable(self._history.actions[-1])
+        delta = self._history.last_delta
+        action = self._history.pop()
+        self._unapply_action(action, delta)
+
+    def redo(self) -> Optional[Action]:
+        """
+        Run the last undone action again and return it, or None if there is
+        nothing to redo. Running any other action discards the undone ones.
+        """
+        redo_actions = self._history.redo_actions
+        if not redo_actions:
+            return None
+        action = redo_actions[-1]
+        self._make_writable(action)
+        if self._history.push_redo(self._apply_action(action)):
+            self._history.add_checkpoint(self._snapshot())
+        return action
+
+    def seek(self, length: int):
+        """
+        Undo or redo actions until `length` actions of the history are done.
+        Far seeks restore the closest snapshot of History and redo at most
+        its checkpoint interval of actions from there.
+        """
+        history = self._history
+        if not 0 <= length <= history.end:
+            raise ValueError(f'Cannot seek to {length} actions of {history.end}')
+        checkpoint = history.checkpoint_before(length)
+        if checkpoint is not None and length - checkpoint[0] < abs(length - history.length):
+            if not self._owned & _OWN_HISTORY:
+                self._history = history = history.copy()
+                self._owned |= _OWN_HISTORY
+            history.move(checkpoint[0])
+            self._restore(checkpoint[1])
+        # undo() and redo() copy the history if it is shared
+        while self._history.length > length:
+            self.undo()
+        while self._history.length < length:
+            self.redo()
+
+    def _snapshot(self) -> bytes:
+        """
+        The state in a few bytes: the Zobrist hash, the foundation heights
+        and the length prefixed codes of the deck, the waste and the piles
+        with their revealed counts.
+        """
+        deck_codes = self._deck.codes
+        waste_codes = self._waste.codes
+        parts = [
+            self._zobrist_hash.to_bytes(8, 'little'),
+            bytes(foundation.height for foundation in self._foundations),
+            bytes((len(deck_codes),)), deck_codes,
+            bytes((len(waste_codes),)), waste_codes,
+        ]
+        for pile in self._piles:
+            parts.append(bytes((len(pile.codes), pile.revealed_count)))
+            parts.append(pile.codes)
+        return b''.join(parts)
+
+    def _restore(self, snapshot: bytes):
+        """
+        Replace the state with new containers made from `snapshot`.
+        """
+        self._zobrist_hash = int.from_bytes(snapshot[:8], 'little')
+        position = 8 + len(self._foundations)
+        self._foundations = [
+            Foundation.from_height(foundation.suit, height)
+            for foundation, height in zip(self._foundations, snapshot[8:position])
+        ]
+        self._foundation_by_suit = sorted(self._foundations, key=lambda f: f.suit.value)
+        length = snapshot[position]
+        self._deck = Deck.from_codes(bytearray(snapshot[position + 1:position + 1 + length]), self._deck.seed)
+        position += 1 + length
+        length = snapshot[position]
+        self._waste = Waste.from_codes(bytearray(snapshot[position + 1:position + 1 + length]))
+        position += 1 + length
+        piles = []
+        for _ in self._piles:
+            length = snapshot[position]
+            revealed_count = snapshot[position + 1]
+            piles.append(Pile.from_codes(bytearray(snapshot[position + 2:position + 2 + length]), revealed_count))
+            position += 2 + length
+        self._piles = piles
+        self._init_indexes()
+        self._owned = _OWN_ALL
+
+    def _unapply_action(self, action: Action, delta: ActionDelta):
+        unapply = self._UNAPPLY.get(action.__class__)
+        if unapply is None:
+            if isinstance(action, MacroAction):
+                for primitive, part in reversed(list(zip(action.expand(), delta.parts))):
+                    self._unapply_action(primitive, part)
+                return
+            raise Exception(f'Invalid action: {action}')
+        unapply(self, action, delta)
+
+    # each kind of action is applied, undone and hashed by its own methods,
+    # which also update the pile tops and the Zobrist hash. The hash keys
+    # are computed from the state right after the action: XOR is its own
+    # inverse, so the same key applies the action to the hash and undoes it.
+
+    def _apply_macro(self, action: MacroAction) -> ActionDelta:
+        primitives = action.expand()
+        parts: List[ActionDelta] = []
+        try:
+            for primitive in primitives:
+                parts.append(self._apply_action(primitive))
+        except (IndexError, ValueError) as ex:
+            for primitive, part in reversed(list(zip(primitives, parts))):
+                self._unapply_action(primitive, part)
+            raise ex
+        return ActionDelta(parts=tuple(parts))
+
+    def _apply_draw(self, action: DrawFromDeckAction) -> ActionDelta:
+        count = action.count
+        if count < 1:
+            raise ValueError(f'Cannot draw {count} cards')
+        deck = self._deck
+        waste = self._waste
+        recycled = False
+        if len(deck.codes) == 0:
+            if len(waste.codes) == 0:
+                raise ValueError('Cannot draw from an empty deck')
+            deck.refill(waste.take_all())
+            recycled = True
+        drawn_count = min(count, len(deck.codes))
+        for _ in range(drawn_count):
+            waste.push_code(deck.pop_code())
+        if drawn_count <= MAX_DRAW_COUNT:
+            delta = DRAW_DELTAS[recycled][drawn_count]
+        else:
+            delta = ActionDelta(recycled=recycled, drawn_count=drawn_count)
+        self._zobrist_hash ^= self._draw_key(delta)
+        return delta
+
+    def _unapply_draw(self, action: DrawFromDeckAction, delta: ActionDelta):
+        self._zobrist_hash ^= self._draw_key(delta)
+        for _ in range(delta.drawn_count):
+            self._deck.push_code(self._waste.pop_code())
+        if delta.recycled:
+            self._waste.refill(self._deck.take_all())
+
+    def _draw_key(self, delta: ActionDelta) -> int:
+        key = zobrist.key
+        h = 0
+        deck_codes = self._deck.codes
+        waste_codes = self._waste.codes
+        drawn_count = delta.drawn_count
+        if delta.recycled:
+            # the previous waste is now in the deck in reverse order,
+            # except for its bottom cards which are the new waste
+            last_position = len(deck_codes) + drawn_count - 1
+            for i, code in enumerate(deck_codes):
+                h ^= key(code, zobrist.DECK, i, False) ^ key(code, zobrist.WASTE, last_position - i, True)
+        else:
+            # the drawn cards were turned over one by one from the top
+            deck_length = len(deck_codes)
+            waste_position = len(waste_codes) - drawn_count
+            for i in range(drawn_count):
+                code = waste_codes[waste_position + i]
+                h ^= key(code, zobrist.WASTE, waste_position + i, True) ^ key(code, zobrist.DECK, deck_length + drawn_count - 1 - i, False)
+        return h
+
+    def _apply_waste_to_pile(self, action: MoveFromWasteToPileAction) -> ActionDelta:
+        target_pile_index = action.target_pile_index
+        code = self._waste.pop_code()
+        try:
+            self._piles[target_pile_index].push_code(code)
+        except (IndexError, ValueError) as ex:
+            self._waste.push_code(code)
+            raise ex
+        self._update_pile_top(target_pile_index)
+        self._zobrist_hash ^= self._waste_to_pile_key(target_pile_index)
+        return NO_DELTA
+
+    def _unapply_waste_to_pile(self, action: MoveFromWasteToPileAction, delta: ActionDelta):
+        target_pile_index = action.target_pile_index
+        self._zobrist_hash ^= self._waste_to_pile_key(target_pile_index)
+        self._waste.push_code(self._piles[target_pile_index].draw_codes(1)[0])
+        self._update_pile_top(target_pile_index)
+
+    def _waste_to_pile_key(self, target_pile_index: int) -> int:
+        pile_codes = self._piles[target_pile_index].codes
+        code = pile_codes[-1]
+        return (
+            zobrist.key(code, zobrist.PILE + target_pile_index, len(pile_codes) - 1, True)
+            ^ zobrist.key(code, zobrist.WASTE, len(self._waste.codes), True)
+        )
+
+    def _apply_foundation_to_pile(self, action: MoveFromFoundationToPileAction) -> ActionDelta:
+        target_pile_index = action.target_pile_index
+        source_foundation = self._get_foundation(action.source_foundation_suit)
+        code = source_foundation.pop_code()
+        try:
+            self._piles[target_pile_index].push_code(code)
+        except (IndexError, ValueError) as ex:
+            source_foundation.push_code(code)
+            raise ex
+        self._update_pile_top(target_pile_index)
+        self._zobrist_hash ^= self._foundation_to_pile_key(target_pile_index)
+        return NO_DELTA
+
+    def _unapply_foundation_to_pile(self, action: MoveFromFoundationToPileAction, delta: ActionDelta):
+        target_pile_index = action.target_pile_index
+        self._zobrist_hash ^= self._foundation_to_pile_key(target_pile_index)
+        code = self._piles[target_pile_index].draw_codes(1)[0]
+        self._get_foundation(action.source_foundation_suit).push_code(code)
+        self._update_pile_top(target_pile_index)
+
+    def _foundation_to_pile_key(self, target_pile_index: int) -> int:
+        pile_codes = self._piles[target_pile_index].codes
+        code = pile_codes[-1]
+        return (
+            zobrist.key(code, zobrist.PILE + target_pile_index, len(pile_codes) - 1, True)
+            ^ zobrist.key(code, zobrist.FOUNDATION, RANK_VALUES[code] - 1, True)
+        )
+
+    def _apply_pile_to_pile(self, action: MoveFromPileToPileAction) -> ActionDelta:
+        source_pile_index = action.source_pile_index
+        target_pile_index = action.target_pile_index
+        count = action.count
+        source_pile = self._piles[source_pile_index]
+        target_pile = self._piles[target_pile_index]
+        revealed = self._reveals(source_pile, count)
+        codes = source_pile.draw_codes(count)
+        moved_count = 0
+        try:
+            for code in codes:
+                target_pile.push_code(code)
+                moved_count += 1
+        except (IndexError, ValueError) as ex:
+            if moved_count > 0:
+                target_pile.draw_codes(moved_count)
+            source_pile.undraw(codes, revealed)
+            raise ex
+        self._update_pile_top(source_pile_index)
+        self._update_pile_top(target_pile_index)
+        delta = REVEALED_DELTA if revealed else NO_DELTA
+        self._zobrist_hash ^= self._pile_to_pile_key(action, delta)
+        return delta
+
+    def _unapply_pile_to_pile(self, action: MoveFromPileToPileAction, delta: ActionDelta):
+        self._zobrist_hash ^= self._pile_to_pile_key(action, delta)
+        codes = self._piles[action.target_pile_index].draw_codes(action.count)
+        self._piles[action.source_pile_index].undraw(codes, delta.revealed)
+        self._update_pile_top(action.source_pile_index)
+        self._update_pile_top(action.target_pile_index)
+
+    def _pile_to_pile_key(self, action: MoveFromPileToPileAction, delta: ActionDelta) -> int:
+        key = zobrist.key
+        h = 0
+        count = action.count
+        source_location = zobrist.PILE + action.source_pile_index
+        target_location = zobrist.PILE + action.target_pile_index
+        source_position = len(self._piles[action.source_pile_index].codes)
+        target_codes = self._piles[action.target_pile_index].codes
+        target_position = len(target_codes) - count
+        for i in range(count):
+            code = target_codes[target_position + i]
+            h ^= key(code, source_location, source_position + i, True) ^ key(code, target_location, target_position + i, True)
+        if delta.revealed:
+            h ^= self._zobrist_reveal_key(action.source_pile_index)
+        return h
+
+    def _apply_waste_to_foundation(self, action: MoveFromWasteToFoundationAction) -> ActionDelta:
+        target_foundation = self._get_foundation(action.target_foundation_suit)
+        code = self._waste.pop_code()
+        try:
+            target_foundation.push_code(code)
+        except (IndexError, ValueError) as ex:
+            self._waste.push_code(code)
+            raise ex
+        self._zobrist_hash ^= self._waste_to_foundation_key(code)
+        return NO_DELTA
+
+    def _unapply_waste_to_foundation(self, action: MoveFromWasteToFoundationAction, delta: ActionDelta):
+        target_foundation = self._get_foundation(action.target_foundation_suit)
+        self._zobrist_hash ^= self._waste_to_foundation_key(target_foundation.top_code)
+        self._waste.push_code(target_foundation.pop_code())
+
+    def _waste_to_foundation_key(self, code: int) -> int:
+        return (
+            zobrist.key(code, zobrist.FOUNDATION, RANK_VALUES[code] - 1, True)
+            ^ zobrist.key(code, zobrist.WASTE, len(self._waste.codes), True)
+        )
+
+    def _apply_pile_to_foundation(self, action: MoveFromPileToFoundationAction) -> ActionDelta:
+        source_pile_index = action.source_pile_index
+        source_pile = self._piles[source_pile_index]
+        target_foundation = self._get_foundation(action.target_foundation_suit)
+        revealed = self._reveals(source_pile, 1)
+        codes = source_pile.draw_codes(1)
+        try:
+            target_foundation.push_code(codes[0])
+        except (IndexError, ValueError) as ex:
+            source_pile.undraw(codes, revealed)
+            raise ex
+        self._update_pile_top(source_pile_index)
+        delta = REVEALED_DELTA if revealed else NO_DELTA
+        self._zobrist_hash ^= self._pile_to_foundation_key(source_pile_index, codes[0], revealed)
+        return delta
+
+    def _unapply_pile_to_foundation(self, action: MoveFromPileToFoundationAction, delta: ActionDelta):
+        source_pile_index = action.source_pile_index
+        target_foundation = self._get_foundation(action.target_foundation_suit)
+        code = target_foundation.top_code
+        self._zobrist_hash ^= self._pile_to_foundation_key(source_pile_index, code, delta.revealed)
+        target_foundation.pop_code()
+        self._piles[source_pile_index].undraw(bytearray((code,)), delta.revealed)
+        self._update_pile_top(source_pile_index)
+
+    def _pile_to_foundation_key(self, source_pile_index: int, code: int, revealed: bool) -> int:
+        h = (
+            zobrist.key(code, zobrist.FOUNDATION, RANK_VALUES[code] - 1, True)
+            ^ zobrist.key(code, zobrist.PILE + source_pile_index, len(self._piles[source_pile_index].codes), True)
+        )
+        if revealed:
+            h ^= self._zobrist_reveal_key(source_pile_index)
+        return h
+
+    _APPLY = {
+        DrawFromDeckAction: _apply_draw,
+        MoveFromWasteToPileAction: _apply_waste_to_pile,
+        MoveFromFoundationToPileAction: _apply_foundation_to_pile,
+        MoveFromPileToPileAction: _apply_pile_to_pile,
+        MoveFromWasteToFoundationAction: _apply_waste_to_foundation,
+        MoveFromPileToFoundationAction: _apply_pile_to_foundation,
+    }
+    _UNAPPLY = {
+        DrawFromDeckAction: _unapply_draw,
+        MoveFromWasteToPileAction: _unapply_waste_to_pile,
+        MoveFromFoundationToPileAction: _unapply_foundation_to_pile,
+        MoveFromPileToPileAction: _unapply_pile_to_pile,
+        MoveFromWasteToFoundationAction: _unapply_waste_to_foundation,
+        MoveFromPileToFoundationAction: _unapply_pile_to_foundation,
+    }
+
+    def _update_pile_top(self, pile_index: int):
+        codes = self._piles[pile_index].codes
+        top = codes[-1] if codes else NO_CARD
+        old_top = self._pile_tops[pile_index]
+        if top == old_top:
+            return
+        bit = 1 << pile_index
+        accepting_piles = self._accepting_piles
+        if old_top == NO_CARD:
+            self._empty_piles &= ~bit
+        else:
+            for child in CHILDREN[old_top]:
+                accepting_piles[child] &= ~bit
+        if top == NO_CARD:
+            self._empty_piles |= bit
+        else:
+            for child in CHILDREN[top]:
+                accepting_piles[child] |= bit
+        self._pile_tops[pile_index] = top
+
+    def _target_piles(self, code: int) -> int:
+        """
+        Bitmask of the piles that the card with `code` can be pushed onto.
+        """
+        if RANK_VALUES[code] == KING:
+            return self._empty_piles
+        return self._accepting_piles[code]
+
+    def _zobrist_reveal_key(self, pile_index: int) -> int:
+        pile_codes = self._piles[pile_index].codes
+        code = pile_codes[-1]
+        position = len(pile_codes) - 1
+        location = zobrist.PILE + pile_index
+        return zobrist.key(code, location, position, False) ^ zobrist.key(code, location, position, True)
+
+    def _get_foundation(self, suit: Suit) -> Foundation:
+        return self._foundation_by_suit[suit.value - 1]
+
+    @staticmethod
+    def _reveals(pile: Pile, count: int) -> bool:
+        # drawing the whole revealed run turns the next card face up
+        return count == pile.revealed_count and len(pile.codes) > count
 
     def get_possible_actions(self) -> List[Action]:
-        actions = []
+        # the actions are the shared instances of klondike.actions, and the
+        # loops are inlined, so that only the list is allocated
+        actions: List[Action] = []
+        piles = self._piles
+        foundation_by_suit = self._foundation_by_suit
+        accepting_piles = self._accepting_piles
+        empty_piles = self._empty_piles
         # source: pile
-        for i, pile in enumerate(self._piles):
-            if pile.top:
-                # target: foundation
-                foundation = next(f for f in self._foundations if f.suit == pile.top.suit)
-                if (
-                    foundation.top and foundation.top.rank.value == pile.top.rank.value - 1
-                    or pile.top.rank == Rank.ACE
-                ):
-                    actions.append(MoveFromPileToFoundationAction(source_pile_index=i, target_foundation_suit=foundation.suit))
-                # target: pile
-                for j, pile2 in enumerate(self._piles):
-                    if i == j:
-                        continue
-                    for k in range(1, pile.revealed_count + 1):
-                        if (
-                            (
-                                pile2.top is None
-                                and pile.cards[-k] is not None
-                                and pile.cards[-k].rank is Rank.KING
-                            ) or (
-                                pile2.top is not None
-                                and pile.cards[-k] is not None
-                                and pile.cards[-k].suit.color != pile2.top.suit.color
-                                and pile.cards[-k].rank.value + 1 == pile2.top.rank.value
-                            )
-                        ):
-                            actions.append(MoveFromPileToPileAction(source_pile_index=i, target_pile_index=j, count=k))
+        for i, pile in enumerate(piles):
+            codes = pile.codes
+            if not codes:
+                continue
+            top = codes[-1]
+            # target: foundation
+            suit_index = top // 13
+            if foundation_by_suit[suit_index].height == RANK_VALUES[top] - 1:
+                actions.append(PILE_TO_FOUNDATION_ACTIONS[i][suit_index])
+            # target: pile
+            # a run has one card of each rank, so each target accepts at most one card of it
+            first = len(actions)
+            by_target = PILE_TO_PILE_ACTIONS[i]
+            not_source = ~(1 << i)
+            for k in range(1, pile.revealed_count + 1):
+                code = codes[-k]
+                targets = (empty_piles if RANK_VALUES[code] == KING else accepting_piles[code]) & not_source
+                while targets:
+                    j = (targets & -targets).bit_length() - 1
+                    targets &= targets - 1
+                    actions.append(by_target[j][k - 1])
+            if len(actions) - first > 1:
+                actions[first:] = sorted(actions[first:], key=_target_pile_index)
         # source: waste
-        if self._waste.top is not None:
+        waste_codes = self._waste.codes
+        if waste_codes:
+            top = waste_codes[-1]
             # target: foundation
-            foundation = next(f for f in self._foundations if f.suit == self._waste.top.suit)
-            if (
-                foundation.top and foundation.top.rank.value == self._waste.top.rank.value - 1
-                or self._waste.top.rank == Rank.ACE
-            ):
-                actions.append(MoveFromWasteToFoundationAction(target_foundation_suit=foundation.suit))
+            suit_index = top // 13
+            if foundation_by_suit[suit_index].height == RANK_VALUES[top] - 1:
+                actions.append(WASTE_TO_FOUNDATION_ACTIONS[suit_index])
             # target: pile
-            for i, pile in enumerate(self._piles):
-                if (
-                    (
-                        pile.top is None
-                        and self._waste.top.rank is Rank.KING
-                    ) or (
-                        pile.top is not None
-                        and self._waste.top.suit.color != pile.top.suit.color
-                        and self._waste.top.rank.value + 1 == pile.top.rank.value
-                    )
-                ):
-                    actions.append(MoveFromWasteToPileAction(target_pile_index=i))
+            targets = self._target_piles(top)
+            while targets:
+                i = (targets & -targets).bit_length() - 1
+                targets &= targets - 1
+                actions.append(WASTE_TO_PILE_ACTIONS[i])
         # source: foundation
         for foundation in self._foundations:
-            if foundation.top is None:
+            if foundation.height == 0:
                 continue
-            for i, pile in enumerate(self._piles):
-                if (
-                    (
-                        pile.top is None
-                        and foundation.top.rank is Rank.KING
-                    ) or (
-                        pile.top is not None
-                        and foundation.top.suit.color != pile.top.suit.color
-                        and foundation.top.rank.value + 1 == pile.top.rank.value
-                    )
-                ):
-                    actions.append(MoveFromFoundationToPileAction(target_pile_index=i, source_foundation_suit=foundation.suit))
+            by_target = FOUNDATION_TO_PILE_ACTIONS[foundation.suit.value - 1]
+            targets = self._target_piles(foundation.top_code)
+            while targets:
+                i = (targets & -targets).bit_length() - 1
+                targets &= targets - 1
+                actions.append(by_target[i])
         # source: deck
-        if self._deck.top or self._waste.top:
-            actions.append(DrawFromDeckAction())
+        if self._deck.codes or waste_codes:
+            actions.append(draw_action(self._draw_count))
+        return actions
+
+    def iter_actions(self) -> Iterator[Action]:
+        """
+        Lazily generate the actions of get_possible_actions(), moves to
+        foundations first, then moves between piles, from the waste to piles,
+        from foundations to piles and drawing from the deck.
+        """
+        piles = self._piles
+        foundation_by_suit = self._foundation_by_suit
+        for i, top in enumerate(self._pile_tops):
+            if top != NO_CARD:
+                foundation = foundation_by_suit[top // 13]
+                if foundation.height == RANK_VALUES[top] - 1:
+                    yield PILE_TO_FOUNDATION_ACTIONS[i][top // 13]
+        waste_codes = self._waste.codes
+        if waste_codes:
+            top = waste_codes[-1]
+            foundation = foundation_by_suit[top // 13]
+            if foundation.height == RANK_VALUES[top] - 1:
+                yield WASTE_TO_FOUNDATION_ACTIONS[top // 13]
+        for i in range(len(piles)):
+            yield from self._iter_pile_to_pile_actions(i)
+        if waste_codes:
+            yield from self._iter_waste_to_pile_actions()
+        yield from self._iter_foundation_to_pile_actions()
+        if self._deck.codes or waste_codes:
+            yield draw_action(self._draw_count)
+
+    def get_macro_actions(self) -> List[Action]:
+        """
+        Plays of the waste top after drawing from the deck one or more times,
+        each as a single action that draws and plays the card. One action is
+        generated for every state the stock goes through, so together with
+        the plays of get_possible_actions() these reach every state that
+        drawing and then playing from the waste reaches.
+        """
+        actions: List[Action] = []
+        deck = bytearray(self._deck.codes)
+        waste = bytearray(self._waste.codes)
+        draw_count = self._draw_count
+        foundation_by_suit = self._foundation_by_suit
+        # drawing only turns the stock over, so its state is the length of
+        # the waste, and the states repeat after at most two passes
+        seen = bytearray(len(deck) + len(waste) + 1)
+        seen[len(waste)] = 1
+        draws = 0
+        while deck or waste:
+            if not deck:
+                deck = waste[::-1]
+                waste = bytearray()
+            drawn_count = min(draw_count, len(deck))
+            waste += deck[:-drawn_count - 1:-1]
+            del deck[-drawn_count:]
+            draws += 1
+            if seen[len(waste)]:
+                break
+            seen[len(waste)] = 1
+            code = waste[-1]
+            foundation = foundation_by_suit[code // 13]
+            if foundation.height == RANK_VALUES[code] - 1:
+                actions.append(MoveFromStockToFoundationAction(draws=draws, draw_count=draw_count, target_foundation_suit=foundation.suit))
+            targets = self._target_piles(code)
+            while targets:
+                i = (targets & -targets).bit_length() - 1
+                targets &= targets - 1
+                actions.append(MoveFromStockToPileAction(draws=draws, draw_count=draw_count, target_pile_index=i))
         return actions
 
+    def _iter_pile_to_pile_actions(self, source_pile_index: int) -> Iterator[Action]:
+        pile = self._piles[source_pile_index]
+        codes = pile.codes
+        by_target = PILE_TO_PILE_ACTIONS[source_pile_index]
+        not_source = ~(1 << source_pile_index)
+        for k in range(1, pile.revealed_count + 1):
+            targets = self._target_piles(codes[-k]) & not_source
+            while targets:
+                j = (targets & -targets).bit_length() - 1
+                targets &= targets - 1
+                yield by_target[j][k - 1]
+
+    def _iter_waste_to_pile_actions(self) -> Iterator[Action]:
+        targets = self._target_piles(self._waste.codes[-1])
+        while targets:
+            i = (targets & -targets).bit_length() - 1
+            targets &= targets - 1
+            yield WASTE_TO_PILE_ACTIONS[i]
+
+    def _iter_foundation_to_pile_actions(self) -> Iterator[Action]:
+        for foundation in self._foundations:
+            if foundation.height == 0:
+                continue
+            by_target = FOUNDATION_TO_PILE_ACTIONS[foundation.suit.value - 1]
+            targets = self._target_piles(foundation.top_code)
+            while targets:
+                i = (targets & -targets).bit_length() - 1
+                targets &= targets - 1
+                yield by_target[i]
+
+    def hint(self, deadline_ms: float = 50.0) -> Hint:
+        """
+        Best action found within `deadline_ms` milliseconds, with its score
+        and principal variation, see klondike.hint. Caches are kept between
+        calls, so hints along a game get cheaper.
+        """
+        if self._hint_engine is None:
+            from .hint import HintEngine
+            self._hint_engine = HintEngine()
+        # searched on a fork, which leaves the actions to redo alone, and
+        # without auto play, which would run actions the engine didn't choose
+        line = self.fork()
+        line._auto_play = False
+        return self._hint_engine.hint(line, deadline_ms)
+
+    def zobrist_hash(self) -> int:
+        """
+        Fast 64-bit hash of the state, updated incrementally by run_action()
+        and undo(). Unlike sha256_hash() it isn't meant to be stored.
+        """
+        return self._zobrist_hash
+
     def sha256_hash(self) -> bytes:
         return hashlib.sha256(
             self._deck.sha256_hash()
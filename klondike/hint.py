@@ -0,0 +1,193 @@
+"""
+Time-budgeted hints for a game in progress, see Game.hint().
+
+A hint first runs the solver for most of the deadline. If it finds a win,
+the hint is its first action, which is the same action an unlimited
+search would suggest whenever the win is found in time. Otherwise the
+rest of the deadline goes to an iterative deepening search of the
+position's heuristic value and the hint is the best action of the deepest
+finished iteration.
+
+HintEngine keeps caches between hints: winning lines found by the solver
+indexed by their states, so following a hint gives the next one for
+free, and the heuristic values of searched states.
+"""
+from __future__ import annotations
+from typing import (
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+import time
+from .game import Game
+from .actions import (
+    Action,
+)
+from .solver import (
+    SolveStatus,
+    Solver,
+)
+
+# score of a won position, minus the number of moves to get there
+WIN_SCORE = 100000
+# score of a position proven lost
+LOST_SCORE = -100000
+# share of the deadline given to the solver
+SOLVER_SHARE = 0.6
+# share of the deadline searched, the rest is left for the overhead
+SEARCH_SHARE = 0.8
+# nodes between deadline checks
+CHECK_INTERVAL = 32
+# longest principal variation returned
+PV_LENGTH = 20
+# cached heuristic values kept before the cache is cleared
+MAX_CACHE_SIZE = 200000
+
+class Hint(NamedTuple):
+    action: Optional[Action]
+    score: int
+    # principal variation, starting with `action`
+    pv: List[Action]
+    # search depth of the heuristic search, or length of the winning line
+    depth: int
+    solved: bool
+
+class _Timeout(Exception):
+    pass
+
+def evaluate(game: Game) -> int:
+    """
+    Heuristic value of a position: cards on foundations are worth the
+    most, face-down cards and cards in the stock count against it.
+    """
+    if game.is_won():
+        return WIN_SCORE
+    score = 20 * sum(foundation.height for foundation in game.foundations)
+    for pile in game.piles:
+        score -= 10 * (len(pile.codes) - pile.revealed_count)
+        if not pile.codes:
+            score += 5
+    score -= len(game.deck.codes) + len(game.waste.codes)
+    return score
+
+class HintEngine:
+    def __init__(self):
+        # remaining winning line from each state of the solutions found
+        self._lines: Dict[int, Tuple[List[Action], int]] = {}
+        # state hash -> searched depth, value and the index of the best
+        # action in get_possible_actions(), -1 if there is none
+        self._values: Dict[int, Tuple[int, int, int]] = {}
+        self._nodes = 0
+
+    def hint(self, game: Game, deadline_ms: float = 50.0) -> Hint:
+        """
+        Best action found for `game` within `deadline_ms` milliseconds.
+        The game is searched in place and left in its original state.
+        """
+        budget = deadline_ms / 1000 * SEARCH_SHARE
+        deadline = time.monotonic() + budget
+        line = self._lines.get(game.zobrist_hash())
+        if line is not None:
+            return self._line_hint(*line)
+        if game.is_won():
+            return Hint(None, WIN_SCORE, [], 0, True)
+        solver = Solver(
+            time_limit=budget * SOLVER_SHARE,
+            time_check_interval=CHECK_INTERVAL,
+        )
+        result = solver.solve(game)
+        if result.status is SolveStatus.SOLVED:
+            assert result.actions is not None
+            self._add_line(game, result.actions)
+            return self._line_hint(result.actions, 0)
+        hint = self._search(game, deadline)
+        if result.status is SolveStatus.UNSOLVABLE:
+            return hint._replace(score=LOST_SCORE)
+        return hint
+
+    def _line_hint(self, actions: List[Action], index: int) -> Hint:
+        pv = actions[index:index + PV_LENGTH]
+        return Hint(pv[0], WIN_SCORE - (len(actions) - index), pv, len(actions) - index, True)
+
+    def _add_line(self, game: Game, actions: List[Action]):
+        line = game.fork()
+        for i, action in enumerate(actions):
+            self._lines[line.zobrist_hash()] = (actions, i)
+            line.run_action(action)
+
+    def _search(self, game: Game, deadline: float) -> Hint:
+        """
+        Iterative deepening until the deadline, keeping the result of the
+        deepest finished iteration.
+        """
+        if len(self._values) > MAX_CACHE_SIZE:
+            self._values.clear()
+        best: Optional[Tuple[int, int, int]] = None
+        depth = 1
+        start_length = game.history.length
+        try:
+            while True:
+                self._value(game, depth, deadline)
+                best = self._values[game.zobrist_hash()]
+                if best[2] < 0:
+                    # no actions
+                    break
+                depth += 1
+        except _Timeout:
+            while game.history.length > start_length:
+                game.undo()
+        if best is None:
+            actions = game.get_possible_actions()
+            action = actions[0] if actions else None
+            return Hint(action, evaluate(game), [] if action is None else [action], 0, False)
+        pv = self._pv(game)
+        return Hint(pv[0] if pv else None, best[1], pv, best[0], False)
+
+    def _value(self, game: Game, depth: int, deadline: float) -> int:
+        state_hash = game.zobrist_hash()
+        cached = self._values.get(state_hash)
+        if cached is not None and cached[0] >= depth:
+            return cached[1]
+        self._nodes += 1
+        if self._nodes % CHECK_INTERVAL == 0 and time.monotonic() >= deadline:
+            raise _Timeout()
+        if game.is_won():
+            return WIN_SCORE
+        actions = game.get_possible_actions()
+        if depth == 0 or not actions:
+            value = evaluate(game)
+            self._values[state_hash] = (depth, value, -1)
+            return value
+        order = list(range(len(actions)))
+        if cached is not None and cached[2] > 0:
+            # try the best action of the previous iteration first
+            order[0], order[cached[2]] = cached[2], 0
+        best_value = None
+        best_index = -1
+        for i in order:
+            game.run_action(actions[i])
+            value = self._value(game, depth - 1, deadline)
+            game.undo()
+            if best_value is None or value > best_value:
+                best_value = value
+                best_index = i
+        assert best_value is not None
+        self._values[state_hash] = (depth, best_value, best_index)
+        return best_value
+
+    def _pv(self, game: Game) -> List[Action]:
+        pv = []
+        seen = set()
+        while len(pv) < PV_LENGTH:
+            entry = self._values.get(game.zobrist_hash())
+            if entry is None or entry[2] < 0 or game.zobrist_hash() in seen:
+                break
+            seen.add(game.zobrist_hash())
+            action = game.get_possible_actions()[entry[2]]
+            pv.append(action)
+            game.run_action(action)
+        for _ in pv:
+            game.undo()
+        return pv
@@ -1,13 +1,84 @@
+from __future__ import annotations
 from typing import (
     List,
+    NamedTuple,
+    Optional,
+    Tuple,
 )
 from .actions import (
+    MAX_DRAW_COUNT,
     Action,
+    expand_actions,
 )
 
+class ActionDelta(NamedTuple):
+    """
+    State change of an action that can't be derived from the action itself.
+    Together with the action this is enough to undo it without a replay.
+    """
+    # a face-down card of the source pile was revealed
+    revealed: bool = False
+    # the waste was turned over into the deck before drawing
+    recycled: bool = False
+    # number of cards drawn from the deck
+    drawn_count: int = 1
+    # deltas of the primitive actions of a macro action
+    parts: Tuple[ActionDelta, ...] = ()
+
+    def recycles(self) -> bool:
+        """
+        Whether the waste was turned over, also by a part of a macro action.
+        """
+        return self.recycled or any(part.recycles() for part in self.parts)
+
+NO_DELTA = ActionDelta()
+REVEALED_DELTA = ActionDelta(revealed=True)
+RECYCLED_DELTA = ActionDelta(recycled=True)
+# deltas of drawing by recycled and drawn count, so that drawing doesn't allocate
+DRAW_DELTAS = tuple(
+    tuple(
+        ActionDelta(recycled=recycled, drawn_count=drawn_count)
+        for drawn_count in range(MAX_DRAW_COUNT + 1)
+    )
+    for recycled in (False, True)
+)
+
+# actions between snapshots of the state, see Game.seek()
+CHECKPOINT_INTERVAL = 32
+# snapshots kept before every other one is dropped and the interval doubled
+MAX_CHECKPOINTS = 256
+
 class History:
-    def __init__(self):
+    """
+    The actions run so far with their deltas, the actions undone that can
+    be redone, and snapshots of the state after every `checkpoint_interval`
+    actions of both. Snapshots are taken and restored by Game, see
+    Game.seek().
+    """
+    def __init__(self, checkpoint_interval: int = CHECKPOINT_INTERVAL, max_checkpoints: int = MAX_CHECKPOINTS):
+        if checkpoint_interval < 1:
+            raise ValueError(f'Invalid checkpoint interval {checkpoint_interval}')
         self._actions: List[Action] = []
+        self._deltas: List[ActionDelta] = []
+        # undone actions and their deltas, the next one to redo last
+        self._redo_actions: List[Action] = []
+        self._redo_deltas: List[ActionDelta] = []
+        # snapshot i is of the state after (i + 1) * checkpoint_interval actions
+        self._checkpoints: List[bytes] = []
+        self._checkpoint_interval = checkpoint_interval
+        self._max_checkpoints = max_checkpoints
+        # length of the history when the next snapshot is due
+        self._next_checkpoint = checkpoint_interval
+
+    def copy(self) -> History:
+        history = History(self._checkpoint_interval, self._max_checkpoints)
+        history._actions = self._actions.copy()
+        history._deltas = self._deltas.copy()
+        history._redo_actions = self._redo_actions.copy()
+        history._redo_deltas = self._redo_deltas.copy()
+        history._checkpoints = self._checkpoints.copy()
+        history._next_checkpoint = self._next_checkpoint
+        return history
 
     @property
     def length(self) -> int:
@@ -17,8 +88,111 @@ class History:
     def actions(self):
         return self._actions
 
-    def push(self, action: Action):
-        self._actions.append(action)
+    @property
+    def deltas(self) -> List[ActionDelta]:
+        return self._deltas
+
+    @property
+    def last_delta(self) -> ActionDelta:
+        return self._deltas[-1]
+
+    @property
+    def redo_actions(self) -> List[Action]:
+        """
+        The actions that can be redone, the next one last.
+        """
+        return self._redo_actions
+
+    @property
+    def end(self) -> int:
+        """
+        Length of the history with all undone actions redone.
+        """
+        return len(self._actions) + len(self._redo_actions)
+
+    @property
+    def checkpoint_interval(self) -> int:
+        return self._checkpoint_interval
+
+    @property
+    def checkpoint_count(self) -> int:
+        return len(self._checkpoints)
+
+    def primitive_actions(self) -> List[Action]:
+        """
+        The actions with macro actions expanded, for replaying or recording.
+        """
+        return expand_actions(self._actions)
+
+    def push(self, action: Action, delta: ActionDelta = NO_DELTA) -> bool:
+        """
+        Add an action that was run, which discards the actions that could
+        be redone. Returns whether a snapshot of the state is due.
+        """
+        actions = self._actions
+        actions.append(action)
+        self._deltas.append(delta)
+        if self._redo_actions:
+            self._redo_actions.clear()
+            self._redo_deltas.clear()
+            # snapshots after the previous length stay valid
+            del self._checkpoints[(len(actions) - 1) // self._checkpoint_interval:]
+            self._next_checkpoint = (len(self._checkpoints) + 1) * self._checkpoint_interval
+        return len(actions) == self._next_checkpoint
 
     def pop(self) -> Action:
-        return self._actions.pop()
+        """
+        Remove the last action, which was undone, so that it can be redone.
+        """
+        self._redo_deltas.append(self._deltas.pop())
+        action = self._actions.pop()
+        self._redo_actions.append(action)
+        return action
+
+    def push_redo(self, delta: ActionDelta) -> bool:
+        """
+        Add the next action to redo, which was run again.
+        Returns whether a snapshot of the state is due.
+        """
+        self._redo_deltas.pop()
+        self._actions.append(self._redo_actions.pop())
+        self._deltas.append(delta)
+        return len(self._actions) == self._next_checkpoint
+
+    def add_checkpoint(self, snapshot: bytes):
+        """
+        Add the snapshot of the state that push() or push_redo() said was due.
+        """
+        self._checkpoints.append(snapshot)
+        if len(self._checkpoints) > self._max_checkpoints:
+            # keep the snapshots after multiples of twice the interval
+            self._checkpoints = self._checkpoints[1::2]
+            self._checkpoint_interval *= 2
+        self._next_checkpoint = (len(self._checkpoints) + 1) * self._checkpoint_interval
+
+    def checkpoint_before(self, length: int) -> Optional[Tuple[int, bytes]]:
+        """
+        The last snapshot at or before `length` and its history length.
+        """
+        count = min(length // self._checkpoint_interval, len(self._checkpoints))
+        if count == 0:
+            return None
+        return count * self._checkpoint_interval, self._checkpoints[count - 1]
+
+    def move(self, length: int):
+        """
+        Undo or redo actions in the history, not in the game, until its
+        length is `length`. Game.seek() restores the state to match.
+        """
+        actions = self._actions
+        if length < len(actions):
+            self._redo_actions += reversed(actions[length:])
+            self._redo_deltas += reversed(self._deltas[length:])
+            del actions[length:]
+            del self._deltas[length:]
+        elif length > len(actions):
+            count = length - len(actions)
+            actions += reversed(self._redo_actions[-count:])
+            self._deltas += reversed(self._redo_deltas[-count:])
+            del self._redo_actions[-count:]
+            del self._redo_deltas[-count:]
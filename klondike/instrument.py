@@ -0,0 +1,201 @@
+"""
+Opt-in counters and timers for the hot paths of Game.
+
+    with instrument.instrumented():
+        solver.solve(game)
+    print(instrument.snapshot())
+
+Enabling replaces the Game methods with timing wrappers and disabling puts
+the original methods back, so there is no overhead at all while disabled.
+The counters are per process.
+"""
+from __future__ import annotations
+from typing import (
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+)
+import contextlib
+import functools
+import time
+from .game import Game
+from .actions import (
+    Action,
+)
+
+# called with the event name and the seconds it took, for example
+# ('run_action.DrawFromDeckAction', 2.1e-06)
+Hook = Callable[[str, float], None]
+
+class _Counter:
+    __slots__ = ('calls', 'seconds')
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+
+    def add(self, seconds: float):
+        self.calls += 1
+        self.seconds += seconds
+
+    def to_dict(self) -> Dict:
+        return {'calls': self.calls, 'seconds': self.seconds}
+
+_run_action_counters: Dict[str, _Counter] = {}
+_get_possible_actions_counter = _Counter()
+_candidates = 0
+_iter_actions_counter = _Counter()
+_iter_candidates = 0
+_undo_counter = _Counter()
+_sha256_hash_counter = _Counter()
+_hooks: List[Hook] = []
+_originals: Dict[str, Callable] = {}
+
+def _emit(event: str, seconds: float):
+    for hook in _hooks:
+        hook(event, seconds)
+
+def _wrap_run_action(run_action):
+    @functools.wraps(run_action)
+    def wrapper(self: Game, action: Action):
+        start_time = time.perf_counter()
+        try:
+            return run_action(self, action)
+        finally:
+            seconds = time.perf_counter() - start_time
+            name = action.__class__.__name__
+            counter = _run_action_counters.get(name)
+            if counter is None:
+                counter = _run_action_counters[name] = _Counter()
+            counter.add(seconds)
+            if _hooks:
+                _emit('run_action.' + name, seconds)
+    return wrapper
+
+def _wrap_get_possible_actions(get_possible_actions):
+    @functools.wraps(get_possible_actions)
+    def wrapper(self: Game) -> List[Action]:
+        global _candidates
+        start_time = time.perf_counter()
+        actions = get_possible_actions(self)
+        seconds = time.perf_counter() - start_time
+        _get_possible_actions_counter.add(seconds)
+        _candidates += len(actions)
+        if _hooks:
+            _emit('get_possible_actions', seconds)
+        return actions
+    return wrapper
+
+def _wrap_iter_actions(iter_actions):
+    # counts the time spent generating, not the time the caller holds the generator
+    @functools.wraps(iter_actions)
+    def wrapper(self: Game) -> Iterator[Action]:
+        global _iter_candidates
+        _iter_actions_counter.calls += 1
+        actions = iter_actions(self)
+        seconds = 0.0
+        try:
+            while True:
+                start_time = time.perf_counter()
+                try:
+                    action = next(actions)
+                except StopIteration:
+                    break
+                finally:
+                    seconds += time.perf_counter() - start_time
+                _iter_candidates += 1
+                yield action
+        finally:
+            _iter_actions_counter.seconds += seconds
+            if _hooks:
+                _emit('iter_actions', seconds)
+    return wrapper
+
+def _wrap_timed(method, counter: _Counter, event: str):
+    @functools.wraps(method)
+    def wrapper(self: Game, *args):
+        start_time = time.perf_counter()
+        try:
+            return method(self, *args)
+        finally:
+            seconds = time.perf_counter() - start_time
+            counter.add(seconds)
+            if _hooks:
+                _emit(event, seconds)
+    return wrapper
+
+def is_enabled() -> bool:
+    return len(_originals) > 0
+
+def enable():
+    if is_enabled():
+        return
+    for name in ('run_action', 'get_possible_actions', 'iter_actions', 'undo', 'sha256_hash'):
+        _originals[name] = getattr(Game, name)
+    Game.run_action = _wrap_run_action(_originals['run_action'])
+    Game.get_possible_actions = _wrap_get_possible_actions(_originals['get_possible_actions'])
+    Game.iter_actions = _wrap_iter_actions(_originals['iter_actions'])
+    Game.undo = _wrap_timed(_originals['undo'], _undo_counter, 'undo')
+    Game.sha256_hash = _wrap_timed(_originals['sha256_hash'], _sha256_hash_counter, 'sha256_hash')
+
+def disable():
+    for name, method in _originals.items():
+        setattr(Game, name, method)
+    _originals.clear()
+
+def add_hook(hook: Hook):
+    _hooks.append(hook)
+
+def remove_hook(hook: Hook):
+    _hooks.remove(hook)
+
+def reset():
+    global _candidates, _iter_candidates
+    _run_action_counters.clear()
+    for counter in (_get_possible_actions_counter, _iter_actions_counter, _undo_counter, _sha256_hash_counter):
+        counter.calls = 0
+        counter.seconds = 0.0
+    _candidates = 0
+    _iter_candidates = 0
+
+def snapshot() -> Dict:
+    """
+    Copy of the counters as plain data, ready to be serialized.
+    """
+    calls = _get_possible_actions_counter.calls
+    iter_calls = _iter_actions_counter.calls
+    return {
+        'run_action': {name: counter.to_dict() for name, counter in _run_action_counters.items()},
+        'get_possible_actions': {
+            **_get_possible_actions_counter.to_dict(),
+            'candidates': _candidates,
+            'branching_factor': _candidates / calls if calls else 0.0,
+        },
+        'iter_actions': {
+            **_iter_actions_counter.to_dict(),
+            'candidates': _iter_candidates,
+            'branching_factor': _iter_candidates / iter_calls if iter_calls else 0.0,
+        },
+        'undo': _undo_counter.to_dict(),
+        'sha256_hash': _sha256_hash_counter.to_dict(),
+    }
+
+@contextlib.contextmanager
+def instrumented(hook: Optional[Hook] = None) -> Iterator[None]:
+    """
+    Enable the counters for the duration of the block, optionally calling
+    `hook` for every instrumented call.
+    """
+    was_enabled = is_enabled()
+    enable()
+    if hook is not None:
+        add_hook(hook)
+    try:
+        yield
+    finally:
+        if hook is not None:
+            remove_hook(hook)
+        if not was_enabled:
+            disable()
@@ -0,0 +1,126 @@
+"""
+Load test of a running `python -m klondike serve`.
+
+    python -m klondike.loadtest [--host 127.0.0.1] [--port 7777] [--unix PATH] [--clients 100] [--requests 200]
+
+Every client opens a connection and a session and plays random actions,
+undoing now and then and optionally asking for hints. The requests per
+second and latency percentiles are printed as JSON.
+"""
+from __future__ import annotations
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional,
+)
+import argparse
+import asyncio
+import json
+import random
+import time
+
+class Client:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._reader = reader
+        self._writer = writer
+        self._ids = 0
+        self._latencies: List[float] = []
+        self._errors = 0
+
+    @classmethod
+    async def connect(cls, host: str, port: int, unix: Optional[str] = None) -> Client:
+        if unix is not None:
+            reader, writer = await asyncio.open_unix_connection(unix)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    @property
+    def latencies(self) -> List[float]:
+        return self._latencies
+
+    @property
+    def errors(self) -> int:
+        return self._errors
+
+    async def request(self, op: str, **params: Any) -> Dict:
+        self._ids += 1
+        params.update(id=self._ids, op=op)
+        start_time = time.perf_counter()
+        self._writer.write(json.dumps(params).encode('utf-8') + b'\n')
+        response = json.loads(await self._reader.readline())
+        self._latencies.append(time.perf_counter() - start_time)
+        if not response['ok']:
+            self._errors += 1
+        return response
+
+    async def close(self):
+        self._writer.close()
+        await self._writer.wait_closed()
+
+async def run_client(client: Client, requests: int, seed: int, hint_ratio: float):
+    rng = random.Random(seed)
+    session = (await client.request('create', seed=seed))['session']
+    actions = (await client.request('actions', session=session))['actions']
+    moves = 0
+    for _ in range(requests):
+        if rng.random() < hint_ratio:
+            await client.request('hint', session=session)
+            continue
+        if moves > 0 and (not actions or rng.random() < 0.05):
+            response = await client.request('undo', session=session)
+        elif actions:
+            response = await client.request('act', session=session, action=rng.randrange(len(actions)))
+        else:
+            break
+        moves = response['state']['moves']
+        actions = (await client.request('actions', session=session))['actions']
+    await client.request('close', session=session)
+
+def percentile(values: List[float], fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+async def load_test(
+    host: str = '127.0.0.1',
+    port: int = 7777,
+    unix: Optional[str] = None,
+    clients: int = 100,
+    requests: int = 200,
+    hint_ratio: float = 0.0,
+) -> Dict:
+    connections = [await Client.connect(host, port, unix) for _ in range(clients)]
+    start_time = time.perf_counter()
+    await asyncio.gather(*(
+        run_client(client, requests, seed, hint_ratio)
+        for seed, client in enumerate(connections)
+    ))
+    elapsed = time.perf_counter() - start_time
+    for client in connections:
+        await client.close()
+    latencies = [latency for client in connections for latency in client.latencies]
+    return {
+        'clients': clients,
+        'requests': len(latencies),
+        'errors': sum(client.errors for client in connections),
+        'requests_per_sec': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 0.5) * 1e3,
+        'p99_ms': percentile(latencies, 0.99) * 1e3,
+        'max_ms': max(latencies) * 1e3,
+    }
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(prog='python -m klondike.loadtest', description='Load test a game server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7777)
+    parser.add_argument('--unix', help='connect to this Unix socket instead of TCP')
+    parser.add_argument('--clients', type=int, default=100, help='concurrent connections, one session each')
+    parser.add_argument('--requests', type=int, default=200, help='moves per client')
+    parser.add_argument('--hint-ratio', type=float, default=0.0, help='fraction of moves that ask for a hint')
+    args = parser.parse_args(argv)
+    results = asyncio.run(load_test(args.host, args.port, args.unix, args.clients, args.requests, args.hint_ratio))
+    print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,391 @@
+"""
+Lockstep engine that plays many games at once with NumPy arrays.
+
+    python -m klondike.lockstep [--games 1000] [--check-games 50]
+
+Games are rows of arrays instead of Game objects. Every step computes the
+legal moves of all games as a mask over a fixed set of action slots and
+applies one chosen slot per game. The rules are the same as in
+Game.get_possible_actions() and Game.run_action(), which cross_check()
+verifies by playing the same random actions on both engines.
+
+There is no undo or history, it is meant for random playouts. Requires
+numpy, which the rest of the package doesn't.
+"""
+from __future__ import annotations
+from typing import (
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+import argparse
+import json
+import random
+import time
+import numpy as np
+from .cards import (
+    KING,
+    RANK_VALUES,
+    COLOR_VALUES,
+    Suit,
+)
+from .game import Game
+from .actions import (
+    Action,
+    DrawFromDeckAction,
+    MoveFromWasteToPileAction,
+    MoveFromFoundationToPileAction,
+    MoveFromPileToPileAction,
+    MoveFromWasteToFoundationAction,
+    MoveFromPileToFoundationAction,
+)
+from .record import (
+    ActionCodec,
+)
+
+# action slots, the suit of a move to a foundation and the number of cards
+# moved between piles follow from the state
+DRAW = 0
+WASTE_TO_FOUNDATION = 1
+WASTE_TO_PILE = 2                   # + target pile
+PILE_TO_FOUNDATION = 9              # + source pile
+FOUNDATION_TO_PILE = 16             # + suit * 7 + target pile
+PILE_TO_PILE = 44                   # + source pile * 7 + target pile
+ACTION_COUNT = 93
+# slot of a game that doesn't move
+NO_ACTION = -1
+
+PILE_COUNT = 7
+# 6 face-down cards and a run from king to ace
+MAX_PILE = 19
+STOCK_SIZE = 24
+# card code of an empty pile, waste or foundation in the lookup tables
+NO_CARD = 52
+
+RANKS = np.frombuffer(RANK_VALUES + b'\0', dtype=np.uint8).astype(np.int16)
+COLORS = np.frombuffer(COLOR_VALUES + b'\0', dtype=np.uint8)
+SUITS = np.arange(53, dtype=np.int16) // 13
+SUIT_LIST = list(Suit)
+
+def _accepts(code: int, target: int) -> bool:
+    if code == NO_CARD:
+        return False
+    if target == NO_CARD:
+        return RANK_VALUES[code] == KING
+    return RANK_VALUES[target] == RANK_VALUES[code] + 1 and COLOR_VALUES[target] != COLOR_VALUES[code]
+
+def _run_count(top: int, target: int) -> int:
+    """
+    Number of cards to move from a pile with top card `top` onto `target`,
+    0 if no card of a valid run ending in `top` fits.
+    """
+    if top == NO_CARD:
+        return 0
+    if target == NO_CARD:
+        return KING - RANK_VALUES[top] + 1
+    count = RANK_VALUES[target] - RANK_VALUES[top]
+    # colors alternate in a run, so the card has the color of the top if count is odd
+    same_color = COLOR_VALUES[target] == COLOR_VALUES[top]
+    if count < 1 or same_color == (count % 2 == 1):
+        return 0
+    return count
+
+# indexed by card code or NO_CARD
+ACCEPTS = np.array([[_accepts(code, target) for target in range(53)] for code in range(53)])
+RUN_COUNTS = np.array([[_run_count(top, target) for target in range(53)] for top in range(53)], dtype=np.int16)
+
+def _tops(cards: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """
+    Top card codes of the stacks in the last axis of `cards`.
+    """
+    index = np.maximum(lengths - 1, 0)[..., None]
+    tops = np.take_along_axis(cards, index, -1)[..., 0].astype(np.int16)
+    return np.where(lengths > 0, tops, NO_CARD)
+
+class LockstepGames:
+    def __init__(self, games: Sequence[Game]):
+        n = len(games)
+        self._draw_count = games[0].draw_count if games else 1
+        self._deck = np.zeros((n, STOCK_SIZE), dtype=np.uint8)
+        self._deck_lengths = np.zeros(n, dtype=np.int16)
+        self._waste = np.zeros((n, STOCK_SIZE), dtype=np.uint8)
+        self._waste_lengths = np.zeros(n, dtype=np.int16)
+        self._piles = np.zeros((n, PILE_COUNT, MAX_PILE), dtype=np.uint8)
+        self._pile_lengths = np.zeros((n, PILE_COUNT), dtype=np.int16)
+        self._revealed_counts = np.zeros((n, PILE_COUNT), dtype=np.int16)
+        # foundation heights by suit, indexed by card code // 13
+        self._foundations = np.zeros((n, 4), dtype=np.int16)
+        for row, game in enumerate(games):
+            if game.draw_count != self._draw_count:
+                raise ValueError('Games have different draw counts')
+            self._load(row, game)
+
+    @classmethod
+    def create(cls, seeds: Sequence[int], draw_count: int = 1) -> LockstepGames:
+        return cls([Game.create(seed, draw_count) for seed in seeds])
+
+    def _load(self, row: int, game: Game):
+        deck_codes = game.deck.codes
+        self._deck[row, :len(deck_codes)] = list(deck_codes)
+        self._deck_lengths[row] = len(deck_codes)
+        waste_codes = game.waste.codes
+        self._waste[row, :len(waste_codes)] = list(waste_codes)
+        self._waste_lengths[row] = len(waste_codes)
+        for i, pile in enumerate(game.piles):
+            self._piles[row, i, :len(pile.codes)] = list(pile.codes)
+            self._pile_lengths[row, i] = len(pile.codes)
+            self._revealed_counts[row, i] = pile.revealed_count
+        for foundation in game.foundations:
+            self._foundations[row, foundation.suit.value - 1] = foundation.height
+
+    @property
+    def size(self) -> int:
+        return len(self._deck_lengths)
+
+    @property
+    def draw_count(self) -> int:
+        return self._draw_count
+
+    def is_won(self) -> np.ndarray:
+        return (self._foundations == 13).all(axis=1)
+
+    def _pile_tops(self) -> np.ndarray:
+        return _tops(self._piles, self._pile_lengths)
+
+    def _run_counts(self, tops: np.ndarray) -> np.ndarray:
+        """
+        Number of cards that move from each pile to each other pile, 0 if
+        the move isn't legal. Revealed cards always form a valid run, so
+        the count follows from the top cards and the revealed counts.
+        """
+        counts = RUN_COUNTS[tops[:, :, None], tops[:, None, :]]
+        counts[counts > self._revealed_counts[:, :, None]] = 0
+        counts[:, np.arange(PILE_COUNT), np.arange(PILE_COUNT)] = 0
+        return counts
+
+    def legal_mask(self) -> np.ndarray:
+        """
+        Boolean array of the legal action slots of each game.
+        """
+        n = self.size
+        rows = np.arange(n)
+        mask = np.zeros((n, ACTION_COUNT), dtype=bool)
+        tops = self._pile_tops()
+        waste_tops = _tops(self._waste, self._waste_lengths)
+        foundations = self._foundations
+
+        mask[:, DRAW] = (self._deck_lengths > 0) | (self._waste_lengths > 0)
+        mask[:, WASTE_TO_FOUNDATION] = (waste_tops != NO_CARD) & (
+            foundations[rows, SUITS[waste_tops] % 4] == RANKS[waste_tops] - 1
+        )
+        mask[:, WASTE_TO_PILE:PILE_TO_FOUNDATION] = ACCEPTS[waste_tops[:, None], tops]
+        mask[:, PILE_TO_FOUNDATION:FOUNDATION_TO_PILE] = (tops != NO_CARD) & (
+            np.take_along_axis(foundations, SUITS[tops] % 4, 1) == RANKS[tops] - 1
+        )
+        foundation_tops = np.where(foundations > 0, np.arange(4) * 13 + foundations - 1, NO_CARD)
+        mask[:, FOUNDATION_TO_PILE:PILE_TO_PILE] = ACCEPTS[foundation_tops[:, :, None], tops[:, None, :]].reshape(n, -1)
+        mask[:, PILE_TO_PILE:] = self._run_counts(tops).reshape(n, -1) > 0
+        return mask
+
+    def step(self, slots: np.ndarray):
+        """
+        Apply the action slot of each game, NO_ACTION to skip a game.
+        The slots must be legal, see legal_mask().
+        """
+        slots = np.asarray(slots)
+        rows = np.nonzero(slots == DRAW)[0]
+        if len(rows):
+            self._draw(rows)
+        rows = np.nonzero(slots == WASTE_TO_FOUNDATION)[0]
+        if len(rows):
+            codes = self._pop_waste(rows)
+            self._foundations[rows, codes // 13] += 1
+        rows = np.nonzero((slots >= WASTE_TO_PILE) & (slots < PILE_TO_FOUNDATION))[0]
+        if len(rows):
+            codes = self._pop_waste(rows)
+            self._push_pile(rows, slots[rows] - WASTE_TO_PILE, codes)
+        rows = np.nonzero((slots >= PILE_TO_FOUNDATION) & (slots < FOUNDATION_TO_PILE))[0]
+        if len(rows):
+            sources = slots[rows] - PILE_TO_FOUNDATION
+            codes = self._piles[rows, sources, self._pile_lengths[rows, sources] - 1].astype(np.int16)
+            self._draw_pile(rows, sources, 1)
+            self._foundations[rows, codes // 13] += 1
+        rows = np.nonzero((slots >= FOUNDATION_TO_PILE) & (slots < PILE_TO_PILE))[0]
+        if len(rows):
+            suits, targets = np.divmod(slots[rows] - FOUNDATION_TO_PILE, PILE_COUNT)
+            self._foundations[rows, suits] -= 1
+            self._push_pile(rows, targets, suits * 13 + self._foundations[rows, suits])
+        rows = np.nonzero(slots >= PILE_TO_PILE)[0]
+        if len(rows):
+            sources, targets = np.divmod(slots[rows] - PILE_TO_PILE, PILE_COUNT)
+            source_lengths = self._pile_lengths[rows, sources]
+            target_lengths = self._pile_lengths[rows, targets]
+            target_tops = np.where(target_lengths > 0, self._piles[rows, targets, target_lengths - 1], NO_CARD)
+            counts = RUN_COUNTS[self._piles[rows, sources, source_lengths - 1], target_tops]
+            for k in range(int(counts.max())):
+                moving = k < counts
+                self._piles[rows[moving], targets[moving], target_lengths[moving] + k] = (
+                    self._piles[rows[moving], sources[moving], (source_lengths - counts + k)[moving]]
+                )
+            self._draw_pile(rows, sources, counts)
+            self._pile_lengths[rows, targets] += counts
+            self._revealed_counts[rows, targets] += counts
+
+    def _draw(self, rows: np.ndarray):
+        recycle = rows[self._deck_lengths[rows] == 0]
+        if len(recycle):
+            # turn the waste over into the deck
+            lengths = self._waste_lengths[recycle]
+            index = np.clip(lengths[:, None] - 1 - np.arange(STOCK_SIZE), 0, STOCK_SIZE - 1)
+            self._deck[recycle] = np.take_along_axis(self._waste[recycle], index, 1)
+            self._deck_lengths[recycle] = lengths
+            self._waste_lengths[recycle] = 0
+        for _ in range(self._draw_count):
+            rows = rows[self._deck_lengths[rows] > 0]
+            self._deck_lengths[rows] -= 1
+            self._waste[rows, self._waste_lengths[rows]] = self._deck[rows, self._deck_lengths[rows]]
+            self._waste_lengths[rows] += 1
+
+    def _pop_waste(self, rows: np.ndarray) -> np.ndarray:
+        self._waste_lengths[rows] -= 1
+        return self._waste[rows, self._waste_lengths[rows]].astype(np.int16)
+
+    def _push_pile(self, rows: np.ndarray, piles: np.ndarray, codes: np.ndarray):
+        self._piles[rows, piles, self._pile_lengths[rows, piles]] = codes
+        self._pile_lengths[rows, piles] += 1
+        self._revealed_counts[rows, piles] += 1
+
+    def _draw_pile(self, rows: np.ndarray, piles: np.ndarray, counts):
+        # like Pile.draw_codes(): taking the whole run reveals the next card
+        lengths = self._pile_lengths[rows, piles] - counts
+        revealed_counts = self._revealed_counts[rows, piles]
+        self._pile_lengths[rows, piles] = lengths
+        self._revealed_counts[rows, piles] = np.where(
+            revealed_counts == counts,
+            (lengths > 0).astype(np.int16),
+            revealed_counts - counts,
+        )
+
+    def action(self, row: int, slot: int) -> Action:
+        """
+        The Action of `slot` in game `row`, for comparing with Game.
+        """
+        slot = int(slot)
+        if slot == DRAW:
+            return DrawFromDeckAction() if self._draw_count == 1 else DrawFromDeckAction(count=self._draw_count)
+        if slot == WASTE_TO_FOUNDATION:
+            code = self._waste[row, self._waste_lengths[row] - 1]
+            return MoveFromWasteToFoundationAction(target_foundation_suit=SUIT_LIST[code // 13])
+        if slot < PILE_TO_FOUNDATION:
+            return MoveFromWasteToPileAction(target_pile_index=slot - WASTE_TO_PILE)
+        if slot < FOUNDATION_TO_PILE:
+            source = slot - PILE_TO_FOUNDATION
+            code = self._piles[row, source, self._pile_lengths[row, source] - 1]
+            return MoveFromPileToFoundationAction(source_pile_index=source, target_foundation_suit=SUIT_LIST[code // 13])
+        if slot < PILE_TO_PILE:
+            suit, target = divmod(slot - FOUNDATION_TO_PILE, PILE_COUNT)
+            return MoveFromFoundationToPileAction(target_pile_index=target, source_foundation_suit=SUIT_LIST[suit])
+        source, target = divmod(slot - PILE_TO_PILE, PILE_COUNT)
+        counts = self._run_counts(self._pile_tops())
+        return MoveFromPileToPileAction(source_pile_index=source, target_pile_index=target, count=int(counts[row, source, target]))
+
+    def matches(self, row: int, game: Game) -> bool:
+        """
+        Whether game `row` is in the same state as `game`.
+        """
+        if bytes(self._deck[row, :self._deck_lengths[row]]) != bytes(game.deck.codes):
+            return False
+        if bytes(self._waste[row, :self._waste_lengths[row]]) != bytes(game.waste.codes):
+            return False
+        for i, pile in enumerate(game.piles):
+            if bytes(self._piles[row, i, :self._pile_lengths[row, i]]) != bytes(pile.codes):
+                return False
+            if self._revealed_counts[row, i] != pile.revealed_count:
+                return False
+        return all(self._foundations[row, f.suit.value - 1] == f.height for f in game.foundations)
+
+    def playouts(self, max_length: int = 500, rng: Optional[np.random.Generator] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Play uniformly random legal actions in every game until it is won,
+        has no actions left or has played `max_length` actions.
+        Returns whether each game was won and the number of actions played.
+        """
+        if rng is None:
+            rng = np.random.default_rng()
+        lengths = np.zeros(self.size, dtype=np.int32)
+        for _ in range(max_length):
+            mask = self.legal_mask()
+            active = mask.any(axis=1) & ~self.is_won()
+            if not active.any():
+                break
+            slots = choose_random(mask, rng)
+            slots[~active] = NO_ACTION
+            self.step(slots)
+            lengths += active
+        return self.is_won(), lengths
+
+def choose_random(mask: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """
+    A uniformly random legal slot of each game, arbitrary if none is legal.
+    """
+    counts = mask.sum(axis=1)
+    choices = (rng.random(len(mask)) * counts).astype(np.int16)
+    return (mask.cumsum(axis=1, dtype=np.int16) > choices[:, None]).argmax(axis=1)
+
+def _encode(action: Action) -> bytes:
+    return ActionCodec.encode_all([action])
+
+def cross_check(seeds: Sequence[int], max_length: int = 300, seed: int = 0, draw_count: int = 1) -> int:
+    """
+    Play the same random actions on Game objects and on LockstepGames and
+    raise AssertionError when their legal actions or states differ.
+    Returns the number of actions compared.
+    """
+    rng = random.Random(seed)
+    games = [Game.create(s, draw_count) for s in seeds]
+    lockstep = LockstepGames(games)
+    compared = 0
+    for step in range(max_length):
+        mask = lockstep.legal_mask()
+        slots = np.full(len(games), NO_ACTION)
+        for row, game in enumerate(games):
+            legal_slots = np.nonzero(mask[row])[0]
+            actions = {_encode(lockstep.action(row, slot)): slot for slot in legal_slots}
+            expected = sorted(_encode(action) for action in game.get_possible_actions())
+            assert sorted(actions) == expected, f'seed {seeds[row]} step {step}: actions differ'
+            if not expected or game.is_won():
+                continue
+            action = rng.choice(game.get_possible_actions())
+            slots[row] = actions[_encode(action)]
+            game.run_action(action)
+            compared += 1
+        lockstep.step(slots)
+        for row, game in enumerate(games):
+            assert lockstep.matches(row, game), f'seed {seeds[row]} step {step}: states differ'
+    return compared
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(prog='python -m klondike.lockstep', description='Batched random playouts')
+    parser.add_argument('--games', type=int, default=1000, help='games played in lockstep')
+    parser.add_argument('--max-length', type=int, default=500, help='actions per playout')
+    parser.add_argument('--check-games', type=int, default=50, help='games to cross-check against Game, 0 to skip')
+    parser.add_argument('--draw-count', type=int, default=1, choices=[1, 3])
+    args = parser.parse_args(argv)
+    results = {}
+    if args.check_games:
+        results['cross_checked_actions'] = cross_check(range(args.check_games), draw_count=args.draw_count)
+    lockstep = LockstepGames.create(range(args.games), args.draw_count)
+    start_time = time.perf_counter()
+    won, lengths = lockstep.playouts(args.max_length, np.random.default_rng(0))
+    elapsed = time.perf_counter() - start_time
+    results.update({
+        'games': args.games,
+        'won': int(won.sum()),
+        'playouts_per_sec': args.games / elapsed,
+        'actions_per_sec': int(lengths.sum()) / elapsed,
+    })
+    print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+Read-only views of what a player can see of a game.
+
+    observation = game.observation
+    for pile in observation.piles:
+        pile.top, len(pile), pile.hidden_count
+
+The views don't copy anything. They look up the game's current
+containers on every access, so they stay valid as actions are run,
+undone or copied on write, and reading them allocates nothing: cards are
+the shared instances of cards.CARDS. Face-down cards of the piles and the
+order of the deck can't be read through them, only counted.
+"""
+from __future__ import annotations
+from typing import (
+    TYPE_CHECKING,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+from .cards import (
+    CARDS,
+    Card,
+    Suit,
+)
+if TYPE_CHECKING:
+    from .game import Game
+
+class PileView:
+    """
+    The face-up cards of a pile, from the bottom up.
+    """
+    __slots__ = ('_game', '_index')
+
+    def __init__(self, game: Game, index: int):
+        self._game = game
+        self._index = index
+
+    @property
+    def index(self) -> int:
+        return self._index
+
+    @property
+    def hidden_count(self) -> int:
+        """
+        Number of face-down cards under the face-up ones.
+        """
+        pile = self._game.piles[self._index]
+        return len(pile.codes) - pile.revealed_count
+
+    @property
+    def top(self) -> Optional[Card]:
+        codes = self._game.piles[self._index].codes
+        if not codes:
+            return None
+        return CARDS[codes[-1]]
+
+    def __len__(self) -> int:
+        return self._game.piles[self._index].revealed_count
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[Card, List[Card]]:
+        pile = self._game.piles[self._index]
+        codes = pile.codes
+        hidden_count = len(codes) - pile.revealed_count
+        if isinstance(index, slice):
+            return [CARDS[code] for code in codes[hidden_count:][index]]
+        if index < 0:
+            index += pile.revealed_count
+        if not 0 <= index < pile.revealed_count:
+            raise IndexError('pile view index out of range')
+        return CARDS[codes[hidden_count + index]]
+
+    def __iter__(self) -> Iterator[Card]:
+        pile = self._game.piles[self._index]
+        codes = pile.codes
+        for i in range(len(codes) - pile.revealed_count, len(codes)):
+            yield CARDS[codes[i]]
+
+    def __repr__(self) -> str:
+        return f'PileView({self._index}, hidden={self.hidden_count}, cards={self[:]})'
+
+class Observation:
+    """
+    What a player can see of `game`, see Game.observation.
+    """
+    __slots__ = ('_game', '_piles')
+
+    def __init__(self, game: Game):
+        self._game = game
+        self._piles = tuple(PileView(game, i) for i in range(len(game.piles)))
+
+    @property
+    def piles(self) -> Tuple[PileView, ...]:
+        return self._piles
+
+    @property
+    def deck_size(self) -> int:
+        return len(self._game.deck.codes)
+
+    @property
+    def waste_size(self) -> int:
+        return len(self._game.waste.codes)
+
+    @property
+    def waste_top(self) -> Optional[Card]:
+        codes = self._game.waste.codes
+        if not codes:
+            return None
+        return CARDS[codes[-1]]
+
+    def foundation_height(self, suit: Suit) -> int:
+        return self._game.foundation(suit).height
+
+    def foundation_top(self, suit: Suit) -> Optional[Card]:
+        foundation = self._game.foundation(suit)
+        if foundation.height == 0:
+            return None
+        return CARDS[foundation.top_code]
+
+    @property
+    def draw_count(self) -> int:
+        return self._game.draw_count
+
+    @property
+    def moves(self) -> int:
+        """
+        Number of actions run so far.
+        """
+        return self._game.history.length
+
+    def is_won(self) -> bool:
+        return self._game.is_won()
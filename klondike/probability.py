@@ -0,0 +1,211 @@
+"""
+Monte Carlo estimate of the chance to win a game in progress.
+
+The face-down pile cards and, until the waste has been turned over once, the
+deck order are unknown to the player. Each sample deals those unknown cards
+randomly into their places, keeping everything that has been revealed, and
+tries to solve the result. The estimate is the fraction of solved samples.
+Samples are solved with full information, so the estimate is an upper bound
+of what a player can expect, minus samples that ran out of budget, which are
+counted as losses.
+"""
+from __future__ import annotations
+from typing import (
+    Callable,
+    List,
+    Optional,
+    Tuple,
+)
+import concurrent.futures
+import math
+import random
+import time
+from .actions import (
+    Action,
+)
+from .cards import (
+    Deck,
+    Waste,
+    Pile,
+    Foundation,
+)
+from .game import Game
+from .solver import (
+    SolveStatus,
+    Solver,
+)
+
+class WinProbability:
+    def __init__(self, wins: int, samples: int, undecided: int):
+        self._wins = wins
+        self._samples = samples
+        self._undecided = undecided
+
+    @property
+    def wins(self) -> int:
+        return self._wins
+
+    @property
+    def samples(self) -> int:
+        return self._samples
+
+    @property
+    def undecided(self) -> int:
+        """
+        Samples that ran out of budget before being solved or proven lost.
+        """
+        return self._undecided
+
+    @property
+    def estimate(self) -> float:
+        if self._samples == 0:
+            return 0.0
+        return self._wins / self._samples
+
+    def confidence_interval(self, z: float = 1.96) -> Tuple[float, float]:
+        """
+        Wilson score interval, 95% by default.
+        """
+        n = self._samples
+        if n == 0:
+            return (0.0, 1.0)
+        p = self._wins / n
+        center = (p + z * z / (2 * n)) / (1 + z * z / n)
+        margin = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / (1 + z * z / n)
+        return (max(0.0, center - margin), min(1.0, center + margin))
+
+    def merge(self, other: WinProbability) -> WinProbability:
+        return WinProbability(
+            self._wins + other._wins,
+            self._samples + other._samples,
+            self._undecided + other._undecided,
+        )
+
+    def __repr__(self):
+        low, high = self.confidence_interval()
+        return f'{self.__class__.__name__}({self.estimate:.3f}, [{low:.3f}, {high:.3f}], samples={self._samples})'
+
+def deck_is_known(game: Game) -> bool:
+    """
+    The deck order is known once the waste has been turned over, also
+    within a macro action.
+    """
+    return any(delta.recycles() for delta in game.history.deltas)
+
+def sample_game(game: Game, rng: random.Random) -> Game:
+    """
+    Deal the cards unknown to the player of `game` randomly into their places.
+    """
+    deck_known = deck_is_known(game)
+    unknown = bytearray()
+    for pile in game.piles:
+        unknown += pile.codes[:len(pile.codes) - pile.revealed_count]
+    if not deck_known:
+        unknown += game.deck.codes
+    rng.shuffle(unknown)
+    position = 0
+    piles = []
+    for pile in game.piles:
+        hidden_count = len(pile.codes) - pile.revealed_count
+        codes = unknown[position:position + hidden_count] + pile.codes[hidden_count:]
+        position += hidden_count
+        piles.append(Pile.from_codes(codes, pile.revealed_count))
+    deck_codes = bytearray(game.deck.codes) if deck_known else unknown[position:]
+    return Game(
+        Deck.from_codes(deck_codes, game.seed),
+        Waste.from_codes(bytearray(game.waste.codes)),
+        piles,
+        [Foundation.from_height(f.suit, f.height) for f in game.foundations],
+        game.draw_count,
+    )
+
+def run_samples(game: Game, seed: int, count: int, max_nodes: int, deadline: float) -> WinProbability:
+    """
+    Solve `count` samples of `game`, stopping early at the `deadline` given
+    as a time.time() timestamp.
+    """
+    rng = random.Random(seed)
+    wins = 0
+    samples = 0
+    undecided = 0
+    for _ in range(count):
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
+        result = Solver(max_nodes=max_nodes, time_limit=remaining).solve(sample_game(game, rng))
+        if result.status is SolveStatus.TIME_LIMIT:
+            # cut short by the deadline, not a real result
+            break
+        samples += 1
+        if result.solved:
+            wins += 1
+        elif result.status is not SolveStatus.UNSOLVABLE:
+            undecided += 1
+    return WinProbability(wins, samples, undecided)
+
+def _run_replayed_samples(
+    game_seed: int,
+    actions: List[Action],
+    draw_count: int,
+    seed: int,
+    count: int,
+    max_nodes: int,
+    deadline: float,
+) -> WinProbability:
+    """
+    run_samples() of the game replayed from its deal, which is all that is
+    sent to a worker process instead of the whole Game.
+    """
+    game = Game.replay(game_seed, actions, draw_count)
+    return run_samples(game, seed, count, max_nodes, deadline)
+
+# samples per task sent to a worker process
+CHUNK_SIZE = 4
+
+def estimate_win_probability(
+    game: Game,
+    samples: int = 200,
+    deadline: float = 1.0,
+    max_nodes: int = 2000,
+    executor: Optional[concurrent.futures.Executor] = None,
+    on_update: Optional[Callable[[WinProbability], None]] = None,
+    seed: Optional[int] = None,
+) -> WinProbability:
+    """
+    Estimate the chance to win `game` from up to `samples` samples.
+    Returns what was sampled within `deadline` seconds, calling `on_update`
+    with the running estimate whenever more samples are done.
+    Samples run on `executor`, or in this process if it isn't given.
+    """
+    if game.is_won():
+        return WinProbability(1, 1, 0)
+    end_time = time.time() + deadline
+    rng = random.Random(seed)
+    result = WinProbability(0, 0, 0)
+    if executor is None:
+        for i in range(0, samples, CHUNK_SIZE):
+            result = result.merge(run_samples(game, rng.randrange(2 ** 32), min(CHUNK_SIZE, samples - i), max_nodes, end_time))
+            if on_update is not None:
+                on_update(result)
+            if time.time() >= end_time:
+                break
+        return result
+    actions = list(game.history.actions)
+    futures: List[concurrent.futures.Future] = [
+        executor.submit(
+            _run_replayed_samples, game.seed, actions, game.draw_count,
+            rng.randrange(2 ** 32), min(CHUNK_SIZE, samples - i), max_nodes, end_time,
+        )
+        for i in range(0, samples, CHUNK_SIZE)
+    ]
+    try:
+        for future in concurrent.futures.as_completed(futures, timeout=max(0.0, end_time - time.time())):
+            result = result.merge(future.result())
+            if on_update is not None:
+                on_update(result)
+    except concurrent.futures.TimeoutError:
+        pass
+    finally:
+        for future in futures:
+            future.cancel()
+    return result
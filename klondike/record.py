@@ -0,0 +1,372 @@
+"""
+Compact binary format for recorded games.
+
+A file starts with MAGIC and a format version byte followed by records:
+
+    seed            unsigned LEB128 varint
+    draw count      one byte, 1 or 3, since version 3
+    payload length  unsigned LEB128 varint
+    payload         one byte per action, see ActionCodec
+
+Records are self-delimiting, so a file can be appended to and scanned
+without decoding the actions. Before version 3 the draw count of a game
+is the count of its first draw action, 1 if it never draws.
+"""
+from __future__ import annotations
+from typing import (
+    BinaryIO,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+import mmap
+import os
+from .game import Game
+from .actions import (
+    ACTION_CODE_COUNT,
+    ACTIONS,
+    MAX_RUN_LENGTH,
+    PILE_COUNT,
+    SUIT_COUNT,
+    DRAW_ACTIONS,
+    WASTE_TO_PILE_CODES,
+    WASTE_TO_FOUNDATION_CODES,
+    PILE_TO_FOUNDATION_CODES,
+    FOUNDATION_TO_PILE_CODES,
+    PILE_TO_PILE_CODES,
+    Action,
+    DrawFromDeckAction,
+    MacroAction,
+)
+
+MAGIC = b'KLDR'
+# version 2 added DRAW_THREE, version 3 the draw count of each record,
+# files of earlier versions are still read
+VERSION = 3
+SUPPORTED_VERSIONS = (1, 2, 3)
+
+def encode_varint(value: int) -> bytes:
+    if value < 0:
+        raise ValueError(f'Cannot encode negative value {value} as varint')
+    out = bytearray()
+    while value >= 0x80:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+def decode_varint(data, position: int) -> Tuple[int, int]:
+    """
+    Decode the varint at `position` of `data`.
+    Returns the value and the position after it.
+    """
+    value = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+class ActionCodec:
+    """
+    Byte codes of actions:
+
+        0           draw 1 from deck
+        1..7        waste to pile
+        8..11       waste to foundation
+        12..39      pile to foundation
+        40..67      foundation to pile
+        68..193     pile to pile, 1 to 3 cards
+        194..235    pile to pile followed by a count byte
+        236         draw 3 from deck, since version 2
+        237..255    reserved
+
+    Within each range the actions are in the order of their Action.code,
+    so the codes are translated by tables built from the shared actions.
+    Macro actions are recorded as the primitive actions they expand to.
+    """
+    DRAW = 0
+    WASTE_TO_PILE = 1
+    WASTE_TO_FOUNDATION = 8
+    PILE_TO_FOUNDATION = 12
+    FOUNDATION_TO_PILE = 40
+    PILE_TO_PILE = 68
+    PILE_TO_PILE_LONG = 194
+    DRAW_THREE = 236
+    RESERVED = 237
+    # longest pile to pile move without a count byte
+    SHORT_COUNT = 3
+
+    @classmethod
+    def encode(cls, action: Action, out: bytearray):
+        if isinstance(action, MacroAction):
+            for primitive in action.expand():
+                cls.encode(primitive, out)
+            return
+        code = action.code
+        byte = _BYTE_OF_CODE[code]
+        if byte != _NO_BYTE:
+            out.append(byte)
+        elif code >= PILE_TO_PILE_CODES:
+            pair, count = divmod(code - PILE_TO_PILE_CODES, MAX_RUN_LENGTH)
+            out.append(cls.PILE_TO_PILE_LONG + pair)
+            out.append(count + 1)
+        else:
+            raise ValueError(f'Cannot encode {action}')
+
+    @classmethod
+    def decode(cls, data, position: int, version: int = VERSION) -> Tuple[Action, int]:
+        """
+        Decode the action at `position` of `data`, encoded by the format
+        `version`. Returns the action and the position after it.
+        """
+        byte = data[position]
+        position += 1
+        code = _CODE_OF_BYTE[byte]
+        if code >= 0 and (byte != cls.DRAW_THREE or version >= 2):
+            return ACTIONS[code], position
+        if cls.PILE_TO_PILE_LONG <= byte < cls.DRAW_THREE:
+            count = data[position]
+            position += 1
+            if not 1 <= count <= MAX_RUN_LENGTH:
+                raise ValueError(f'Invalid pile to pile count {count}')
+            pair = byte - cls.PILE_TO_PILE_LONG
+            return ACTIONS[PILE_TO_PILE_CODES + pair * MAX_RUN_LENGTH + count - 1], position
+        raise ValueError(f'Invalid action code {byte}')
+
+    @classmethod
+    def encode_all(cls, actions: Iterable[Action]) -> bytes:
+        out = bytearray()
+        for action in actions:
+            cls.encode(action, out)
+        return bytes(out)
+
+    @classmethod
+    def decode_all(cls, data, version: int = VERSION) -> Iterator[Action]:
+        position = 0
+        end = len(data)
+        while position < end:
+            action, position = cls.decode(data, position, version)
+            yield action
+
+_NO_BYTE = 0xff
+
+def _code_tables() -> Tuple[bytearray, List[int]]:
+    """
+    The byte code of each Action.code, _NO_BYTE for the long pile to pile
+    moves and the actions without one, and the Action.code of each byte
+    code, -1 for the others.
+    """
+    byte_of_code = bytearray([_NO_BYTE]) * ACTION_CODE_COUNT
+    code_of_byte = [-1] * 256
+    # first byte code, first Action.code and length of the ranges in the same order
+    ranges = [
+        (ActionCodec.DRAW, DRAW_ACTIONS[0].code, 1),
+        (ActionCodec.DRAW_THREE, DRAW_ACTIONS[2].code, 1),
+        (ActionCodec.WASTE_TO_PILE, WASTE_TO_PILE_CODES, PILE_COUNT),
+        (ActionCodec.WASTE_TO_FOUNDATION, WASTE_TO_FOUNDATION_CODES, SUIT_COUNT),
+        (ActionCodec.PILE_TO_FOUNDATION, PILE_TO_FOUNDATION_CODES, PILE_COUNT * SUIT_COUNT),
+        (ActionCodec.FOUNDATION_TO_PILE, FOUNDATION_TO_PILE_CODES, SUIT_COUNT * PILE_COUNT),
+    ]
+    # the short pile to pile moves are the first counts of each pair of piles
+    for pair in range(PILE_COUNT * (PILE_COUNT - 1)):
+        ranges.append((
+            ActionCodec.PILE_TO_PILE + pair * ActionCodec.SHORT_COUNT,
+            PILE_TO_PILE_CODES + pair * MAX_RUN_LENGTH,
+            ActionCodec.SHORT_COUNT,
+        ))
+    for first_byte, first_code, length in ranges:
+        for i in range(length):
+            byte_of_code[first_code + i] = first_byte + i
+            code_of_byte[first_byte + i] = first_code + i
+    return byte_of_code, code_of_byte
+
+_BYTE_OF_CODE, _CODE_OF_BYTE = _code_tables()
+
+class Record:
+    __slots__ = ('_seed', '_payload', '_version', '_draw_count')
+
+    def __init__(self, seed: int, payload: bytes, version: int = VERSION, draw_count: Optional[int] = None):
+        self._seed = seed
+        self._payload = payload
+        # format version the payload is encoded in
+        self._version = version
+        # None for records of versions without it
+        self._draw_count = draw_count
+
+    @classmethod
+    def from_game(cls, game: Game) -> Record:
+        return cls(game.seed, ActionCodec.encode_all(game.history.actions), draw_count=game.draw_count)
+
+    @property
+    def seed(self) -> int:
+        return self._seed
+
+    @property
+    def payload(self) -> bytes:
+        """
+        The encoded actions.
+        """
+        return self._payload
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def actions(self) -> Iterator[Action]:
+        return ActionCodec.decode_all(self._payload, self._version)
+
+    @property
+    def draw_count(self) -> int:
+        if self._draw_count is not None:
+            return self._draw_count
+        return self._drawn_count()
+
+    def _drawn_count(self) -> int:
+        """
+        The draw count shown by the draw actions, which is all that
+        records before version 3 have.
+        """
+        return next((a.count for a in self.actions() if isinstance(a, DrawFromDeckAction)), 1)
+
+    def replay(self) -> Game:
+        return Game.replay(self._seed, self.actions(), self.draw_count)
+
+    def to_bytes(self, version: int = VERSION) -> bytes:
+        """
+        The record as written to a file of format `version`.
+        """
+        if version < 3:
+            return encode_varint(self._seed) + encode_varint(len(self._payload)) + self._payload
+        return (
+            encode_varint(self._seed) + bytes([self.draw_count])
+            + encode_varint(len(self._payload)) + self._payload
+        )
+
+class RecordWriter:
+    """
+    Append records to a file, writing the header if the file is new.
+    New files get format `version`, and existing ones keep theirs, which
+    is read from their header.
+
+        with RecordWriter(open('games.kdr', 'ab')) as writer:
+            writer.write_game(game)
+    """
+    def __init__(self, f: BinaryIO, version: Optional[int] = None):
+        if f.tell() == 0:
+            if version is None:
+                version = VERSION
+            if version not in SUPPORTED_VERSIONS:
+                raise ValueError(f'Unsupported record format version {version}')
+            f.write(MAGIC + bytes([version]))
+        else:
+            existing = _read_header(f)
+            if version is not None and version != existing:
+                raise ValueError(f'Cannot append version {version} records to a file of version {existing}')
+            version = existing
+        self._f = f
+        self._version = version
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def write(self, record: Record):
+        if self._version < 3:
+            draw_count = record.draw_count
+            if self._version < 2 and draw_count == 3:
+                raise ValueError(f'Cannot write draw 3 games to a record file of version {self._version}')
+            # the draw count would be read back from the draw actions
+            if draw_count != record._drawn_count():
+                raise ValueError(
+                    f'Cannot write a draw {draw_count} game without draws to a record file of version {self._version}'
+                )
+        self._f.write(record.to_bytes(self._version))
+
+    def write_game(self, game: Game):
+        self.write(Record.from_game(game))
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self) -> RecordWriter:
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+HEADER_LENGTH = len(MAGIC) + 1
+
+def _check_header(data) -> int:
+    """
+    The format version of a record file starting with `data`.
+    """
+    if len(data) < HEADER_LENGTH or data[:len(MAGIC)] != MAGIC:
+        raise ValueError('Not a game record file')
+    version = data[len(MAGIC)]
+    if version not in SUPPORTED_VERSIONS:
+        raise ValueError(f'Unsupported record format version {version}')
+    return version
+
+def _read_header(f: BinaryIO) -> int:
+    """
+    The format version of the record file open as `f`, which may be open
+    for appending only.
+    """
+    if f.readable():
+        position = f.tell()
+        f.seek(0)
+        header = f.read(HEADER_LENGTH)
+        f.seek(position)
+    else:
+        with open(f.name, 'rb') as existing:
+            header = existing.read(HEADER_LENGTH)
+    return _check_header(header)
+
+def read_version(path: str) -> int:
+    """
+    The format version of a record file, VERSION if it is empty or missing.
+    """
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return VERSION
+    with open(path, 'rb') as f:
+        return _check_header(f.read(HEADER_LENGTH))
+
+def iter_record_bytes(data) -> Iterator[Record]:
+    """
+    Read records from a bytes-like object containing a whole record file.
+    """
+    version = _check_header(data)
+    position = HEADER_LENGTH
+    end = len(data)
+    while position < end:
+        seed, position = decode_varint(data, position)
+        draw_count = None
+        if version >= 3:
+            draw_count = data[position]
+            position += 1
+            if draw_count not in (1, 3):
+                raise ValueError(f'Invalid draw count {draw_count}')
+        length, position = decode_varint(data, position)
+        yield Record(seed, data[position:position + length], version, draw_count)
+        position += length
+
+def iter_records(path: str) -> Iterator[Record]:
+    """
+    Read the records of a file through mmap, so that files larger than
+    memory can be scanned.
+    """
+    if os.path.getsize(path) == 0:
+        return
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        yield from iter_record_bytes(data)
+
+def write_records(path: str, records: Iterable[Record]):
+    with RecordWriter(open(path, 'ab')) as writer:
+        for record in records:
+            writer.write(record)
@@ -0,0 +1,379 @@
+"""
+Headless game server speaking JSON lines over TCP or a Unix socket.
+
+    python -m klondike serve [--host 127.0.0.1] [--port 7777] [--unix PATH]
+
+Every request is one JSON object on one line and gets one response line
+with the same "id". Requests on a connection are answered in order.
+
+    {"id": 1, "op": "create", "seed": 5, "draw_count": 1}
+    {"id": 2, "op": "actions", "session": "1"}
+    {"id": 3, "op": "act", "session": "1", "action": 0}
+    {"id": 4, "op": "undo", "session": "1"}
+    {"id": 5, "op": "hint", "session": "1"}
+    {"id": 6, "op": "solve", "session": "1"}
+    {"id": 7, "op": "close", "session": "1"}
+    {"id": 8, "op": "stats"}
+
+Actions are referred to by their index in the "actions" response, which
+is the order of Game.get_possible_actions(). Responses have "ok": true and
+the result fields, or "ok": false and an "error".
+
+Sessions are kept in one process. The least recently used session is
+evicted when there are `max_sessions` of them, and sessions idle for
+`idle_timeout` seconds are evicted in the background. Hints and solves
+run on a process pool so they never block the event loop.
+"""
+from __future__ import annotations
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import itertools
+import json
+import time
+from .cards import (
+    Suit,
+)
+from .game import Game
+from .record import (
+    ActionCodec,
+)
+from .solver import (
+    Solver,
+)
+from .ui import (
+    render_card_name,
+)
+
+# longest accepted request line in bytes
+MAX_LINE = 64 * 1024
+
+class RequestError(Exception):
+    pass
+
+class Session:
+    __slots__ = ('_id', '_game', '_last_used')
+
+    def __init__(self, session_id: str, game: Game):
+        self._id = session_id
+        self._game = game
+        self._last_used = time.monotonic()
+
+    @property
+    def id(self) -> str:
+        return self._id
+
+    @property
+    def game(self) -> Game:
+        return self._game
+
+    @property
+    def last_used(self) -> float:
+        return self._last_used
+
+    def touch(self):
+        self._last_used = time.monotonic()
+
+class SessionStore:
+    """
+    Sessions in least recently used order.
+    """
+    def __init__(self, max_sessions: int, idle_timeout: float):
+        self._sessions: collections.OrderedDict[str, Session] = collections.OrderedDict()
+        self._max_sessions = max_sessions
+        self._idle_timeout = idle_timeout
+        self._ids = itertools.count(1)
+        self._evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    @property
+    def evicted(self) -> int:
+        return self._evicted
+
+    def create(self, game: Game) -> Session:
+        while len(self._sessions) >= self._max_sessions:
+            self._sessions.popitem(last=False)
+            self._evicted += 1
+        session = Session(str(next(self._ids)), game)
+        self._sessions[session.id] = session
+        return session
+
+    def get(self, session_id: Any) -> Session:
+        session = self._sessions.get(str(session_id))
+        if session is None:
+            raise RequestError(f'Unknown session: {session_id}')
+        session.touch()
+        self._sessions.move_to_end(session.id)
+        return session
+
+    def close(self, session_id: Any):
+        if self._sessions.pop(str(session_id), None) is None:
+            raise RequestError(f'Unknown session: {session_id}')
+
+    def evict_idle(self) -> int:
+        """
+        Evict the sessions that have been idle for longer than the timeout.
+        """
+        cutoff = time.monotonic() - self._idle_timeout
+        count = 0
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if session.last_used > cutoff:
+                break
+            self._sessions.popitem(last=False)
+            count += 1
+        self._evicted += count
+        return count
+
+def solve_position(seed: int, draw_count: int, payload: bytes, max_nodes: int, time_limit: float) -> Tuple[str, Optional[bytes]]:
+    """
+    Solve the game of `seed` after the actions encoded in `payload`.
+    Runs on the executor, so the game is passed as a record.
+    Returns the status name and the encoded solution.
+    """
+    game = Game.replay(seed, ActionCodec.decode_all(payload), draw_count)
+    result = Solver(max_nodes, time_limit).solve(game)
+    if result.actions is None:
+        return result.status.name, None
+    return result.status.name, ActionCodec.encode_all(result.actions)
+
+def game_state(game: Game) -> Dict[str, Any]:
+    """
+    What a player can see of `game`. Face-down cards are None.
+    """
+    observation = game.observation
+    waste_top = observation.waste_top
+    return {
+        'seed': game.seed,
+        'draw_count': observation.draw_count,
+        'deck': observation.deck_size,
+        'waste': None if waste_top is None else render_card_name(waste_top),
+        'waste_size': observation.waste_size,
+        'piles': [
+            [None] * pile.hidden_count + [render_card_name(card) for card in pile]
+            for pile in observation.piles
+        ],
+        'foundations': {suit.name: observation.foundation_height(suit) for suit in Suit},
+        'moves': observation.moves,
+        'won': observation.is_won(),
+    }
+
+class Server:
+    def __init__(
+        self,
+        max_sessions: int = 10000,
+        idle_timeout: float = 600.0,
+        executor: Optional[concurrent.futures.Executor] = None,
+        max_jobs: int = 16,
+        hint_nodes: int = 20000,
+        hint_time: float = 2.0,
+    ):
+        self._sessions = SessionStore(max_sessions, idle_timeout)
+        self._idle_timeout = idle_timeout
+        self._executor = executor
+        self._max_jobs = max_jobs
+        self._jobs: Optional[asyncio.Semaphore] = None
+        self._hint_nodes = hint_nodes
+        self._hint_time = hint_time
+        self._requests = 0
+        self._connections = 0
+        self._handlers: Dict[str, Callable[[Dict], Any]] = {
+            'create': self._create,
+            'actions': self._actions,
+            'act': self._act,
+            'undo': self._undo,
+            'hint': self._hint,
+            'solve': self._solve,
+            'close': self._close,
+            'stats': self._stats,
+        }
+
+    @property
+    def sessions(self) -> SessionStore:
+        return self._sessions
+
+    async def handle_request(self, request: Dict) -> Dict:
+        self._requests += 1
+        response: Dict[str, Any] = {'id': request.get('id')}
+        try:
+            op = request.get('op')
+            if not isinstance(op, str):
+                raise RequestError(f'Invalid op: {op}')
+            handler = self._handlers.get(op)
+            if handler is None:
+                raise RequestError(f'Unknown op: {op}')
+            result = handler(request)
+            if asyncio.iscoroutine(result):
+                result = await result
+            response['ok'] = True
+            response.update(result)
+        except (RequestError, ValueError) as e:
+            response['ok'] = False
+            response['error'] = str(e)
+        except Exception as e:
+            # a bug answers this request with an error, not the connection
+            response['ok'] = False
+            response['error'] = f'Internal error: {e.__class__.__name__}: {e}'
+        return response
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._connections += 1
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # line longer than MAX_LINE
+                    break
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError('Request is not an object')
+                except ValueError as e:
+                    response: Dict[str, Any] = {'id': None, 'ok': False, 'error': f'Invalid request: {e}'}
+                else:
+                    response = await self.handle_request(request)
+                writer.write(json.dumps(response).encode('utf-8') + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self._connections -= 1
+            writer.close()
+
+    async def evict_idle_sessions(self):
+        while True:
+            await asyncio.sleep(self._idle_timeout / 4)
+            self._sessions.evict_idle()
+
+    async def _run_job(self, fn: Callable, *args) -> Any:
+        if self._jobs is None:
+            self._jobs = asyncio.Semaphore(self._max_jobs)
+        async with self._jobs:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _session(self, request: Dict) -> Session:
+        return self._sessions.get(request.get('session'))
+
+    def _create(self, request: Dict) -> Dict:
+        seed = request.get('seed')
+        draw_count = request.get('draw_count', 1)
+        if seed is not None and not isinstance(seed, int):
+            raise RequestError('seed must be an integer')
+        # not 1.0 or True, which equal 1
+        if type(draw_count) is not int or draw_count not in (1, 3):
+            raise RequestError('draw_count must be 1 or 3')
+        session = self._sessions.create(Game.create(seed, draw_count))
+        return {'session': session.id, 'state': game_state(session.game)}
+
+    def _actions(self, request: Dict) -> Dict:
+        game = self._session(request).game
+        return {'actions': [action.to_text() for action in game.get_possible_actions()]}
+
+    def _act(self, request: Dict) -> Dict:
+        game = self._session(request).game
+        actions = game.get_possible_actions()
+        index = request.get('action')
+        if not isinstance(index, int) or not 0 <= index < len(actions):
+            raise RequestError(f'Invalid action: {index}')
+        game.run_action(actions[index])
+        return {'state': game_state(game)}
+
+    def _undo(self, request: Dict) -> Dict:
+        game = self._session(request).game
+        if game.history.length == 0:
+            raise RequestError('Nothing to undo')
+        game.undo()
+        return {'state': game_state(game)}
+
+    async def _solve_session(self, request: Dict) -> Tuple[Game, str, Optional[bytes]]:
+        game = self._session(request).game
+        payload = ActionCodec.encode_all(game.history.actions)
+        state = game.zobrist_hash()
+        status, solution = await self._run_job(
+            solve_position, game.seed, game.draw_count, payload, self._hint_nodes, self._hint_time
+        )
+        # the same length after an undo and another action isn't the same game
+        if game.zobrist_hash() != state:
+            raise RequestError('Game changed while solving')
+        return game, status, solution
+
+    async def _hint(self, request: Dict) -> Dict:
+        game, status, solution = await self._solve_session(request)
+        if not solution:
+            return {'action': None, 'text': None, 'status': status}
+        _, end = ActionCodec.decode(solution, 0)
+        first = solution[:end]
+        for index, candidate in enumerate(game.get_possible_actions()):
+            if ActionCodec.encode_all([candidate]) == first:
+                return {'action': index, 'text': candidate.to_text(), 'status': status}
+        raise RequestError('Hint is not a possible action')
+
+    async def _solve(self, request: Dict) -> Dict:
+        _, status, solution = await self._solve_session(request)
+        length = None if solution is None else sum(1 for _ in ActionCodec.decode_all(solution))
+        return {'status': status, 'length': length}
+
+    def _close(self, request: Dict) -> Dict:
+        self._sessions.close(request.get('session'))
+        return {}
+
+    def _stats(self, request: Dict) -> Dict:
+        return {
+            'sessions': len(self._sessions),
+            'evicted': self._sessions.evicted,
+            'connections': self._connections,
+            'requests': self._requests,
+        }
+
+async def serve(server: Server, host: str = '127.0.0.1', port: int = 7777, unix: Optional[str] = None):
+    if unix is not None:
+        listener = await asyncio.start_unix_server(server.handle_connection, unix, limit=MAX_LINE)
+    else:
+        listener = await asyncio.start_server(server.handle_connection, host, port, limit=MAX_LINE)
+    eviction = asyncio.create_task(server.evict_idle_sessions())
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        eviction.cancel()
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(prog='python -m klondike serve', description='Serve games as JSON lines')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7777)
+    parser.add_argument('--unix', help='listen on this Unix socket instead of TCP')
+    parser.add_argument('--max-sessions', type=int, default=10000, help='sessions kept before evicting the least recently used')
+    parser.add_argument('--idle-timeout', type=float, default=600.0, help='seconds before an idle session is evicted')
+    parser.add_argument('--workers', type=int, default=None, help='processes for hints and solves, defaults to the CPU count')
+    parser.add_argument('--hint-nodes', type=int, default=20000, help='node budget of a hint or solve')
+    parser.add_argument('--hint-time', type=float, default=2.0, help='time budget of a hint or solve in seconds')
+    args = parser.parse_args(argv)
+    with concurrent.futures.ProcessPoolExecutor(args.workers) as executor:
+        server = Server(
+            max_sessions=args.max_sessions,
+            idle_timeout=args.idle_timeout,
+            executor=executor,
+            hint_nodes=args.hint_nodes,
+            hint_time=args.hint_time,
+        )
+        try:
+            asyncio.run(serve(server, args.host, args.port, args.unix))
+        except KeyboardInterrupt:
+            pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,409 @@
+"""
+Depth-first search for a winning sequence of actions.
+"""
+from __future__ import annotations
+from typing import (
+    Dict,
+    List,
+    Optional,
+    Set,
+)
+import enum
+import time
+from .game import Game
+from .canonical import (
+    canonical_hash,
+)
+from .ttable import (
+    LOST,
+    WON,
+    TranspositionTable,
+)
+from .deadend import (
+    is_dead_end,
+    is_stock_stuck,
+)
+from .actions import (
+    Action,
+    DrawFromDeckAction,
+    MoveFromWasteToPileAction,
+    MoveFromFoundationToPileAction,
+    MoveFromPileToPileAction,
+    MoveFromWasteToFoundationAction,
+    MoveFromPileToFoundationAction,
+    MoveFromStockToFoundationAction,
+    expand_actions,
+)
+
+# mixed into the keys of the transposition table, so that the same state
+# under different draw rules has a different key
+DRAW_COUNT_SALT = 0x9e3779b97f4a7c15
+KEY_MASK = (1 << 64) - 1
+
+class SolveStatus(enum.Enum):
+    SOLVED = 1
+    # the whole reachable state space was searched without finding a win
+    UNSOLVABLE = 2
+    NODE_LIMIT = 3
+    TIME_LIMIT = 4
+    MEMORY_LIMIT = 5
+
+class SolveResult:
+    def __init__(
+        self,
+        status: SolveStatus,
+        actions: Optional[List[Action]],
+        nodes: int,
+        elapsed: float,
+        pruned: int = 0,
+    ):
+        self._status = status
+        self._actions = actions
+        self._nodes = nodes
+        self._elapsed = elapsed
+        self._pruned = pruned
+
+    @property
+    def status(self) -> SolveStatus:
+        return self._status
+
+    @property
+    def solved(self) -> bool:
+        return self._status is SolveStatus.SOLVED
+
+    @property
+    def actions(self) -> Optional[List[Action]]:
+        """
+        The winning actions if the game was solved, otherwise None.
+        """
+        return self._actions
+
+    @property
+    def nodes(self) -> int:
+        return self._nodes
+
+    @property
+    def elapsed(self) -> float:
+        return self._elapsed
+
+    @property
+    def pruned(self) -> int:
+        """
+        Nodes that weren't expanded because they were provably lost.
+        """
+        return self._pruned
+
+    def __repr__(self):
+        length = None if self._actions is None else len(self._actions)
+        return f'{self.__class__.__name__}({self._status.name}, length={length}, nodes={self._nodes}, elapsed={self._elapsed:.3f})'
+
+# check the clock only every this many nodes
+TIME_CHECK_INTERVAL = 1024
+
+class Solver:
+    """
+    Depth-first search with a transposition table of Zobrist hashes.
+
+    A state is expanded at most once, which cuts every cycle: drawing through
+    the whole deck without playing anything and moving cards back and forth
+    between piles both lead back to states that were already visited.
+    Moves are tried in order of how likely they are to make progress.
+
+    Limits are optional. `max_states` bounds the size of the transposition
+    table and with it the memory used by a search. With `prune_dead_ends`,
+    states that klondike.deadend proves lost aren't expanded. The blocked
+    card check only needs to run at the root and the stuck stock check only
+    when drawing is the only move left, so pruning costs next to nothing
+    per node.
+
+    With `use_macros`, drawing from the deck is replaced by the macro actions
+    of Game.get_macro_actions(), which play a card from the deck in one step.
+    That makes the search much shallower. Solutions are returned as
+    primitive actions either way.
+
+    With a shared `table`, states proven lost are stored in it and pruned,
+    also when found by other processes, see _LossProofs. The states of a
+    solution are stored as won.
+
+    With `symmetry`, visited states are detected by their canonical_hash(),
+    so positions that only differ by swapped suits of the same color or
+    the order of the piles are searched once.
+
+    With `auto_play`, a state with a safe move to a foundation only tries
+    that move, see Game.safe_foundation_moves(), and a state whose pile
+    cards are all face up is finished with Game.auto_complete().
+    """
+    def __init__(
+        self,
+        max_nodes: Optional[int] = None,
+        time_limit: Optional[float] = None,
+        max_states: Optional[int] = None,
+        prune_dead_ends: bool = True,
+        use_macros: bool = False,
+        table: Optional[TranspositionTable] = None,
+        symmetry: bool = False,
+        time_check_interval: int = TIME_CHECK_INTERVAL,
+        auto_play: bool = False,
+    ):
+        self._max_nodes = max_nodes
+        self._time_limit = time_limit
+        self._max_states = max_states
+        self._prune_dead_ends = prune_dead_ends
+        self._use_macros = use_macros
+        self._table = table
+        self._symmetry = symmetry
+        # nodes between checks of the time limit
+        self._time_check_interval = time_check_interval
+        self._auto_play = auto_play
+
+    def solve(self, game: Game) -> SolveResult:
+        """
+        Search for a win from the current state of `game`.
+        The game is searched in place with run_action() and undo() and left
+        in its original state.
+        """
+        start_time = time.monotonic()
+        deadline = None if self._time_limit is None else start_time + self._time_limit
+        max_nodes = self._max_nodes
+        max_states = self._max_states
+        prune_dead_ends = self._prune_dead_ends
+        table = self._table
+        salt = (game.draw_count - 1) * DRAW_COUNT_SALT & KEY_MASK
+        proofs = None if table is None else _LossProofs(table, salt)
+        symmetry = self._symmetry
+        time_check_interval = self._time_check_interval
+        auto_play = self._auto_play
+        start_length = game.history.length
+        visited: Set[int] = {canonical_hash(game) if symmetry else game.zobrist_hash()}
+        nodes = 0
+        pruned = 0
+        status = SolveStatus.UNSOLVABLE
+        solution = None
+        # candidate actions of each state on the current path, best last
+        stack = [self.ordered_actions(game)]
+        if game.is_won():
+            status = SolveStatus.SOLVED
+            solution = []
+        elif proofs is not None and proofs.is_lost(game.zobrist_hash()):
+            pruned += 1
+            stack.clear()
+        elif prune_dead_ends and is_dead_end(game):
+            pruned += 1
+            stack.clear()
+            if proofs is not None:
+                proofs.store_lost(game.zobrist_hash())
+        elif proofs is not None:
+            proofs.enter(game.zobrist_hash(), nodes)
+        try:
+            while stack and status is SolveStatus.UNSOLVABLE:
+                candidates = stack[-1]
+                if not candidates:
+                    stack.pop()
+                    if proofs is not None:
+                        proofs.leave(game.zobrist_hash(), nodes)
+                    if len(stack) > 0:
+                        game.undo()
+                    continue
+                game.run_action(candidates.pop())
+                state_hash = game.zobrist_hash()
+                visited_key = canonical_hash(game) if symmetry else state_hash
+                if visited_key in visited:
+                    if proofs is not None:
+                        proofs.revisit(state_hash)
+                    game.undo()
+                    continue
+                visited.add(visited_key)
+                nodes += 1
+                if game.is_won() or (auto_play and game.can_auto_complete() and game.auto_complete() is not None):
+                    status = SolveStatus.SOLVED
+                    solution = expand_actions(game.history.actions[start_length:])
+                elif max_nodes is not None and nodes >= max_nodes:
+                    status = SolveStatus.NODE_LIMIT
+                elif max_states is not None and len(visited) >= max_states:
+                    status = SolveStatus.MEMORY_LIMIT
+                elif (
+                    deadline is not None
+                    and nodes % time_check_interval == 0
+                    and time.monotonic() >= deadline
+                ):
+                    status = SolveStatus.TIME_LIMIT
+                elif proofs is not None and proofs.is_lost(state_hash):
+                    pruned += 1
+                    game.undo()
+                else:
+                    candidates = self.ordered_actions(game)
+                    if (
+                        prune_dead_ends
+                        and len(candidates) == 1
+                        and isinstance(candidates[0], DrawFromDeckAction)
+                        and is_stock_stuck(game)
+                    ):
+                        # only cycling through the deck is left
+                        pruned += 1
+                        if proofs is not None:
+                            proofs.store_lost(state_hash)
+                        game.undo()
+                    else:
+                        stack.append(candidates)
+                        if proofs is not None:
+                            proofs.enter(state_hash, nodes)
+        finally:
+            won_length = game.history.length
+            while game.history.length > start_length:
+                if status is SolveStatus.SOLVED and table is not None:
+                    table.store(game.zobrist_hash() ^ salt, WON, nodes, won_length - game.history.length)
+                game.undo()
+            if status is SolveStatus.SOLVED and table is not None:
+                table.store(game.zobrist_hash() ^ salt, WON, nodes, won_length - start_length)
+        return SolveResult(status, solution, nodes, time.monotonic() - start_time, pruned)
+
+    def ordered_actions(self, game: Game) -> List[Action]:
+        """
+        Possible actions of `game` sorted so that the most promising one is
+        last, ready to be popped. Moves that can't make progress are left out.
+        """
+        if self._auto_play:
+            safe_moves = game.safe_foundation_moves()
+            if safe_moves:
+                # no other move can be better
+                return safe_moves[:1]
+        # priorities: 0 is tried last
+        buckets: List[List[Action]] = [[], [], [], [], [], []]
+        piles = game.piles
+        for action in game.iter_actions():
+            if isinstance(action, (MoveFromPileToFoundationAction, MoveFromWasteToFoundationAction)):
+                buckets[5].append(action)
+            elif isinstance(action, MoveFromPileToPileAction):
+                source_pile = piles[action.source_pile_index]
+                if action.count == source_pile.revealed_count:
+                    if action.count == len(source_pile.codes) and len(piles[action.target_pile_index].codes) == 0:
+                        # moving a whole pile to an empty pile only renumbers the piles
+                        continue
+                    # reveals a card or empties the pile
+                    buckets[4].append(action)
+                else:
+                    buckets[1].append(action)
+            elif isinstance(action, MoveFromWasteToPileAction):
+                buckets[3].append(action)
+            elif isinstance(action, DrawFromDeckAction):
+                if not self._use_macros:
+                    buckets[2].append(action)
+            elif isinstance(action, MoveFromFoundationToPileAction):
+                buckets[0].append(action)
+        if self._use_macros:
+            for action in game.get_macro_actions():
+                if isinstance(action, MoveFromStockToFoundationAction):
+                    buckets[4].append(action)
+                else:
+                    buckets[3].append(action)
+        return [action for bucket in buckets for action in bucket]
+
+class _LossProofs:
+    """
+    Finds the states that a search proves lost and stores them in a
+    transposition table.
+
+    A state whose children are all lost is lost, but most states can move
+    back to a state higher on the path, which isn't finished yet. So the
+    states are grouped like in Tarjan's strongly connected components
+    algorithm: a finished state that reaches a state on the path is kept
+    pending with the lowest depth it reaches. When the state at that depth
+    finishes, it and its pending states can only move among themselves or
+    to lost states, so they are all lost. A move to a visited state that
+    isn't lost, on the path or pending, such as one dropped by the node
+    limit, makes the whole group unprovable.
+    """
+    def __init__(self, table: TranspositionTable, salt: int):
+        self._table = table
+        self._salt = salt
+        # depth of the states on the path and lowest depth reached by pending states
+        self._open: Dict[int, int] = {}
+        # for each state on the path
+        self._lows: List[int] = []
+        self._provable: List[bool] = []
+        self._pending: List[List[int]] = []
+        self._entered: List[int] = []
+
+    def is_lost(self, state_hash: int) -> bool:
+        entry = self._table.probe(state_hash ^ self._salt)
+        return entry is not None and entry.result == LOST
+
+    def store_lost(self, state_hash: int, depth: int = 0):
+        """
+        Store a state proven lost by `depth` nodes of search. The dead ends
+        found by klondike.deadend are stored with depth 0, so DEPTH_PREFERRED
+        drops them from full buckets: checking them again costs less than a
+        node.
+        """
+        self._table.store(state_hash ^ self._salt, LOST, depth)
+
+    def enter(self, state_hash: int, nodes: int):
+        depth = len(self._lows)
+        self._open[state_hash] = depth
+        self._lows.append(depth)
+        self._provable.append(True)
+        self._pending.append([])
+        self._entered.append(nodes)
+
+    def revisit(self, state_hash: int):
+        """
+        The state on top of the path has a move to an already visited state.
+        """
+        low = self._open.get(state_hash)
+        if low is not None:
+            if low < self._lows[-1]:
+                self._lows[-1] = low
+        elif self._provable[-1] and not self.is_lost(state_hash):
+            self._provable[-1] = False
+
+    def leave(self, state_hash: int, nodes: int):
+        """
+        All moves of the state on top of the path have been searched.
+        """
+        depth = len(self._lows) - 1
+        low = self._lows.pop()
+        provable = self._provable.pop()
+        pending = self._pending.pop()
+        entered = self._entered.pop()
+        if low < depth:
+            # decided together with the state at depth `low`
+            self._open[state_hash] = low
+            pending.append(state_hash)
+            if low < self._lows[-1]:
+                self._lows[-1] = low
+            self._provable[-1] = self._provable[-1] and provable
+            self._pending[-1] += pending
+            return
+        del self._open[state_hash]
+        for pending_hash in pending:
+            del self._open[pending_hash]
+        if provable:
+            # the pending states are proven by the same search
+            depth = nodes - entered
+            self.store_lost(state_hash, depth)
+            for pending_hash in pending:
+                self.store_lost(pending_hash, depth)
+        elif self._provable:
+            self._provable[-1] = False
+
+def solve(
+    game: Game,
+    max_nodes: Optional[int] = None,
+    time_limit: Optional[float] = None,
+    max_states: Optional[int] = None,
+    prune_dead_ends: bool = True,
+    use_macros: bool = False,
+    table: Optional[TranspositionTable] = None,
+    symmetry: bool = False,
+    auto_play: bool = False,
+) -> SolveResult:
+    return Solver(
+        max_nodes,
+        time_limit,
+        max_states,
+        prune_dead_ends,
+        use_macros,
+        table,
+        symmetry,
+        auto_play=auto_play,
+    ).solve(game)
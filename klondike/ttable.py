@@ -0,0 +1,190 @@
+"""
+Fixed-size transposition table in a memory-mapped file, shared by solver
+processes.
+
+The table maps 64-bit state hashes to what is known about the state: its
+result (lost or won), the work spent to find it out (depth) and the number
+of moves to a win (bound). The file is
+
+    header      HEADER, 32 bytes
+    buckets     BUCKET_SIZE slots of SLOT, 16 bytes each
+
+A hash is stored in the bucket selected by its low bits. Slots are written
+without locks: a slot holds the hash XOR the packed entry and the packed
+entry, so a slot torn by two processes writing at once fails the check on
+read and counts as a miss.
+
+When a bucket is full, the entry with the least depth is replaced. With
+the DEPTH_PREFERRED policy that happens only if the new entry has at least
+as much depth, with ALWAYS_REPLACE always.
+"""
+from __future__ import annotations
+from typing import (
+    Dict,
+    NamedTuple,
+    Optional,
+)
+import mmap
+import struct
+
+MAGIC = b'KLTT'
+VERSION = 1
+# magic, version, bucket count
+HEADER = struct.Struct('<4sB3xQ16x')
+# hash XOR entry, entry
+SLOT = struct.Struct('<QQ')
+BUCKET_SIZE = 4
+BUCKET = struct.Struct('<' + 'Q' * 2 * BUCKET_SIZE)
+
+# results
+LOST = 1
+WON = 2
+
+DEPTH_PREFERRED = 'depth'
+ALWAYS_REPLACE = 'always'
+
+MAX_DEPTH = 0xffffffff
+MAX_BOUND = 0xffff
+
+class Entry(NamedTuple):
+    result: int
+    depth: int
+    bound: int
+
+def _pack(result: int, depth: int, bound: int) -> int:
+    # result in the low byte, so a used slot is never 0
+    return min(depth, MAX_DEPTH) << 32 | min(bound, MAX_BOUND) << 8 | result
+
+def _unpack(value: int) -> Entry:
+    return Entry(value & 0xff, value >> 32, (value >> 8) & 0xffff)
+
+class TranspositionTable:
+    def __init__(self, path: str, policy: str = DEPTH_PREFERRED):
+        if policy not in (DEPTH_PREFERRED, ALWAYS_REPLACE):
+            raise ValueError(f'Invalid replacement policy: {policy}')
+        self._path = path
+        self._policy = policy
+        self._file = open(path, 'r+b')
+        header = self._file.read(HEADER.size)
+        if len(header) < HEADER.size or header[:len(MAGIC)] != MAGIC:
+            self._file.close()
+            raise ValueError('Not a transposition table')
+        _, version, bucket_count = HEADER.unpack(header)
+        if version != VERSION:
+            self._file.close()
+            raise ValueError(f'Unsupported transposition table version {version}')
+        self._mask = bucket_count - 1
+        self._data = mmap.mmap(self._file.fileno(), 0)
+        self._hits = 0
+        self._misses = 0
+        self._stores = 0
+        self._collisions = 0
+        self._rejected = 0
+
+    @classmethod
+    def create(cls, path: str, entries: int = 1 << 20, policy: str = DEPTH_PREFERRED) -> TranspositionTable:
+        """
+        Create a table for at least `entries` entries, rounded up so that
+        the number of buckets is a power of two.
+        """
+        bucket_count = 1
+        while bucket_count * BUCKET_SIZE < entries:
+            bucket_count *= 2
+        with open(path, 'xb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, bucket_count))
+            f.truncate(HEADER.size + bucket_count * BUCKET.size)
+        return cls(path, policy)
+
+    @classmethod
+    def open(cls, path: str, policy: str = DEPTH_PREFERRED) -> TranspositionTable:
+        return cls(path, policy)
+
+    def __getstate__(self):
+        # processes open the file themselves, which shares the mapping
+        return (self._path, self._policy)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def capacity(self) -> int:
+        return (self._mask + 1) * BUCKET_SIZE
+
+    def _bucket_offset(self, key: int) -> int:
+        return HEADER.size + (key & self._mask) * BUCKET.size
+
+    def probe(self, key: int) -> Optional[Entry]:
+        slots = BUCKET.unpack_from(self._data, self._bucket_offset(key))
+        for i in range(0, 2 * BUCKET_SIZE, 2):
+            value = slots[i + 1]
+            if value and slots[i] ^ value == key:
+                self._hits += 1
+                return _unpack(value)
+        self._misses += 1
+        return None
+
+    def store(self, key: int, result: int, depth: int = 0, bound: int = 0):
+        offset = self._bucket_offset(key)
+        slots = BUCKET.unpack_from(self._data, offset)
+        value = _pack(result, depth, bound)
+        victim = None
+        victim_depth = MAX_DEPTH + 1
+        for i in range(0, 2 * BUCKET_SIZE, 2):
+            old_value = slots[i + 1]
+            if not old_value:
+                victim = i
+                break
+            if slots[i] ^ old_value == key:
+                if old_value >> 32 > depth and old_value & 0xff == result:
+                    # already known with more work behind it
+                    return
+                victim = i
+                break
+            if old_value >> 32 < victim_depth:
+                victim = i
+                victim_depth = old_value >> 32
+        else:
+            if self._policy == DEPTH_PREFERRED and victim_depth > depth:
+                self._rejected += 1
+                return
+            self._collisions += 1
+        assert victim is not None
+        SLOT.pack_into(self._data, offset + victim // 2 * SLOT.size, key ^ value, value)
+        self._stores += 1
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Counters of this process. Collisions are stores that replaced the
+        entry of another state, rejections stores dropped by the policy.
+        """
+        return {
+            'hits': self._hits,
+            'misses': self._misses,
+            'stores': self._stores,
+            'collisions': self._collisions,
+            'rejected': self._rejected,
+        }
+
+    def occupancy(self) -> int:
+        """
+        Number of used slots, counted by scanning the whole table.
+        """
+        count = 0
+        for offset in range(HEADER.size, len(self._data), BUCKET.size):
+            slots = BUCKET.unpack_from(self._data, offset)
+            count += sum(1 for i in range(1, 2 * BUCKET_SIZE, 2) if slots[i])
+        return count
+
+    def close(self):
+        self._data.close()
+        self._file.close()
+
+    def __enter__(self) -> TranspositionTable:
+        return self
+
+    def __exit__(self, *args):
+        self.close()
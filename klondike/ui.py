@@ -1,9 +1,17 @@
 from typing import (
     Dict,
+    Iterable,
     List,
+    Optional,
+    TextIO,
+    Tuple,
 )
+import argparse
 import itertools
+import sys
+import time
 from .cards import (
+    CARDS,
     Color,
     Card,
     Suit,
@@ -14,6 +22,12 @@ from .cards import (
     Foundation,
 )
 from .game import Game
+from .actions import (
+    Action,
+)
+from .record import (
+    iter_records,
+)
 
 SUIT_TO_TEXT: Dict[Suit, str] = {
     Suit.CLUBS: '♣',
@@ -97,3 +111,159 @@ def render_game(game: Game) -> str:
         piles=render_piles(game.piles),
         foundations=' | '.join(render_foundation(f) for f in game.foundations),
     )
+
+# rendered cards by card code, and empty foundations by suit index
+CARD_GLYPHS: Tuple[str, ...] = tuple(render_card_unicode(card) for card in CARDS)
+EMPTY_FOUNDATION_GLYPHS: Tuple[str, ...] = tuple(render_foundation(Foundation(Suit(i + 1))) for i in range(4))
+FACE_DOWN_GLYPH = '🂠'
+SCREEN_COLORS = '\033[48;5;2;38;5;15m'
+RESET_COLORS = '\033[0m'
+# lines above the rows of the piles
+_HEADER_LINES = 3
+
+class TerminalRenderer:
+    """
+    Renders successive states of games as escape codes that update the
+    previous frame on the terminal in place. Only the lines that changed
+    are rewritten, and only the piles and foundations that changed since
+    the previous frame are rendered again from the cached glyphs.
+
+    The frame shows the Zobrist hash instead of the SHA-256 hash of
+    render_game(), and the foundations above the piles so that their
+    line stays put when the piles grow.
+    """
+    def __init__(self, output: TextIO = sys.stdout):
+        self._output = output
+        # lines of the previous frame, None to clear the screen first
+        self._lines: Optional[List[str]] = None
+        self._foundation_heights = b''
+        self._foundations_line = ''
+        self._pile_codes: List[bytes] = []
+        self._pile_revealed_counts: List[int] = []
+        self._pile_cells: List[List[str]] = []
+
+    def reset(self):
+        """
+        Draw the whole screen again on the next frame, after other output.
+        """
+        self._lines = None
+
+    def render(self, game: Game) -> str:
+        """
+        The escape codes that turn the previous frame into the frame of `game`.
+        """
+        waste_codes = game.waste.codes
+        lines = [
+            f'{game.zobrist_hash():016x}',
+            '{} | {} | {}'.format(
+                FACE_DOWN_GLYPH if game.deck.codes else ' ',
+                CARD_GLYPHS[waste_codes[-1]] if waste_codes else ' ',
+                game.history.length,
+            ),
+            self._render_foundations(game),
+        ]
+        previous = self._lines or []
+        changed_row = self._update_piles(game.piles)
+        if self._lines is None:
+            changed_row = 0
+        lines += previous[_HEADER_LINES:_HEADER_LINES + changed_row]
+        cells = self._pile_cells
+        height = max(len(pile_cells) for pile_cells in cells)
+        for i in range(len(lines) - _HEADER_LINES, height):
+            lines.append(' '.join(pile_cells[i] if i < len(pile_cells) else ' ' for pile_cells in cells))
+
+        out = []
+        if self._lines is None:
+            out.append(RESET_COLORS + '\033[H\033[2J')
+        for i, line in enumerate(lines):
+            if i >= len(previous) or previous[i] != line:
+                out.append(f'\033[{i + 1};1H\033[K{SCREEN_COLORS}{line}{RESET_COLORS}')
+        for i in range(len(lines), len(previous)):
+            out.append(f'\033[{i + 1};1H\033[K')
+        if out:
+            out.append(f'\033[{len(lines) + 1};1H')
+        self._lines = lines
+        return ''.join(out)
+
+    def draw(self, game: Game):
+        """
+        Write the frame of `game` to the output.
+        """
+        self._output.write(self.render(game))
+        self._output.flush()
+
+    def _render_foundations(self, game: Game) -> str:
+        heights = bytes(foundation.height for foundation in game.foundations)
+        if heights != self._foundation_heights:
+            self._foundation_heights = heights
+            self._foundations_line = ' | '.join(
+                CARD_GLYPHS[foundation.top_code] if foundation.height
+                else EMPTY_FOUNDATION_GLYPHS[foundation.suit.value - 1]
+                for foundation in game.foundations
+            )
+        return self._foundations_line
+
+    def _update_piles(self, piles: List[Pile]) -> int:
+        """
+        Render the cells of the piles that changed again, and return the
+        first row that changed.
+        """
+        if len(self._pile_cells) != len(piles):
+            self._pile_codes = [b''] * len(piles)
+            self._pile_revealed_counts = [0] * len(piles)
+            self._pile_cells = [[] for _ in piles]
+        changed_row = sys.maxsize
+        for j, pile in enumerate(piles):
+            codes = pile.codes
+            revealed_count = pile.revealed_count
+            if codes == self._pile_codes[j] and revealed_count == self._pile_revealed_counts[j]:
+                continue
+            self._pile_codes[j] = bytes(codes)
+            self._pile_revealed_counts[j] = revealed_count
+            hidden_count = len(codes) - revealed_count
+            cells = [FACE_DOWN_GLYPH] * hidden_count
+            cells += [CARD_GLYPHS[code] for code in codes[hidden_count:]]
+            old_cells = self._pile_cells[j]
+            row = 0
+            while row < len(cells) and row < len(old_cells) and cells[row] == old_cells[row]:
+                row += 1
+            changed_row = min(changed_row, row)
+            self._pile_cells[j] = cells
+        return changed_row
+
+def watch(game: Game, actions: Iterable[Action], fps: float = 10.0, output: TextIO = sys.stdout) -> Game:
+    """
+    Run `actions` on `game` and draw a frame after each of them, at most
+    `fps` frames per second. Returns the game.
+    """
+    renderer = TerminalRenderer(output)
+    interval = 1 / fps
+    renderer.draw(game)
+    next_frame = time.monotonic() + interval
+    for action in actions:
+        game.run_action(action)
+        delay = next_frame - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        renderer.draw(game)
+        # a slow frame delays the next ones instead of bunching them up
+        next_frame = max(next_frame, time.monotonic()) + interval
+    return game
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(prog='python -m klondike watch', description='Watch a replay of a recorded game')
+    parser.add_argument('path', help='file of recorded games, see klondike.record')
+    parser.add_argument('--index', type=int, default=0, help='index of the game in the file')
+    parser.add_argument('--fps', type=float, default=10.0, help='frames per second')
+    args = parser.parse_args(argv)
+    if args.fps <= 0:
+        parser.error('--fps must be positive')
+    record = next(itertools.islice(iter_records(args.path), args.index, None), None)
+    if record is None:
+        parser.error(f'no game {args.index} in {args.path}')
+    actions = list(record.actions())
+    game = Game.create(record.seed, record.draw_count)
+    try:
+        watch(game, actions, args.fps)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,57 @@
+"""
+64-bit Zobrist hashing of game states.
+
+Every (card, location, position, revealed) combination has a precomputed
+random key and the hash of a state is the XOR of the keys of all cards in it.
+Moving a card only changes a few keys, so `Game` keeps the hash up to date
+incrementally instead of rehashing the whole state like `sha256_hash`.
+"""
+from __future__ import annotations
+from typing import (
+    TYPE_CHECKING,
+    List,
+)
+import random
+if TYPE_CHECKING:
+    from .game import Game
+
+DECK = 0
+WASTE = 1
+FOUNDATION = 2
+# pile i is location PILE + i
+PILE = 3
+
+LOCATION_COUNT = PILE + 7
+# deck and waste hold at most 24 cards, piles at most 6 + 13
+POSITION_COUNT = 24
+
+# fixed seed so that hashes are stable between processes and runs
+_random = random.Random(0x6b6c6f6e64696b65)
+KEYS: List[int] = [
+    _random.getrandbits(64)
+    for _ in range(52 * LOCATION_COUNT * POSITION_COUNT * 2)
+]
+
+def key(code: int, location: int, position: int, revealed: bool) -> int:
+    """
+    Key of the card with `code` at `position` of `location`.
+    """
+    return KEYS[((code * LOCATION_COUNT + location) * POSITION_COUNT + position) * 2 + revealed]
+
+def compute_hash(game: Game) -> int:
+    """
+    Hash `game` from scratch.
+    """
+    h = 0
+    for i, code in enumerate(game.deck.codes):
+        h ^= key(code, DECK, i, False)
+    for i, code in enumerate(game.waste.codes):
+        h ^= key(code, WASTE, i, True)
+    for pile_index, pile in enumerate(game.piles):
+        hidden_count = len(pile.codes) - pile.revealed_count
+        for i, code in enumerate(pile.codes):
+            h ^= key(code, PILE + pile_index, i, i >= hidden_count)
+    for foundation in game.foundations:
+        for i, card in enumerate(foundation.cards):
+            h ^= key(card.code, FOUNDATION, i, True)
+    return h
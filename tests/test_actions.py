@@ -0,0 +1,112 @@
+import random
+from typing import List
+import pytest
+from klondike.actions import (
+    Action,
+    DrawFromDeckAction,
+    MoveFromFoundationToPileAction,
+    MoveFromPileToFoundationAction,
+    MoveFromPileToPileAction,
+    MoveFromWasteToFoundationAction,
+    MoveFromWasteToPileAction,
+)
+from klondike.cards import (
+    CARD_SUITS,
+    COLOR_VALUES,
+    KING,
+    RANK_VALUES,
+    Deck,
+    Foundation,
+    Pile,
+    Waste,
+)
+from klondike.game import Game
+
+def _accepts(target_codes: bytearray, code: int) -> bool:
+    if not target_codes:
+        return RANK_VALUES[code] == KING
+    top = target_codes[-1]
+    return COLOR_VALUES[code] != COLOR_VALUES[top] and RANK_VALUES[code] + 1 == RANK_VALUES[top]
+
+def _to_foundation(game: Game, code: int) -> bool:
+    foundation = next(f for f in game.foundations if f.suit == CARD_SUITS[code])
+    return foundation.height == RANK_VALUES[code] - 1
+
+def rescan_actions(game: Game) -> List[Action]:
+    """
+    The move generator from before the pile indexes, which rescans every
+    pair of piles.
+    """
+    actions: List[Action] = []
+    piles = game.piles
+    for i, pile in enumerate(piles):
+        codes = pile.codes
+        if not codes:
+            continue
+        if _to_foundation(game, codes[-1]):
+            actions.append(MoveFromPileToFoundationAction(source_pile_index=i, target_foundation_suit=CARD_SUITS[codes[-1]]))
+        for j, target in enumerate(piles):
+            if i == j:
+                continue
+            for k in range(1, pile.revealed_count + 1):
+                if _accepts(target.codes, codes[-k]):
+                    actions.append(MoveFromPileToPileAction(source_pile_index=i, target_pile_index=j, count=k))
+    waste_codes = game.waste.codes
+    if waste_codes:
+        code = waste_codes[-1]
+        if _to_foundation(game, code):
+            actions.append(MoveFromWasteToFoundationAction(target_foundation_suit=CARD_SUITS[code]))
+        for i, pile in enumerate(piles):
+            if _accepts(pile.codes, code):
+                actions.append(MoveFromWasteToPileAction(target_pile_index=i))
+    for foundation in game.foundations:
+        if foundation.height == 0:
+            continue
+        for i, pile in enumerate(piles):
+            if _accepts(pile.codes, foundation.top_code):
+                actions.append(MoveFromFoundationToPileAction(target_pile_index=i, source_foundation_suit=foundation.suit))
+    if game.deck.codes or waste_codes:
+        actions.append(DrawFromDeckAction(count=game.draw_count))
+    return actions
+
+@pytest.mark.parametrize('draw_count', [1, 3])
+@pytest.mark.parametrize('seed', range(100))
+def test_move_generator_matches_rescan(seed: int, draw_count: int):
+    rng = random.Random(seed)
+    game = Game.create(seed, draw_count)
+    for _ in range(300):
+        expected = rescan_actions(game)
+        assert game.get_possible_actions() == expected
+        lazy = list(game.iter_actions())
+        assert sorted(a.code for a in lazy) == sorted(a.code for a in expected)
+        # moves to foundations first
+        to_foundation = [isinstance(a, (MoveFromPileToFoundationAction, MoveFromWasteToFoundationAction)) for a in lazy]
+        assert to_foundation == sorted(to_foundation, reverse=True)
+        if not expected:
+            break
+        if game.history.length and rng.random() < 0.1:
+            game.undo()
+        else:
+            game.run_action(rng.choice(expected))
+
+def rebuild(game: Game) -> Game:
+    return Game(
+        Deck.from_codes(bytearray(game.deck.codes), game.seed),
+        Waste.from_codes(bytearray(game.waste.codes)),
+        [Pile.from_codes(bytearray(pile.codes), pile.revealed_count) for pile in game.piles],
+        [Foundation.from_height(foundation.suit, foundation.height) for foundation in game.foundations],
+        game.draw_count,
+    )
+
+@pytest.mark.parametrize('draw_count', [1, 3])
+@pytest.mark.parametrize('seed', range(50))
+def test_rebuilt_game_has_same_actions(seed: int, draw_count: int):
+    rng = random.Random(seed)
+    game = Game.create(seed, draw_count)
+    for _ in range(300):
+        actions = game.get_possible_actions()
+        # the rebuilt game only has the containers, as after Game(...)
+        assert rebuild(game).get_possible_actions() == actions
+        if not actions:
+            break
+        game.run_action(rng.choice(actions))
@@ -0,0 +1,118 @@
+import random
+import pytest
+from klondike.actions import (
+    AutoCompleteAction,
+    AutoPlayAction,
+    MoveFromPileToFoundationAction,
+    MoveFromWasteToFoundationAction,
+)
+from klondike.game import Game
+from klondike.solver import (
+    SolveStatus,
+    Solver,
+)
+
+# suit indexes are SPADES, HEARTS, DIAMONDS, CLUBS
+RED = (False, True, True, False)
+
+def is_safe(game: Game, action) -> bool:
+    """
+    Whether `action` moves a card to a foundation that no card still in
+    play could be put on: an ace, a two, or a card at most one rank above
+    both foundations of the other color.
+    """
+    if isinstance(action, MoveFromPileToFoundationAction):
+        code = game.piles[action.source_pile_index].codes[-1]
+    elif isinstance(action, MoveFromWasteToFoundationAction):
+        if game.draw_count == 3:
+            return False
+        code = game.waste.codes[-1]
+    else:
+        return False
+    suit, rank = divmod(code, 13)
+    heights = {foundation.suit.value - 1: foundation.height for foundation in game.foundations}
+    other_color = [heights[other] for other in range(4) if RED[other] != RED[suit]]
+    return rank + 1 <= 2 or rank <= min(other_color) + 1
+
+@pytest.mark.parametrize('draw_count', [1, 3])
+@pytest.mark.parametrize('seed', range(20))
+def test_auto_play_makes_only_safe_moves(seed: int, draw_count: int):
+    rng = random.Random(seed)
+    game = Game.create(seed, draw_count)
+    game.auto_play = True
+    for _ in range(200):
+        actions = game.get_possible_actions()
+        if not actions:
+            break
+        action = rng.choice(actions)
+        # the same action run by hand, then the safe moves one at a time
+        manual = game.fork()
+        manual.auto_play = False
+        manual.run_action(action)
+        game.run_action(action)
+        played = game.history.actions[-1]
+        if played is not action:
+            assert isinstance(played, AutoPlayAction)
+            first, *moves = played.expand()
+            assert first is action and moves
+            for move in moves:
+                assert is_safe(manual, move), move
+                manual.run_action(move)
+        assert not manual.safe_foundation_moves()
+        assert manual.sha256_hash() == game.sha256_hash()
+
+@pytest.mark.parametrize('seed', range(8))
+def test_safe_moves_keep_the_result(seed: int):
+    rng = random.Random(seed)
+    game = Game.create(seed)
+    decided = (SolveStatus.SOLVED, SolveStatus.UNSOLVABLE)
+    checked = 0
+    while checked < 5:
+        actions = game.get_possible_actions()
+        if not actions:
+            break
+        game.run_action(rng.choice(actions))
+        if game.safe_foundation_moves():
+            checked += 1
+            before = Solver(max_nodes=500).solve(game).status
+            played = game.fork()
+            played.play_safe_moves()
+            after = Solver(max_nodes=500).solve(played).status
+            if before in decided and after in decided:
+                assert before is after
+
+def face_up_positions(seed: int, draw_count: int):
+    """
+    The positions along a solution of the deal once every pile card is face up.
+    """
+    result = Solver(max_nodes=50000).solve(Game.create(seed, draw_count))
+    assert result.solved
+    game = Game.create(seed, draw_count)
+    for action in result.actions:
+        if game.can_auto_complete():
+            yield game.fork()
+        game.run_action(action)
+
+@pytest.mark.parametrize('seed, draw_count', [(0, 1), (2, 1), (4, 1), (7, 1), (2, 3)])
+def test_auto_complete(seed: int, draw_count: int):
+    count = 0
+    for game in face_up_positions(seed, draw_count):
+        state = game.sha256_hash()
+        length = game.history.length
+        action = game.auto_complete()
+        if action is None:
+            # only when drawing 3, and then nothing was run
+            assert draw_count == 3
+            assert game.sha256_hash() == state
+            continue
+        count += 1
+        assert isinstance(action, AutoCompleteAction)
+        assert game.is_won()
+        assert game.history.length == length + 1
+        assert Game.replay(seed, game.history.primitive_actions(), draw_count).is_won()
+        # one undo takes it all back, and redo wins again
+        game.undo()
+        assert game.sha256_hash() == state
+        assert game.redo() is action
+        assert game.is_won()
+    assert count
@@ -0,0 +1,98 @@
+import csv
+import os
+import subprocess
+import sys
+import time
+import pytest
+from klondike import batch
+from klondike import dealdb
+from klondike.solver import Solver
+
+def test_resume_csv_without_solution_column(tmp_path):
+    path = os.path.join(tmp_path, 'results.csv')
+    # written before the solution column existed
+    with open(path, 'w', newline='') as f:
+        f.write('seed,status,length,nodes,elapsed\r\n0,timeout,,100,0.01\r\n')
+    assert batch.run(range(3), path, workers=1, solver=Solver(max_nodes=100)) == 2
+    with open(path, newline='') as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == ['seed', 'status', 'length', 'nodes', 'elapsed']
+    assert all(len(row) == 5 for row in rows)
+    assert sorted(result['seed'] for result in batch.read_results(path)) == [0, 1, 2]
+
+def test_resume_csv_with_unknown_columns(tmp_path):
+    path = os.path.join(tmp_path, 'results.csv')
+    with open(path, 'w', newline='') as f:
+        f.write('seed,result\r\n0,won\r\n')
+    with pytest.raises(ValueError):
+        batch.run(range(3), path, workers=1, solver=Solver(max_nodes=100))
+
+def test_query_outside_database(tmp_path, capsys):
+    path = os.path.join(tmp_path, 'deals.kdb')
+    dealdb.DealDB.create(path, base_seed=0, capacity=10).close()
+    with pytest.raises(SystemExit) as exit_info:
+        dealdb.main(['query', path, '3', '50'])
+    assert exit_info.value.code == 1
+    out, err = capsys.readouterr()
+    assert '"seed": 3' in out
+    assert 'Seed 50 is outside the database' in err
+
+def results_without_times(path: str):
+    return sorted(
+        (result['seed'], result['status'], result['length'], result['nodes'], result['solution'])
+        for result in batch.read_results(path)
+    )
+
+@pytest.mark.parametrize('name', ['results.jsonl', 'results.csv'])
+def test_resume_killed_run(tmp_path, name: str):
+    seeds = range(150)
+    solver = Solver(max_nodes=300, time_limit=10.0)
+    expected_path = os.path.join(tmp_path, 'expected-' + name)
+    batch.run(seeds, expected_path, workers=1, solver=solver)
+    path = os.path.join(tmp_path, name)
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'klondike.batch', '--seeds', '0-150', '--workers', '1',
+         '--max-nodes', '300', '--output', path],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline and process.poll() is None:
+            if os.path.exists(path) and os.path.getsize(path) > 2000:
+                break
+            time.sleep(0.01)
+    finally:
+        process.kill()
+        process.wait()
+    with open(path, 'rb') as f:
+        done = f.read().count(b'\n') - name.endswith('.csv')
+    assert 0 < done < len(seeds)
+    # as if killed in the middle of writing a line
+    with open(path, 'ab') as f:
+        f.write(b'{"seed": 149, "sta' if name.endswith('.jsonl') else b'149,solv')
+    assert batch.run(seeds, path, workers=1, solver=solver) == len(seeds) - done
+    assert results_without_times(path) == results_without_times(expected_path)
+
+def test_resume_csv_killed_in_header(tmp_path):
+    path = os.path.join(tmp_path, 'results.csv')
+    with open(path, 'w', newline='') as f:
+        f.write('seed,status,len')
+    assert batch.run(range(3), path, workers=1, solver=Solver(max_nodes=100)) == 3
+    with open(path, newline='') as f:
+        assert next(csv.reader(f)) == batch.FIELDS
+
+def test_cut_partial_line_across_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch, '_TAIL_CHUNK', 3)
+    path = os.path.join(tmp_path, 'results.jsonl')
+    for data, expected in [
+        (b'{"a": 1}\n{"b": 2}\n', b'{"a": 1}\n{"b": 2}\n'),
+        (b'{"a": 1}\n{"b": 2}\n{"c', b'{"a": 1}\n{"b": 2}\n'),
+        (b'{"a": 1}\n{"b": 2, "c": 3, "d": 4', b'{"a": 1}\n'),
+        (b'{"a": 1', b''),
+    ]:
+        with open(path, 'wb') as f:
+            f.write(data)
+        batch._cut_partial_line(path)
+        with open(path, 'rb') as f:
+            assert f.read() == expected
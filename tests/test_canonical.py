@@ -0,0 +1,56 @@
+import random
+from typing import List
+import pytest
+from klondike import canonical
+from klondike.game import Game
+
+def random_positions(seed: int, draw_count: int, length: int = 200) -> List[Game]:
+    rng = random.Random(seed)
+    game = Game.create(seed, draw_count)
+    positions = [game.fork()]
+    for _ in range(length):
+        actions = game.get_possible_actions()
+        if not actions:
+            break
+        game.run_action(rng.choice(actions))
+        positions.append(game.fork())
+    return positions
+
+@pytest.mark.parametrize('draw_count', [1, 3])
+@pytest.mark.parametrize('seed', range(10))
+def test_check(seed: int, draw_count: int):
+    positions = random_positions(seed, draw_count)
+    distinct = canonical.check(positions, seed)
+    assert 0 < distinct <= len({game.zobrist_hash() for game in positions})
+
+@pytest.mark.parametrize('seed', range(10))
+def test_equivalent_positions_collide(seed: int):
+    rng = random.Random(seed)
+    for game in random_positions(seed, 1)[::10]:
+        key = canonical.canonical_key(game)
+        for suit_order in canonical.SUIT_ORDERS:
+            pile_order = list(range(len(game.piles)))
+            foundation_order = list(range(len(game.foundations)))
+            rng.shuffle(pile_order)
+            rng.shuffle(foundation_order)
+            copy = canonical.transform(game, suit_order, pile_order, foundation_order)
+            assert canonical.canonical_key(copy) == key
+            assert canonical.canonical_hash(copy) == canonical.canonical_hash(game)
+
+@pytest.mark.parametrize('seed', range(20))
+def test_suits_of_different_colors_dont_collide(seed: int):
+    game = Game.create(seed)
+    piles = list(range(len(game.piles)))
+    foundations = list(range(len(game.foundations)))
+    # swapping a black suit with a red one changes which moves are legal
+    for suit_order in ([1, 0, 2, 3], [2, 1, 0, 3], [0, 3, 2, 1]):
+        copy = canonical.transform(game, suit_order, piles, foundations)
+        assert canonical.canonical_key(copy) != canonical.canonical_key(game)
+
+@pytest.mark.parametrize('seed', range(5))
+def test_keys_are_equal_only_for_equivalent_positions(seed: int):
+    positions = random_positions(seed, 1, 120)
+    keys = [canonical.canonical_key(game) for game in positions]
+    for i, a in enumerate(positions):
+        for j in range(i + 1, len(positions)):
+            assert (keys[i] == keys[j]) == canonical._equivalent(a, positions[j])
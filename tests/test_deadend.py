@@ -0,0 +1,66 @@
+import random
+import pytest
+from klondike.cards import (
+    Deck,
+    Foundation,
+    Pile,
+    Suit,
+    Waste,
+)
+from klondike.deadend import (
+    find_blocked_card,
+    is_dead_end,
+)
+from klondike.game import Game
+from klondike.solver import (
+    SolveStatus,
+    Solver,
+)
+
+def random_position(rng: random.Random, draw_count: int) -> Game:
+    """
+    Some cards on the foundations and the rest shuffled into the stock and
+    the piles, with the top card of each pile face up. Dealt games are
+    rarely dead ends, these often are.
+    """
+    suits = list(Suit)
+    heights = [rng.randint(0, 13) for _ in suits]
+    codes = [i * 13 + rank for i in range(4) for rank in range(heights[i], 13)]
+    rng.shuffle(codes)
+    piles = [bytearray([codes.pop()]) if codes else bytearray() for _ in range(7)]
+    stock_size = rng.randint(0, len(codes))
+    for code in codes[stock_size:]:
+        piles[rng.randrange(7)].insert(0, code)
+    waste_size = rng.randint(0, stock_size)
+    return Game(
+        Deck.from_codes(bytearray(codes[waste_size:stock_size]), 0),
+        Waste.from_codes(bytearray(codes[:waste_size])),
+        [Pile.from_codes(codes, 1 if codes else 0) for codes in piles],
+        [Foundation.from_height(suit, height) for suit, height in zip(suits, heights)],
+        draw_count,
+    )
+
+@pytest.mark.parametrize('seed', range(4))
+def test_dead_ends_are_not_solvable(seed: int):
+    rng = random.Random(seed)
+    checked = {'blocked': 0, 'stuck': 0}
+    for _ in range(4000):
+        game = random_position(rng, rng.choice((1, 3)))
+        if not is_dead_end(game):
+            continue
+        checked['blocked' if find_blocked_card(game) is not None else 'stuck'] += 1
+        result = Solver(max_nodes=3000, prune_dead_ends=False).solve(game)
+        assert result.status is not SolveStatus.SOLVED, result
+    # both checks were exercised
+    assert checked['blocked'] and checked['stuck']
+
+@pytest.mark.parametrize('seed', range(2))
+def test_pruning_keeps_results(seed: int):
+    rng = random.Random(seed)
+    for _ in range(50):
+        game = random_position(rng, rng.choice((1, 3)))
+        pruned = Solver(max_nodes=1000).solve(game)
+        unpruned = Solver(max_nodes=1000, prune_dead_ends=False).solve(game)
+        decided = (SolveStatus.SOLVED, SolveStatus.UNSOLVABLE)
+        if pruned.status in decided and unpruned.status in decided:
+            assert pruned.status is unpruned.status
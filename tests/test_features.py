@@ -0,0 +1,107 @@
+import random
+import pytest
+np = pytest.importorskip('numpy')
+from klondike.features import (
+    DECK,
+    FOUNDATION,
+    HIDDEN_CARD,
+    UNSEEN,
+    WASTE,
+    FeatureEncoder,
+    encode_records,
+    pack,
+)
+from klondike.game import Game
+from klondike.lockstep import NO_CARD
+from klondike.probability import (
+    deck_is_known,
+    sample_game,
+)
+from klondike.record import Record
+
+def random_games(seed: int, draw_count: int, length: int = 200):
+    rng = random.Random(seed)
+    game = Game.create(seed, draw_count)
+    for _ in range(length):
+        yield game
+        actions = game.get_possible_actions()
+        if not actions:
+            break
+        game.run_action(rng.choice(actions))
+
+def card_locations(game: Game, reveal_hidden: bool):
+    locations = {}
+    known = reveal_hidden or deck_is_known(game)
+    for code in game.deck.codes:
+        locations[code] = DECK if known else UNSEEN
+    for code in game.waste.codes:
+        locations[code] = WASTE
+    for i, pile in enumerate(game.piles):
+        hidden_count = len(pile.codes) - pile.revealed_count
+        for j, code in enumerate(pile.codes):
+            locations[code] = i if reveal_hidden or j >= hidden_count else UNSEEN
+    for code in range(52):
+        locations.setdefault(code, FOUNDATION)
+    return [locations[code] for code in range(52)]
+
+@pytest.mark.parametrize('reveal_hidden', [False, True])
+@pytest.mark.parametrize('draw_count', [1, 3])
+@pytest.mark.parametrize('seed', range(5))
+def test_encode(seed: int, draw_count: int, reveal_hidden: bool):
+    encoder = FeatureEncoder(1, reveal_hidden)
+    for game in random_games(seed, draw_count):
+        features = encoder.encode([game])
+        known = deck_is_known(game)
+        assert bool(features['deck_known'][0]) == known
+        for i, pile in enumerate(game.piles):
+            hidden_count = len(pile.codes) - pile.revealed_count
+            row = features['piles'][0, i]
+            for j, code in enumerate(pile.codes):
+                assert row[j] == (HIDDEN_CARD if j < hidden_count and not reveal_hidden else code)
+            assert (row[len(pile.codes):] == NO_CARD).all()
+            assert features['hidden'][0, i].sum() == hidden_count
+        deck = features['deck'][0]
+        for j, code in enumerate(game.deck.codes):
+            assert deck[j] == (code if reveal_hidden or known else HIDDEN_CARD)
+        assert (deck[len(game.deck.codes):] == NO_CARD).all()
+        locations = features['locations'][0]
+        assert (locations.sum(axis=1) == 1).all()
+        assert list(locations.argmax(axis=1)) == card_locations(game, reveal_hidden)
+
+@pytest.mark.parametrize('draw_count', [1, 3])
+@pytest.mark.parametrize('seed', range(5))
+def test_hidden_cards_dont_leak(seed: int, draw_count: int):
+    # games that only differ by the cards a player can't see
+    rng = random.Random(seed)
+    encoder = FeatureEncoder(2)
+    for game in random_games(seed, draw_count):
+        sample = sample_game(game, rng)
+        known = deck_is_known(game)
+        features = encoder.encode_packed(pack(game) + pack(sample), [seed, seed], [0, 0], [known, known])
+        for name, array in features.items():
+            assert (array[0] == array[1]).all(), name
+
+@pytest.mark.parametrize('draw_count', [1, 3])
+def test_encode_records(draw_count: int):
+    games = [list(random_games(seed, draw_count))[-1] for seed in range(4)]
+    records = [Record.from_game(game) for game in games]
+    # the arrays of a batch are reused by the next one
+    rows = [
+        {name: array[i].copy() for name, array in batch.items()}
+        for batch in encode_records(records, batch_size=64)
+        for i in range(len(batch['seeds']))
+    ]
+    positions = []
+    for game in games:
+        replayed = Game.create(game.seed, draw_count)
+        positions.append(replayed.fork())
+        for action in game.history.actions:
+            replayed.run_action(action)
+            positions.append(replayed.fork())
+    assert len(rows) == len(positions)
+    encoder = FeatureEncoder(1)
+    for row, game in zip(rows, positions):
+        features = encoder.encode([game])
+        for name, array in features.items():
+            assert (row[name] == array[0]).all(), name
+        assert not row['won']
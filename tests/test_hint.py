@@ -0,0 +1,22 @@
+import random
+import pytest
+from klondike.game import Game
+
+@pytest.mark.parametrize('draw_count', [1, 3])
+@pytest.mark.parametrize('seed', range(10))
+def test_hint_with_auto_play(seed: int, draw_count: int):
+    rng = random.Random(seed)
+    game = Game.create(seed, draw_count)
+    game.auto_play = True
+    for _ in range(60):
+        actions = game.get_possible_actions()
+        if not actions:
+            break
+        state = game.zobrist_hash()
+        length = game.history.length
+        hint = game.hint(5.0)
+        assert game.zobrist_hash() == state
+        assert game.history.length == length
+        assert game.auto_play
+        assert hint.action is None or hint.action in actions
+        game.run_action(rng.choice(actions))
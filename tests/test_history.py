@@ -0,0 +1,58 @@
+import random
+import pytest
+from klondike.game import Game
+
+def assert_matches_replay(game: Game):
+    replayed = Game.replay(game.seed, game.history.actions, game.draw_count)
+    assert game.sha256_hash() == replayed.sha256_hash()
+    assert game.zobrist_hash() == replayed.zobrist_hash()
+    assert game.get_possible_actions() == replayed.get_possible_actions()
+
+@pytest.mark.parametrize('checkpoint_interval', [1, 2, 5])
+@pytest.mark.parametrize('draw_count', [1, 3])
+@pytest.mark.parametrize('seed', range(15))
+def test_seek_undo_redo_match_replay(seed: int, draw_count: int, checkpoint_interval: int):
+    rng = random.Random(seed)
+    game = Game.create(seed, draw_count, checkpoint_interval)
+    for _ in range(400):
+        history = game.history
+        roll = rng.random()
+        if roll < 0.15:
+            game.seek(rng.randint(0, history.end))
+        elif roll < 0.3:
+            game.undo()
+        elif roll < 0.45:
+            nothing_to_redo = history.length == history.end
+            assert (game.redo() is None) == nothing_to_redo
+        elif roll < 0.5:
+            game = game.fork()
+        else:
+            actions = game.get_possible_actions()
+            if not actions:
+                break
+            game.run_action(rng.choice(actions))
+            assert game.history.end == game.history.length
+        assert_matches_replay(game)
+
+@pytest.mark.parametrize('seed', range(5))
+def test_seek_after_checkpoints_are_thinned(seed: int):
+    rng = random.Random(seed)
+    game = Game.create(seed, 1, 1)
+    while game.history.length < 600:
+        actions = game.get_possible_actions()
+        if not actions:
+            break
+        game.run_action(rng.choice(actions))
+    # more snapshots than MAX_CHECKPOINTS doubles the interval
+    assert game.history.checkpoint_interval > 1
+    for _ in range(50):
+        game.seek(rng.randint(0, game.history.end))
+        assert_matches_replay(game)
+
+def test_seek_out_of_range():
+    game = Game.create(0)
+    game.run_action(game.get_possible_actions()[0])
+    with pytest.raises(ValueError):
+        game.seek(2)
+    with pytest.raises(ValueError):
+        game.seek(-1)
@@ -0,0 +1,50 @@
+import random
+from klondike import instrument
+from klondike.game import Game
+
+METHODS = ('run_action', 'get_possible_actions', 'iter_actions', 'undo', 'sha256_hash')
+
+def playouts(count: int = 20, length: int = 200):
+    rng = random.Random(0)
+    for seed in range(count):
+        game = Game.create(seed)
+        for _ in range(length):
+            actions = game.get_possible_actions()
+            if not actions:
+                break
+            game.run_action(rng.choice(actions))
+        game.undo()
+        game.sha256_hash()
+
+def test_disabled_restores_original_methods():
+    originals = {name: Game.__dict__[name] for name in METHODS}
+    with instrument.instrumented():
+        assert all(Game.__dict__[name] is not originals[name] for name in METHODS)
+    assert not instrument.is_enabled()
+    assert all(Game.__dict__[name] is originals[name] for name in METHODS)
+
+def test_nothing_left_when_disabled():
+    before = dict(Game.__dict__)
+    with instrument.instrumented():
+        instrument.enable()
+    assert dict(Game.__dict__) == before
+    # the original methods run, which count nothing
+    instrument.reset()
+    playouts(count=2, length=10)
+    snapshot = instrument.snapshot()
+    assert snapshot['get_possible_actions']['calls'] == 0
+    assert snapshot['undo']['calls'] == 0
+
+def test_counters():
+    instrument.reset()
+    events = []
+    with instrument.instrumented(lambda event, seconds: events.append(event)):
+        playouts(count=2, length=10)
+    snapshot = instrument.snapshot()
+    assert snapshot['get_possible_actions']['calls'] == 20
+    assert sum(counter['calls'] for counter in snapshot['run_action'].values()) == 20
+    assert snapshot['undo']['calls'] == 2
+    assert snapshot['sha256_hash']['calls'] == 2
+    assert len(events) == 44
+    instrument.reset()
+    assert instrument.snapshot()['undo']['calls'] == 0
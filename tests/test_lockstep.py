@@ -0,0 +1,12 @@
+import pytest
+pytest.importorskip('numpy')
+from klondike import lockstep
+
+@pytest.mark.parametrize('draw_count', [1, 3])
+def test_lockstep_matches_game(draw_count: int):
+    seeds = list(range(20))
+    assert lockstep.cross_check(seeds, 300, seed=draw_count, draw_count=draw_count) > 0
+
+@pytest.mark.parametrize('seed', range(3))
+def test_lockstep_matches_game_with_different_random_plays(seed: int):
+    assert lockstep.cross_check(range(100, 110), 200, seed=seed) > 0
@@ -0,0 +1,75 @@
+import random
+from typing import Set
+import pytest
+from klondike.actions import (
+    MoveFromWasteToFoundationAction,
+    MoveFromWasteToPileAction,
+    draw_action,
+)
+from klondike.game import Game
+
+def _is_waste_play(action) -> bool:
+    return isinstance(action, (MoveFromWasteToPileAction, MoveFromWasteToFoundationAction))
+
+def _key(game: Game, draw_count: int) -> bytes:
+    if draw_count == 3:
+        return game.sha256_hash()
+    # with draw 1 every card of the stock can be reached from any point of
+    # it, so only the order of the stock matters, not how far it was drawn
+    stock = bytearray(game.waste.codes) + game.deck.codes[::-1]
+    return b'|'.join(
+        [bytes(stock), bytes(f.height for f in game.foundations)]
+        + [bytes([pile.revealed_count]) + pile.codes for pile in game.piles]
+    )
+
+def exhaustive_waste_plays(game: Game) -> Set[bytes]:
+    """
+    States after every play of the waste top after drawing 0 or more times,
+    until the stock has been through all of its states twice.
+    """
+    states = set()
+    stock = game.fork()
+    stock.auto_play = False
+    for _ in range(2 * (len(game.deck.codes) + len(game.waste.codes)) + 2):
+        for action in stock.get_possible_actions():
+            if _is_waste_play(action):
+                played = stock.fork()
+                played.run_action(action)
+                states.add(_key(played, game.draw_count))
+        if not stock.deck.codes and not stock.waste.codes:
+            break
+        stock.run_action(draw_action(game.draw_count))
+    return states
+
+def macro_waste_plays(game: Game) -> Set[bytes]:
+    states = set()
+    actions = [a for a in game.get_possible_actions() if _is_waste_play(a)] + game.get_macro_actions()
+    for action in actions:
+        played = game.fork()
+        played.auto_play = False
+        played.run_action(action)
+        states.add(_key(played, game.draw_count))
+    return states
+
+@pytest.mark.parametrize('draw_count', [1, 3])
+@pytest.mark.parametrize('seed', range(40))
+def test_macros_cover_draw_then_play(seed: int, draw_count: int):
+    rng = random.Random(seed)
+    game = Game.create(seed, draw_count)
+    for step in range(120):
+        if step % 10 == 0:
+            assert macro_waste_plays(game) == exhaustive_waste_plays(game)
+        actions = game.get_possible_actions()
+        if not actions:
+            break
+        game.run_action(rng.choice(actions))
+
+@pytest.mark.parametrize('draw_count', [1, 3])
+def test_macros_undo_in_one_step(draw_count: int):
+    game = Game.create(3, draw_count)
+    state = game.sha256_hash()
+    for action in game.get_macro_actions():
+        game.run_action(action)
+        assert game.history.primitive_actions() == action.expand()
+        game.undo()
+        assert game.sha256_hash() == state
@@ -0,0 +1,72 @@
+import random
+import pytest
+from klondike.cards import (
+    CARDS,
+    Suit,
+)
+from klondike.game import Game
+
+def assert_follows(game: Game, observation, piles):
+    assert observation.deck_size == len(game.deck.codes)
+    assert observation.waste_size == len(game.waste.codes)
+    waste_codes = game.waste.codes
+    assert observation.waste_top is (CARDS[waste_codes[-1]] if waste_codes else None)
+    for foundation in game.foundations:
+        assert observation.foundation_height(foundation.suit) == foundation.height
+        top = CARDS[foundation.top_code] if foundation.height else None
+        assert observation.foundation_top(foundation.suit) is top
+    assert observation.moves == game.history.length
+    assert observation.draw_count == game.draw_count
+    assert observation.is_won() == game.is_won()
+    for view, pile in zip(piles, game.piles):
+        codes = pile.codes
+        face_up = [CARDS[code] for code in codes[len(codes) - pile.revealed_count:]]
+        assert view.hidden_count == len(codes) - pile.revealed_count
+        assert len(view) == len(face_up)
+        assert list(view) == face_up
+        assert view[:] == face_up
+        assert view[-100:] == face_up
+        assert view.top is (CARDS[codes[-1]] if codes else None)
+        for i in range(-len(face_up), len(face_up)):
+            assert view[i] is face_up[i]
+        # the face-down cards can't be reached
+        for i in (len(face_up), -len(face_up) - 1):
+            with pytest.raises(IndexError):
+                view[i]
+
+@pytest.mark.parametrize('draw_count', [1, 3])
+@pytest.mark.parametrize('seed', range(10))
+def test_views_follow_game(seed: int, draw_count: int):
+    rng = random.Random(seed)
+    game = Game.create(seed, draw_count)
+    observation = game.observation
+    piles = observation.piles
+    for _ in range(200):
+        assert game.observation is observation
+        assert_follows(game, observation, piles)
+        actions = game.get_possible_actions()
+        if not actions:
+            break
+        roll = rng.random()
+        if game.history.length and roll < 0.2:
+            game.undo()
+        elif roll < 0.25:
+            game.seek(rng.randint(0, game.history.end))
+        elif roll < 0.3:
+            fork = game.fork()
+            fork_observation = fork.observation
+            assert fork_observation is not observation
+            fork.run_action(rng.choice(actions))
+            # the fork's views follow the fork, the game's stay with the game
+            assert_follows(fork, fork_observation, fork_observation.piles)
+            assert_follows(game, observation, piles)
+        else:
+            game.run_action(rng.choice(actions))
+
+def test_empty_views():
+    game = Game.create(0)
+    observation = game.observation
+    assert observation.waste_top is None
+    assert all(observation.foundation_top(suit) is None for suit in Suit)
+    assert [view.hidden_count for view in observation.piles] == list(range(7))
+    assert [len(view) for view in observation.piles] == [1] * 7
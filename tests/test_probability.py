@@ -0,0 +1,59 @@
+import concurrent.futures
+import random
+import pytest
+from klondike.actions import (
+    AutoPlayAction,
+    draw_action,
+)
+from klondike.game import Game
+from klondike.probability import (
+    deck_is_known,
+    estimate_win_probability,
+    sample_game,
+)
+
+def test_deck_is_known_after_recycling():
+    game = Game.create(0)
+    for _ in range(len(game.deck.codes)):
+        game.run_action(draw_action(1))
+    assert not deck_is_known(game)
+    game.run_action(draw_action(1))
+    assert deck_is_known(game)
+    game.undo()
+    assert not deck_is_known(game)
+
+def test_deck_is_known_after_recycling_in_macro_action():
+    game = Game.create(0)
+    draws = (draw_action(1),) * (len(game.deck.codes) + 1)
+    game.run_action(AutoPlayAction(actions=draws))
+    assert deck_is_known(game)
+    # the known deck is kept in samples
+    sample = sample_game(game, random.Random(0))
+    assert sample.deck.codes == game.deck.codes
+
+@pytest.mark.parametrize('draw_count', [1, 3])
+@pytest.mark.parametrize('seed', range(20))
+def test_samples_have_same_actions(seed: int, draw_count: int):
+    # the hidden cards don't change which actions are legal
+    rng = random.Random(seed)
+    game = Game.create(seed, draw_count)
+    for _ in range(200):
+        actions = game.get_possible_actions()
+        sample = sample_game(game, rng)
+        assert sample.get_possible_actions() == actions
+        assert [len(p.codes) for p in sample.piles] == [len(p.codes) for p in game.piles]
+        if not actions:
+            break
+        game.run_action(rng.choice(actions))
+
+def test_estimate_on_executor_matches_in_process():
+    game = Game.create(3)
+    rng = random.Random(3)
+    for _ in range(20):
+        game.run_action(rng.choice(game.get_possible_actions()))
+    expected = estimate_win_probability(game, samples=8, deadline=60.0, max_nodes=200, seed=0)
+    with concurrent.futures.ThreadPoolExecutor(2) as executor:
+        result = estimate_win_probability(game, samples=8, deadline=60.0, max_nodes=200, executor=executor, seed=0)
+    # the workers replay the game from its seed and actions
+    assert expected.samples == 8
+    assert (result.wins, result.samples) == (expected.wins, expected.samples)
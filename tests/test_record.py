@@ -0,0 +1,165 @@
+import os
+import random
+import pytest
+from klondike.actions import (
+    ACTIONS,
+    DrawFromDeckAction,
+    draw_action,
+)
+from klondike.game import Game
+from klondike.record import (
+    MAGIC,
+    VERSION,
+    ActionCodec,
+    Record,
+    RecordWriter,
+    decode_varint,
+    encode_varint,
+    iter_record_bytes,
+    iter_records,
+    read_version,
+    write_records,
+)
+
+def random_game(seed: int, length: int, draw_count: int = 1) -> Game:
+    rng = random.Random(seed)
+    game = Game.create(seed, draw_count)
+    for _ in range(length):
+        actions = game.get_possible_actions()
+        if not actions:
+            break
+        game.run_action(rng.choice(actions))
+    return game
+
+@pytest.mark.parametrize('value', [0, 1, 127, 128, 300, 2 ** 32, 2 ** 63 - 1])
+def test_varint_round_trip(value: int):
+    data = b'x' + encode_varint(value) + b'y'
+    assert decode_varint(data, 1) == (value, len(data) - 1)
+
+def test_every_action_round_trips():
+    actions = [a for a in ACTIONS if not isinstance(a, DrawFromDeckAction)] + [draw_action(1)]
+    data = ActionCodec.encode_all(actions)
+    assert list(ActionCodec.decode_all(data)) == actions
+
+def test_invalid_code():
+    with pytest.raises(ValueError):
+        ActionCodec.decode(bytes([255]), 0)
+
+def test_file_round_trip(tmp_path):
+    games = [random_game(seed, 200) for seed in range(50)]
+    path = os.path.join(tmp_path, 'games.kdr')
+    write_records(path, [Record.from_game(game) for game in games[:25]])
+    # appending doesn't write another header
+    with RecordWriter(open(path, 'ab')) as writer:
+        for game in games[25:]:
+            writer.write_game(game)
+    records = list(iter_records(path))
+    assert len(records) == len(games)
+    for record, game in zip(records, games):
+        assert record.seed == game.seed
+        assert list(record.actions()) == game.history.primitive_actions()
+        assert record.replay().sha256_hash() == game.sha256_hash()
+    with open(path, 'rb') as f:
+        assert [r.payload for r in iter_record_bytes(f.read())] == [r.payload for r in records]
+
+def test_not_a_record_file():
+    with pytest.raises(ValueError):
+        list(iter_record_bytes(b'nope\x01'))
+
+def test_draw_three_round_trip(tmp_path):
+    games = [random_game(seed, 200, draw_count=3) for seed in range(10)]
+    path = os.path.join(tmp_path, 'games.kdr')
+    write_records(path, [Record.from_game(game) for game in games])
+    assert read_version(path) == VERSION
+    for record, game in zip(iter_records(path), games):
+        assert record.draw_count == 3
+        assert record.replay().sha256_hash() == game.sha256_hash()
+
+def test_version_1_files(tmp_path):
+    path = os.path.join(tmp_path, 'games.kdr')
+    game = random_game(0, 100)
+    with open(path, 'wb') as f:
+        f.write(MAGIC + bytes([1]) + Record.from_game(game).to_bytes(1))
+    assert read_version(path) == 1
+    # draw 1 games are the same in both versions
+    write_records(path, [Record.from_game(random_game(1, 100))])
+    records = list(iter_records(path))
+    assert [r.version for r in records] == [1, 1]
+    assert records[0].replay().sha256_hash() == game.sha256_hash()
+    # version 1 has no code for drawing 3
+    with pytest.raises(ValueError):
+        write_records(path, [Record.from_game(random_game(2, 100, draw_count=3))])
+    with pytest.raises(ValueError):
+        list(ActionCodec.decode_all(bytes([ActionCodec.DRAW_THREE]), version=1))
+
+def undrawn_game(seed: int, draw_count: int) -> Game:
+    """
+    A game that makes some moves but never draws from the deck.
+    """
+    game = Game.create(seed, draw_count)
+    while True:
+        actions = [a for a in game.get_possible_actions() if not isinstance(a, DrawFromDeckAction)]
+        if not actions or len(game.history.actions) >= 3:
+            return game
+        game.run_action(actions[0])
+
+def test_draw_count_without_draws(tmp_path):
+    path = os.path.join(tmp_path, 'games.kdr')
+    games = [undrawn_game(seed, draw_count) for seed in range(5) for draw_count in (1, 3)]
+    write_records(path, [Record.from_game(game) for game in games])
+    records = list(iter_records(path))
+    assert [r.draw_count for r in records] == [g.draw_count for g in games]
+    for record, game in zip(records, games):
+        assert record.replay().sha256_hash() == game.sha256_hash()
+        assert record.replay().draw_count == game.draw_count
+
+def test_version_2_files(tmp_path):
+    path = os.path.join(tmp_path, 'games.kdr')
+    games = [random_game(0, 100), random_game(1, 100, draw_count=3)]
+    with open(path, 'wb') as f:
+        f.write(MAGIC + bytes([2]) + b''.join(Record.from_game(game).to_bytes(2) for game in games))
+    # the draw count is read back from the draw actions
+    write_records(path, [Record.from_game(undrawn_game(2, 1))])
+    records = list(iter_records(path))
+    assert [r.version for r in records] == [2, 2, 2]
+    assert [r.draw_count for r in records] == [1, 3, 1]
+    for record, game in zip(records, games):
+        assert record.replay().sha256_hash() == game.sha256_hash()
+    # so a draw 3 game that never draws can't be written to it
+    with pytest.raises(ValueError):
+        write_records(path, [Record.from_game(undrawn_game(3, 3))])
+    assert len(list(iter_records(path))) == 3
+
+def test_invalid_draw_count():
+    data = MAGIC + bytes([VERSION]) + Record(0, b'', draw_count=2).to_bytes()
+    with pytest.raises(ValueError):
+        list(iter_record_bytes(data))
+
+def test_unsupported_version():
+    with pytest.raises(ValueError):
+        list(iter_record_bytes(MAGIC + bytes([VERSION + 1])))
+
+def test_writer_keeps_version_of_file(tmp_path):
+    path = os.path.join(tmp_path, 'games.kdr')
+    with open(path, 'wb') as f:
+        f.write(MAGIC + bytes([1]))
+    with RecordWriter(open(path, 'ab')) as writer:
+        assert writer.version == 1
+        writer.write_game(random_game(0, 100))
+        with pytest.raises(ValueError):
+            writer.write_game(random_game(2, 100, draw_count=3))
+    with pytest.raises(ValueError):
+        RecordWriter(open(path, 'ab'), VERSION)
+    assert [r.version for r in iter_records(path)] == [1]
+    with open(tmp_path / 'other.kdr', 'wb') as f:
+        f.write(b'nope\x01')
+    with pytest.raises(ValueError):
+        RecordWriter(open(tmp_path / 'other.kdr', 'ab'))
+
+def test_writer_reads_version_from_readable_file(tmp_path):
+    path = os.path.join(tmp_path, 'games.kdr')
+    with open(path, 'wb') as f:
+        f.write(MAGIC + bytes([1]))
+    with open(path, 'r+b') as f:
+        f.seek(0, os.SEEK_END)
+        assert RecordWriter(f).version == 1
@@ -0,0 +1,53 @@
+import asyncio
+import pytest
+from klondike.server import Server
+
+def request(server: Server, **fields) -> dict:
+    return asyncio.run(server.handle_request(fields))
+
+def test_play_session():
+    server = Server()
+    created = request(server, id=1, op='create', seed=5)
+    assert created['ok'] and created['id'] == 1
+    session = created['session']
+    actions = request(server, op='actions', session=session)['actions']
+    acted = request(server, op='act', session=session, action=len(actions) - 1)
+    assert acted['ok'] and acted['state']['moves'] == 1
+    assert request(server, op='undo', session=session)['state']['moves'] == 0
+    assert request(server, op='close', session=session)['ok']
+    assert not request(server, op='actions', session=session)['ok']
+
+@pytest.mark.parametrize('op', [None, 1, ['create'], {'op': 'create'}, 'nope'])
+def test_invalid_op(op):
+    response = request(Server(), id=7, op=op)
+    assert response == {'id': 7, 'ok': False, 'error': response['error']}
+
+@pytest.mark.parametrize('draw_count', [1.0, True, 2, '1', None])
+def test_invalid_draw_count(draw_count):
+    response = request(Server(), op='create', seed=1, draw_count=draw_count)
+    assert not response['ok']
+
+def test_internal_error_is_a_response():
+    server = Server()
+    def fail(request):
+        raise TypeError('broken')
+    server._handlers['create'] = fail
+    response = request(server, id=3, op='create')
+    assert response == {'id': 3, 'ok': False, 'error': 'Internal error: TypeError: broken'}
+    assert request(server, op='stats')['ok']
+
+def test_hint_of_changed_game():
+    server = Server(hint_nodes=500, hint_time=5.0)
+
+    async def run():
+        session = (await server.handle_request({'op': 'create', 'seed': 5}))['session']
+        await server.handle_request({'op': 'act', 'session': session, 'action': 0})
+        hint = asyncio.create_task(server.handle_request({'op': 'hint', 'session': session}))
+        # let the hint start solving, then play another action instead
+        await asyncio.sleep(0)
+        await server.handle_request({'op': 'undo', 'session': session})
+        await server.handle_request({'op': 'act', 'session': session, 'action': 1})
+        return await hint
+
+    response = asyncio.run(run())
+    assert response == {'id': None, 'ok': False, 'error': 'Game changed while solving'}
@@ -0,0 +1,67 @@
+import pytest
+from klondike.game import Game
+from klondike.solver import (
+    SolveStatus,
+    Solver,
+)
+
+# deals that the default solver decides within a few hundred nodes
+SOLVABLE = [(0, 1), (2, 3), (4, 1), (7, 1)]
+UNSOLVABLE = [(4, 3)]
+# a deal that takes more than 200000 nodes
+HARD = (1, 1)
+
+OPTIONS = [
+    {},
+    {'prune_dead_ends': False},
+    {'use_macros': True},
+    {'symmetry': True},
+    {'auto_play': True},
+]
+
+@pytest.mark.parametrize('options', OPTIONS)
+@pytest.mark.parametrize('seed, draw_count', SOLVABLE)
+def test_solved(seed: int, draw_count: int, options: dict):
+    game = Game.create(seed, draw_count)
+    state = game.sha256_hash()
+    result = Solver(max_nodes=50000, **options).solve(game)
+    assert result.status is SolveStatus.SOLVED
+    # the game is left as it was, and the solution wins it
+    assert game.sha256_hash() == state
+    assert game.history.length == 0
+    assert Game.replay(seed, result.actions, draw_count).is_won()
+
+@pytest.mark.parametrize('options', OPTIONS)
+@pytest.mark.parametrize('seed, draw_count', UNSOLVABLE)
+def test_unsolvable(seed: int, draw_count: int, options: dict):
+    game = Game.create(seed, draw_count)
+    result = Solver(max_nodes=50000, **options).solve(game)
+    assert result.status is SolveStatus.UNSOLVABLE
+    assert result.actions is None
+    assert game.history.length == 0
+
+def test_won_game_is_solved():
+    game = Game.create(0)
+    result = Solver().solve(game)
+    game = Game.replay(0, result.actions)
+    result = Solver().solve(game)
+    assert result.status is SolveStatus.SOLVED
+    assert result.actions == []
+
+def test_node_limit():
+    result = Solver(max_nodes=100).solve(Game.create(*HARD))
+    assert result.status is SolveStatus.NODE_LIMIT
+    assert result.nodes == 100
+    assert result.actions is None
+
+def test_time_limit():
+    game = Game.create(*HARD)
+    result = Solver(time_limit=0.0, time_check_interval=1).solve(game)
+    assert result.status is SolveStatus.TIME_LIMIT
+    assert result.nodes == 1
+    assert game.history.length == 0
+
+def test_memory_limit():
+    result = Solver(max_states=50).solve(Game.create(*HARD))
+    assert result.status is SolveStatus.MEMORY_LIMIT
+    assert result.nodes < 50
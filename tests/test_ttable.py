@@ -0,0 +1,167 @@
+import pickle
+import pytest
+from klondike import solver
+from klondike.game import Game
+from klondike.solver import (
+    SolveStatus,
+    Solver,
+)
+from klondike.ttable import (
+    ALWAYS_REPLACE,
+    BUCKET_SIZE,
+    DEPTH_PREFERRED,
+    LOST,
+    MAX_DEPTH,
+    WON,
+    Entry,
+    TranspositionTable,
+)
+
+def bucket_keys(table: TranspositionTable, count: int, bucket: int = 5):
+    # keys that differ only above the bits that select the bucket
+    return [(i + 1) << 40 | bucket for i in range(count)]
+
+def test_store_and_probe(tmp_path):
+    with TranspositionTable.create(str(tmp_path / 'table'), 100) as table:
+        assert table.capacity == 128
+        assert table.probe(12345) is None
+        table.store(12345, WON, 7, 30)
+        table.store(678, LOST, MAX_DEPTH + 1)
+        assert table.probe(12345) == Entry(WON, 7, 30)
+        assert table.probe(678) == Entry(LOST, MAX_DEPTH, 0)
+        # a known entry isn't replaced by one with less work behind it
+        table.store(12345, WON, 3, 10)
+        assert table.probe(12345) == Entry(WON, 7, 30)
+        table.store(12345, LOST, 1)
+        assert table.probe(12345) == Entry(LOST, 1, 0)
+        assert table.occupancy() == 2
+        stats = table.stats()
+        assert (stats['hits'], stats['misses'], stats['stores']) == (4, 1, 3)
+
+def test_depth_preferred_replacement(tmp_path):
+    with TranspositionTable.create(str(tmp_path / 'table'), 64, DEPTH_PREFERRED) as table:
+        keys = bucket_keys(table, BUCKET_SIZE + 2)
+        for depth, key in enumerate(keys[:BUCKET_SIZE], 10):
+            table.store(key, LOST, depth)
+        # shallower than everything in the full bucket
+        table.store(keys[BUCKET_SIZE], LOST, 5)
+        assert table.probe(keys[BUCKET_SIZE]) is None
+        assert table.stats()['rejected'] == 1
+        # replaces the shallowest entry
+        table.store(keys[BUCKET_SIZE + 1], LOST, 20)
+        assert table.probe(keys[BUCKET_SIZE + 1]) == Entry(LOST, 20, 0)
+        assert table.probe(keys[0]) is None
+        assert all(table.probe(key) is not None for key in keys[1:BUCKET_SIZE])
+        assert table.stats()['collisions'] == 1
+
+def test_always_replace(tmp_path):
+    with TranspositionTable.create(str(tmp_path / 'table'), 64, ALWAYS_REPLACE) as table:
+        keys = bucket_keys(table, BUCKET_SIZE + 1)
+        for depth, key in enumerate(keys[:BUCKET_SIZE], 10):
+            table.store(key, LOST, depth)
+        table.store(keys[BUCKET_SIZE], LOST, 0)
+        assert table.probe(keys[BUCKET_SIZE]) == Entry(LOST, 0, 0)
+        assert table.probe(keys[0]) is None
+
+def test_entries_persist(tmp_path):
+    path = str(tmp_path / 'table')
+    with TranspositionTable.create(path, 1000) as table:
+        table.store(42, WON, 9, 12)
+        # what a worker process gets, which maps the same file
+        copy = pickle.loads(pickle.dumps(table))
+        copy.store(43, LOST, 1)
+        assert table.probe(43) == Entry(LOST, 1, 0)
+        copy.close()
+    with TranspositionTable.open(path) as table:
+        assert table.probe(42) == Entry(WON, 9, 12)
+        assert table.probe(43) == Entry(LOST, 1, 0)
+    with pytest.raises(FileExistsError):
+        TranspositionTable.create(path)
+
+def test_invalid_tables(tmp_path):
+    path = tmp_path / 'other'
+    path.write_bytes(b'not a table' * 10)
+    with pytest.raises(ValueError):
+        TranspositionTable.open(str(path))
+    with pytest.raises(ValueError):
+        TranspositionTable.create(str(tmp_path / 'table'), 64, 'sometimes')
+
+def test_torn_slot_is_a_miss(tmp_path):
+    with TranspositionTable.create(str(tmp_path / 'table'), 64) as table:
+        table.store(5, LOST, 3)
+        offset = table._bucket_offset(5)
+        # as if another process wrote half of the slot
+        table._data[offset] ^= 1
+        assert table.probe(5) is None
+
+DEALS = [(seed, draw_count) for seed in range(8) for draw_count in (1, 3)]
+
+def test_solver_results_agree_with_table(tmp_path):
+    decided = (SolveStatus.SOLVED, SolveStatus.UNSOLVABLE)
+    plain = {deal: Solver(max_nodes=2000).solve(Game.create(*deal)).status for deal in DEALS}
+    assert sum(status in decided for status in plain.values()) >= 6
+    with TranspositionTable.create(str(tmp_path / 'table'), 1 << 16) as table:
+        # twice, the second time with what the first stored
+        for _ in range(2):
+            for seed, draw_count in DEALS:
+                result = Solver(max_nodes=2000, table=table).solve(Game.create(seed, draw_count))
+                if plain[seed, draw_count] in decided and result.status in decided:
+                    assert result.status is plain[seed, draw_count], (seed, draw_count)
+                if result.solved:
+                    assert Game.replay(seed, result.actions, draw_count).is_won()
+        assert table.stats()['hits'] > 0
+
+def test_unsolvable_deal_is_stored_lost(tmp_path):
+    with TranspositionTable.create(str(tmp_path / 'table'), 1 << 16) as table:
+        game = Game.create(4, 3)
+        assert Solver(table=table).solve(game).status is SolveStatus.UNSOLVABLE
+        result = Solver(table=table).solve(game)
+        assert result.status is SolveStatus.UNSOLVABLE
+        assert (result.nodes, result.pruned) == (0, 1)
+
+def test_loss_proofs_are_sound(tmp_path, monkeypatch):
+    proven = []
+    store_lost = solver._LossProofs.store_lost
+
+    def record(self, state_hash: int, depth: int = 0):
+        proven.append(state_hash)
+        store_lost(self, state_hash, depth)
+
+    monkeypatch.setattr(solver._LossProofs, 'store_lost', record)
+    positions = {}
+
+    def visit(game: Game):
+        positions.setdefault(game.zobrist_hash(), game.fork())
+
+    with TranspositionTable.create(str(tmp_path / 'table'), 1 << 16) as table:
+        for seed, draw_count in DEALS:
+            game = Game.create(seed, draw_count)
+            # searched with the node limit, which leaves groups unproven
+            Solver(max_nodes=1500, table=table, prune_dead_ends=False).solve(game)
+            # the positions of the search, to look the proven states up in
+            rescan = Solver(max_nodes=1500, prune_dead_ends=False)
+            original = rescan.ordered_actions
+            monkeypatch.setattr(rescan, 'ordered_actions', lambda game: visit(game) or original(game))
+            rescan.solve(game)
+    lost = [positions[state_hash] for state_hash in proven if state_hash in positions]
+    assert len(lost) > 50
+    for game in lost[::max(1, len(lost) // 50)]:
+        result = Solver(max_nodes=5000).solve(game)
+        assert result.status is not SolveStatus.SOLVED
+
+def test_pending_states_are_stored_with_depth(tmp_path):
+    with TranspositionTable.create(str(tmp_path / 'table'), 64) as table:
+        keys = bucket_keys(table, BUCKET_SIZE + 2)
+        for key in keys[2:]:
+            table.store(key, WON, 5)
+        proofs = solver._LossProofs(table, 0)
+        # state 0 moves to state 1, which only moves back to state 0
+        proofs.enter(keys[0], 0)
+        proofs.enter(keys[1], 1)
+        proofs.revisit(keys[0])
+        proofs.leave(keys[1], 10)
+        assert table.probe(keys[1]) is None
+        proofs.leave(keys[0], 10)
+        # both lost, and deep enough to replace entries of the full bucket
+        assert table.probe(keys[0]) == Entry(LOST, 10, 0)
+        assert table.probe(keys[1]) == Entry(LOST, 10, 0)
@@ -0,0 +1,100 @@
+import io
+import random
+import re
+from typing import Dict
+import pytest
+from klondike.game import Game
+from klondike.ui import (
+    RESET_COLORS,
+    SCREEN_COLORS,
+    TerminalRenderer,
+    render_deck,
+    render_foundation,
+    render_piles,
+    render_waste,
+    watch,
+)
+
+CSI = re.compile(r'\033\[([0-9;]*)([A-Za-z])')
+
+class Screen:
+    """
+    The lines of a terminal that the renderer's escape codes are applied
+    to. Colors are kept in the text.
+    """
+    def __init__(self):
+        self.lines: Dict[int, str] = {}
+        self.row = 1
+
+    def write(self, text: str):
+        position = 0
+        for match in CSI.finditer(text):
+            self._put(text[position:match.start()])
+            params, command = match.groups()
+            if command == 'H':
+                self.row = int(params.split(';')[0]) if params else 1
+            elif command == 'J':
+                self.lines.clear()
+            elif command == 'K':
+                self.lines.pop(self.row, None)
+            elif command == 'm':
+                self._put(match.group())
+            else:
+                raise AssertionError(f'Unexpected escape code {match.group()!r}')
+            position = match.end()
+        self._put(text[position:])
+
+    def _put(self, text: str):
+        if text:
+            self.lines[self.row] = self.lines.get(self.row, '') + text
+
+def expected_lines(game: Game):
+    """
+    The frame of `game` from the pieces of render_game(), in the layout of
+    TerminalRenderer: the Zobrist hash and the foundations above the piles.
+    """
+    piles = render_piles(game.piles)
+    lines = [
+        f'{game.zobrist_hash():016x}',
+        f'{render_deck(game.deck)} | {render_waste(game.waste)} | {game.history.length}',
+        ' | '.join(render_foundation(f) for f in game.foundations),
+    ]
+    lines += piles.split('\n') if piles else []
+    return {i + 1: SCREEN_COLORS + line + RESET_COLORS for i, line in enumerate(lines)}
+
+@pytest.mark.parametrize('draw_count', [1, 3])
+@pytest.mark.parametrize('seed', range(5))
+def test_frames_match_render_game(seed: int, draw_count: int):
+    rng = random.Random(seed)
+    game = Game.create(seed, draw_count)
+    renderer = TerminalRenderer()
+    screen = Screen()
+    for step in range(300):
+        screen.write(renderer.render(game))
+        assert screen.lines == expected_lines(game)
+        actions = game.get_possible_actions()
+        if not actions:
+            break
+        if game.history.length and rng.random() < 0.2:
+            game.undo()
+        elif rng.random() < 0.02:
+            # drawn again in full after other output
+            renderer.reset()
+            screen.write('other output\n')
+        else:
+            game.run_action(rng.choice(actions))
+
+def test_unchanged_frame_writes_nothing():
+    game = Game.create(0)
+    renderer = TerminalRenderer()
+    renderer.render(game)
+    assert renderer.render(game) == ''
+
+def test_watch():
+    output = io.StringIO()
+    game = Game.create(0)
+    actions = game.get_possible_actions()[:1]
+    watch(game, actions, fps=1000.0, output=output)
+    screen = Screen()
+    screen.write(output.getvalue())
+    assert screen.lines == expected_lines(game)
@@ -0,0 +1,33 @@
+import random
+import pytest
+from klondike.game import Game
+
+def random_actions(game: Game, rng: random.Random, length: int):
+    for _ in range(length):
+        actions = game.get_possible_actions()
+        if not actions:
+            break
+        game.run_action(rng.choice(actions))
+
+@pytest.mark.parametrize('draw_count', [1, 3])
+@pytest.mark.parametrize('seed', range(20))
+def test_undo_matches_replay(seed: int, draw_count: int):
+    rng = random.Random(seed)
+    game = Game.create(seed, draw_count)
+    random_actions(game, rng, 150)
+    while game.history.length:
+        # undo a few at a time, with some new actions in between
+        for _ in range(rng.randint(1, 5)):
+            game.undo()
+        replayed = Game.replay(seed, game.history.actions, draw_count)
+        assert game.sha256_hash() == replayed.sha256_hash()
+        assert game.zobrist_hash() == replayed.zobrist_hash()
+        assert game.get_possible_actions() == replayed.get_possible_actions()
+        if rng.random() < 0.2:
+            random_actions(game, rng, 3)
+
+def test_undo_of_empty_history():
+    game = Game.create(0)
+    expected = game.sha256_hash()
+    game.undo()
+    assert game.sha256_hash() == expected
@@ -0,0 +1,36 @@
+import random
+import pytest
+from klondike import zobrist
+from klondike.game import Game
+
+@pytest.mark.parametrize('draw_count', [1, 3])
+@pytest.mark.parametrize('seed', range(20))
+def test_incremental_hash_matches_recomputation(seed: int, draw_count: int):
+    rng = random.Random(seed)
+    game = Game.create(seed, draw_count)
+    assert game.zobrist_hash() == zobrist.compute_hash(game)
+    for _ in range(300):
+        actions = game.get_possible_actions()
+        if not actions:
+            break
+        if game.history.length and rng.random() < 0.2:
+            game.undo()
+        elif rng.random() < 0.05:
+            game = game.fork()
+        else:
+            game.run_action(rng.choice(actions))
+        assert game.zobrist_hash() == zobrist.compute_hash(game)
+
+@pytest.mark.parametrize('seed', range(10))
+def test_equal_states_have_equal_hashes(seed: int):
+    rng = random.Random(seed)
+    game = Game.create(seed)
+    hashes = {}
+    for _ in range(300):
+        actions = game.get_possible_actions()
+        if not actions:
+            break
+        game.run_action(rng.choice(actions))
+        # drawing through the whole stock comes back to the same states
+        state = game.sha256_hash()
+        assert hashes.setdefault(state, game.zobrist_hash()) == game.zobrist_hash()